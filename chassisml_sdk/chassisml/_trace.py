@@ -0,0 +1,90 @@
+# Kept apart from the other utilities, without imports of the rest of the SDK, so that
+# `tests/test_trace_payload.py` can load it on its own
+import json
+import time
+import secrets
+import warnings
+import requests
+from contextlib import contextmanager
+
+class Trace:
+    '''
+    Spans of one publish, starting with the root span `name` until `finish` is called. The trace is continued by the
+    Chassis service through the W3C `traceparent` header of the upload, so that the build job and its webhook carry it on.
+
+    Attributes:
+    trace_id (str): Id of the trace
+    spans (list): Recorded spans
+    version (str): Version of the SDK, reported as `service.version`
+    '''
+    def __init__(self, name, version):
+        self.trace_id = secrets.token_hex(16)
+        self.version = version
+        self.spans = []
+        self._open = []
+        self._root = self.span(name)
+        self._root.__enter__()
+
+    @contextmanager
+    def span(self, name):
+        '''
+        Records the enclosed block as span `name`, child of the innermost open span.
+        '''
+        span = {'name': name, 'span_id': secrets.token_hex(8), 'parent_id': self._open[-1]['span_id'] if self._open else '',
+                'start': int(time.time() * 1e9), 'end': None}
+        self.spans.append(span)
+        self._open.append(span)
+        try:
+            yield span
+        finally:
+            span['end'] = int(time.time() * 1e9)
+            self._open.pop()
+
+    def traceparent(self):
+        '''
+        Returns the `traceparent` header value of the innermost open span.
+        '''
+        return f'00-{self.trace_id}-{self._open[-1]["span_id"]}-01'
+
+    def payload(self):
+        '''
+        Returns the spans in the OTLP/JSON format, in the shape the Chassis service exports the spans of the build in
+        (`get_trace_payload` of the service, checked by `tests/test_trace_payload.py`).
+        '''
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'chassisml-sdk'}},
+                                        {'key': 'service.version', 'value': {'stringValue': self.version}}]},
+            'scopeSpans': [{'scope': {'name': 'chassisml'}, 'spans': [{
+                'traceId': self.trace_id,
+                'spanId': span['span_id'],
+                'parentSpanId': span['parent_id'],
+                'name': span['name'],
+                'kind': 3 if span['name'] == 'upload' else 1,
+                'startTimeUnixNano': str(span['start']),
+                'endTimeUnixNano': str(span['end'] or int(time.time() * 1e9)),
+                'attributes': []
+            } for span in self.spans]}]
+        }]}
+
+    def finish(self, trace_file=None, trace_collector=None):
+        '''
+        Ends the root span and exports the spans in the OTLP/JSON format, if `trace_file` or `trace_collector` is given.
+        The publish has succeeded by then, so an export that fails only raises a warning.
+
+        Args:
+        trace_file (str): File the spans are appended to as one line
+        trace_collector (str): OTLP/HTTP traces endpoint of an OpenTelemetry collector, e.g. `http://localhost:4318/v1/traces`
+        '''
+        self._root.__exit__(None, None, None)
+        if not (trace_file or trace_collector):
+            return
+
+        payload = self.payload()
+        try:
+            if trace_file:
+                with open(trace_file, 'a') as f:
+                    f.write(json.dumps(payload) + '\n')
+            if trace_collector:
+                requests.post(trace_collector, json=payload, timeout=10).raise_for_status()
+        except Exception as e:
+            warnings.warn(f"Could not export trace {self.trace_id}: {e}")
@@ -5,7 +5,10 @@ import _io
 import os
 import time
 import json
+import zlib
+import hashlib
 import requests
+import urllib3
 import urllib.parse
 import tempfile
 import shutil
@@ -22,6 +25,7 @@ from chassisml import __version__
 from .open_model_initiative_checks.open_model_initiative_checks import OMI_check
 from ._utils import zipdir,fix_dependencies,write_metadata_yaml,NumpyEncoder,fix_dependencies_arm_gpu, \
     docker_start,docker_clean_up
+from ._trace import Trace
 
 ###########################################
 MODEL_ZIP_NAME = 'model.zip'
@@ -73,6 +77,7 @@ class ChassisModel(mlflow.pyfunc.PythonModel):
 
         self.chassis_build_url = urllib.parse.urljoin(chassis_base_url, routes['build'])
         self.chassis_test_url = urllib.parse.urljoin(chassis_base_url, routes['test'])
+        self.chassis_job_url = urllib.parse.urljoin(chassis_base_url, routes['job'])
         self.chassis_auth_header = chassis_auth_header
         self.ssl_verification = ssl_verification
 
@@ -159,9 +164,10 @@ class ChassisModel(mlflow.pyfunc.PythonModel):
             return False
         return results
 
-    def test_env(self,test_input_path,conda_env=None,fix_env=True):
+    def test_env(self,test_input_path,conda_env=None,fix_env=True,wait_for_completion=True,timeout=None):
         '''
-        Runs a sample inference test in new conda environment created on the chassis service side. In other words, a "dry run" of a true chassis job to ensure model code runs within the chassis service.
+        Runs a sample inference test in a conda environment created on the chassis service side. In other words, a "dry run" of a true chassis job to ensure model code runs within the chassis service.
+        The test runs as a test job of the service; with `wait_for_completion=False` this method returns its `job_id` right away, and its result is the `result` of the job status (see `ChassisClient.block_until_complete`).
         
         **NOTE**: This method is not available in the publicly-hosted service.
         
@@ -169,15 +175,21 @@ class ChassisModel(mlflow.pyfunc.PythonModel):
             test_input_path (str): Filepath to sample input data
             conda_env (str): Either filepath to conda.yaml file or dictionary with environment requirements. If not provided, chassis will infer dependency requirements from local environment
             fix_env (bool): Modifies conda or pip-installable packages into list of dependencies to be installed during the container build
+            wait_for_completion (bool): If `True`, waits for the test job to finish and returns its result
+            timeout (int): Optional time in seconds to wait for the test job, after which `False` is returned
         
         Returns:
-            Dict: raw model predictions returned by `process_fn` or `batch_process_fn` run from within chassis service
+            Dict: raw model predictions returned by `process_fn` or `batch_process_fn` run from within chassis service, or with `wait_for_completion=False` the `job_id` of the test job
 
         Examples:
         ```python
         chassis_model = chassis_client.create_model(process_fn=process)
         sample_filepath = './sample_data.json'
         results = chassis_model.test_env(sample_filepath)
+
+        # or without blocking
+        job_id = chassis_model.test_env(sample_filepath, wait_for_completion=False)['job_id']
+        results = chassis_client.block_until_complete(job_id)['result']
         ```        
 
         '''
@@ -210,7 +222,24 @@ class ChassisModel(mlflow.pyfunc.PythonModel):
         shutil.rmtree(tmppath)
         shutil.rmtree(model_directory)
 
-        return res.json()
+        # services before test jobs answer with the result of the test
+        if not wait_for_completion or 'job_id' not in res.json():
+            return res.json()
+
+        headers = {'Authorization': self.chassis_auth_header} if self.chassis_auth_header else {}
+        job_url = f'{self.chassis_job_url}/{res.json()["job_id"]}'
+        params = {'timeout': timeout} if timeout is not None else None
+        with requests.get(f'{job_url}/events',params=params,headers=headers,verify=self.ssl_verification,stream=True) as events:
+            events.raise_for_status()
+            finished = any(line.startswith('data:') and json.loads(line[len('data:'):])['phase'] in ('succeeded', 'failed')
+                           for line in events.iter_lines(decode_unicode=True))
+        if not finished:
+            print('Timed out before completion.')
+            return False
+
+        res = requests.get(job_url,headers=headers,verify=self.ssl_verification)
+        res.raise_for_status()
+        return res.json()['result']
 
     def save(self,path,conda_env=None,overwrite=False,fix_env=True,gpu=False,arm64=False):
         '''
@@ -244,7 +273,7 @@ class ChassisModel(mlflow.pyfunc.PythonModel):
 
     def publish(self,model_name,model_version,registry_user=None,registry_pass=None,
                 conda_env=None,fix_env=True,gpu=False,arm64=False,
-                sample_input_path=None,webhook=None):
+                sample_input_path=None,webhook=None,priority=0,variants=None,trace_file=None,trace_collector=None,slim=None):
         '''
         Executes chassis job, which containerizes model and pushes container image to Docker registry.
 
@@ -259,9 +288,14 @@ class ChassisModel(mlflow.pyfunc.PythonModel):
             arm64 (bool): If True, builds container image that runs on ARM64 architecture
             sample_input_path (str): Optional filepath to sample input data
             webhook (str): Optional webhook for Chassis service to update status
+            priority (int): Optional build priority, builds with a higher priority leave the Chassis service's build queue first
+            variants (list): Optional list of dictionaries with `gpu` and `arm64` flags to build several variants from one upload instead of the single one described by `gpu` and `arm64`. Each variant is tagged `<model_version>-<cpu|gpu>-<amd64|arm64>`, and `<model_version>` (CPU) and `<model_version>-gpu` (GPU) become multi-arch manifest lists. The returned `job_id` is the id of the job group
+            trace_file (str): Optional file the spans of the publish (saving, zipping and uploading the model) are appended to in the OTLP/JSON format. The Chassis service continues the trace through the build
+            trace_collector (str): Optional OTLP/HTTP traces endpoint of an OpenTelemetry collector to export the spans of the publish to, e.g. `http://localhost:4318/v1/traces`
+            slim (bool): Optional, if True builds a slim image holding only the model's relocated environment, the model and the server code on a minimal base image, which is faster to push and pull. ARM64 images are always full images. Defaults to the Chassis service's setting
 
         Returns:
-            Dict: Response to Chassis `/build` endpoint
+            Dict: Response to Chassis `/build` endpoint, with the `trace_id` of the publish
 
         Examples:
         ```python
@@ -286,10 +320,15 @@ class ChassisModel(mlflow.pyfunc.PythonModel):
         if webhook and not validators.url(webhook):
             raise ValueError("Provided webhook is not a valid URL")
 
+        if variants and len(variants) > 1 and any(variant.get('gpu') and variant.get('arm64') for variant in variants):
+            raise ValueError("ARM64+GPU builds need modified dependencies and cannot be combined with other variants")
+
+        trace = Trace('publish', __version__)
         try:
             model_directory = os.path.join(tempfile.mkdtemp(),CHASSIS_TMP_DIRNAME)
-            mlflow.pyfunc.save_model(path=model_directory, python_model=self, conda_env=conda_env, 
-                                    extra_pip_requirements = None if conda_env else ["chassisml=={}".format(__version__)])
+            with trace.span('save_model'):
+                mlflow.pyfunc.save_model(path=model_directory, python_model=self, conda_env=conda_env, 
+                                        extra_pip_requirements = None if conda_env else ["chassisml=={}".format(__version__)])
 
             if fix_env:
                 fix_dependencies(model_directory)
@@ -302,7 +341,8 @@ class ChassisModel(mlflow.pyfunc.PythonModel):
 
             # Compress all files in model directory to send them as a zip.
             tmppath = tempfile.mkdtemp()
-            zipdir(model_directory,tmppath,MODEL_ZIP_NAME)
+            with trace.span('zipdir'):
+                zipdir(model_directory,tmppath,MODEL_ZIP_NAME)
             
             image_name = "-".join(model_name.translate(str.maketrans('', '', string.punctuation)).lower().split())
             image_data = {
@@ -312,8 +352,13 @@ class ChassisModel(mlflow.pyfunc.PythonModel):
                 'publish': True,
                 'gpu': gpu,
                 'arm64': arm64,
-                'webhook': webhook
+                'webhook': webhook,
+                'priority': priority
             }
+            if slim is not None:
+                image_data['slim'] = slim
+            if variants:
+                image_data['variants'] = variants
 
             if registry_user and registry_pass:
                 image_data['registry_auth'] = base64.b64encode("{}:{}".format(registry_user,registry_pass).encode("utf-8")).decode("utf-8")
@@ -339,10 +384,12 @@ class ChassisModel(mlflow.pyfunc.PythonModel):
                     file_pointers.append(sample_fp)
 
                 print('Starting build job... ', end='', flush=True)
-                if self.chassis_auth_header:
-                    res = requests.post(self.chassis_build_url, files=files, headers={'Authorization': self.chassis_auth_header}, verify=self.ssl_verification)
-                else:
-                    res = requests.post(self.chassis_build_url, files=files, verify=self.ssl_verification)
+                with trace.span('upload'):
+                    # the service continues the trace of the publish
+                    headers = {'traceparent': trace.traceparent()}
+                    if self.chassis_auth_header:
+                        headers['Authorization'] = self.chassis_auth_header
+                    res = requests.post(self.chassis_build_url, files=files, headers=headers, verify=self.ssl_verification)
 
                 res.raise_for_status()
             print('Ok!')
@@ -353,7 +400,8 @@ class ChassisModel(mlflow.pyfunc.PythonModel):
             shutil.rmtree(tmppath)
             shutil.rmtree(model_directory)
 
-            return res.json()
+            trace.finish(trace_file, trace_collector)
+            return dict(res.json(), trace_id=trace.trace_id)
         
         except Exception as e:
             if os.path.exists(tmppath):
@@ -470,14 +518,84 @@ class ChassisClient:
         res.raise_for_status()
         return res.text
 
-    def block_until_complete(self,job_id,timeout=None,poll_interval=5):
+    def stream_job_logs(self, job_id, follow=True, since=None, tail=None):
+        '''
+        Streams the logs of a chassis job line by line, e.g. to tail a running build
+
+        Args:
+            job_id (str): Chassis job identifier generated from `ChassisModel.publish` method
+            follow (bool): If `True`, keeps streaming new lines until the build ends
+            since (int): Optional number of seconds, only lines logged within them are returned
+            tail (int): Optional number of last lines to start with
+
+        Yields:
+            str: line of the Chassis job logs
+
+        Examples:
+        ```python
+        job_id = response.get('job_id')
+        for line in chassis_client.stream_job_logs(job_id):
+            print(line)
+        ```
+        '''
+        route = f'{urllib.parse.urljoin(self.base_url, routes["job"])}/{job_id}/logs'
+        params = {'follow': str(follow).lower()}
+        if since is not None:
+            params['since'] = since
+        if tail is not None:
+            params['tail'] = tail
+        if self.auth_header:
+            res = requests.get(route,params=params,headers={'Authorization': self.auth_header},verify=self.ssl_verification,stream=True)
+        else:
+            res = requests.get(route,params=params,verify=self.ssl_verification,stream=True)
+
+        with res:
+            res.raise_for_status()
+            for line in res.iter_lines(decode_unicode=True):
+                yield line
+
+    def get_job_events(self, job_id, timeout=None):
+        '''
+        Streams the phase transitions of a chassis job as they happen: `queued`, `scheduled`, `building`, `pushing` and finally `succeeded` or `failed`.
+        Test jobs started by `ChassisModel.test_env` go through `queued` and `running` instead
+
+        Args:
+            job_id (str): Chassis job identifier generated from `ChassisModel.publish` method
+            timeout (int): Optional time in seconds after which the stream ends even if the job has not finished
+
+        Yields:
+            Dict: JSON Chassis job event with the `job_id` and its `phase`, starting with the current phase
+
+        Examples:
+        ```python
+        job_id = response.get('job_id')
+        for event in chassis_client.get_job_events(job_id):
+            print(event['phase'])
+        ```
+        '''
+        route = f'{urllib.parse.urljoin(self.base_url, routes["job"])}/{job_id}/events'
+        params = {'timeout': timeout} if timeout is not None else None
+        if self.auth_header:
+            res = requests.get(route,params=params,headers={'Authorization': self.auth_header},verify=self.ssl_verification,stream=True)
+        else:
+            res = requests.get(route,params=params,verify=self.ssl_verification,stream=True)
+
+        with res:
+            res.raise_for_status()
+            for line in res.iter_lines(decode_unicode=True):
+                if line.startswith('data:'):
+                    yield json.loads(line[len('data:'):])
+
+    def block_until_complete(self,job_id,timeout=None,poll_interval=5,stream_events=False):
         '''
-        Blocks until Chassis job is complete or timeout is reached. Polls Chassis job API until a result is marked finished.
+        Blocks until Chassis job is complete or timeout is reached. Polls Chassis job API until a result is marked finished,
+        or with `stream_events` waits on the job's event stream (see `ChassisClient.get_job_events`) so that completion is noticed right away.
 
         Args:
             job_id (str): Chassis job identifier generated from `ChassisModel.publish` method
             timeout (int): Timeout threshold in seconds
             poll_intervall (int): Amount of time to wait in between API polls to check status of job
+            stream_events (bool): If `True`, waits on the job's event stream instead of polling.
 
         Returns:
             Dict: final job status returned by `ChassisClient.block_until_complete` method
@@ -504,6 +622,13 @@ class ChassisClient:
         ```        
 
         '''
+        if stream_events:
+            for event in self.get_job_events(job_id, timeout):
+                if event['phase'] in ('succeeded', 'failed'):
+                    return self.get_job_status(job_id)
+            print('Timed out before completion.')
+            return False
+
         endby = time.time() + timeout if (timeout is not None) else None
         while True:
             status = self.get_job_status(job_id)
@@ -514,15 +639,23 @@ class ChassisClient:
                 return False
             time.sleep(poll_interval)
 
-    def download_tar(self, job_id, output_filename):
+    def download_tar(self, job_id, output_filename, compression=None, chunk_size=1024*1024, max_retries=5):
         '''
         Downloads container image as tar archive
 
+        The archive is streamed in chunks to `<output_filename>.part`, which is renamed to `output_filename` once it has
+        been verified against the checksum sent by the service. A `.part` file left by an interrupted download is resumed,
+        and dropped connections are resumed up to `max_retries` times. If a resumed `.part` file turns out to belong to
+        another archive, the download starts over.
+
         **NOTE**: This method is not available in the publicly-hosted service.
         
         Args:
             job_id (str): Chassis job identifier generated from `ChassisModel.publish` method
             output_filename (str): Local output filepath to save container image
+            compression (str): Optional transfer compression, `gzip` or `zstd` (requires the `zstandard` package). Resumed parts are always transferred uncompressed
+            chunk_size (int): Number of bytes read and written at a time
+            max_retries (int): Number of times a dropped download is resumed
 
         Returns:
             None: This method does not return an object
@@ -541,19 +674,76 @@ class ChassisClient:
         chassis_client.download_tar(job_id, "./chassis-model.tar")
         ```
         '''
-        url = f'{urllib.parse.urljoin(self.base_url, routes["job"])}/{job_id}/download-tar'
-        
-        if self.auth_header:
-            r = requests.get(url,headers={'Authorization': self.auth_header},verify=self.ssl_verification)
-        else:
-            r = requests.get(url,verify=self.ssl_verification)
-
+        if compression not in (None, 'gzip', 'zstd'):
+            raise ValueError("compression must be one of None, 'gzip' or 'zstd'")
+        if compression == 'zstd':
+            import zstandard
 
-        if r.status_code == 200:
-            with open(output_filename, 'wb') as f:
-                f.write(r.content)
-        else:
-            print(f'Error download tar: {r.text}')
+        url = f'{urllib.parse.urljoin(self.base_url, routes["job"])}/{job_id}/download-tar'
+        part_filename = f'{output_filename}.part'
+        resumed = os.path.exists(part_filename)
+        checksum = None
+
+        for attempt in range(max_retries + 1):
+            offset = os.path.getsize(part_filename) if os.path.exists(part_filename) else 0
+            headers = {'Authorization': self.auth_header} if self.auth_header else {}
+            if offset:
+                headers.update({'Range': f'bytes={offset}-', 'Accept-Encoding': 'identity'})
+            else:
+                headers['Accept-Encoding'] = compression or 'identity'
+
+            try:
+                with requests.get(url,headers=headers,stream=True,verify=self.ssl_verification) as r:
+                    if r.status_code == 416:
+                        # the part is as long as the archive already, the checksum tells if it is the same one
+                        checksum = r.headers.get('X-Checksum-Sha256')
+                        if checksum:
+                            break
+                        os.remove(part_filename)
+                        continue
+                    if r.status_code not in (200, 206):
+                        print(f'Error download tar: {r.text}')
+                        return
+
+                    # start over if the archive changed since the part was downloaded
+                    if checksum and r.headers.get('X-Checksum-Sha256') != checksum and r.status_code == 206:
+                        os.remove(part_filename)
+                        checksum = None
+                        continue
+                    checksum = r.headers.get('X-Checksum-Sha256')
+
+                    encoding = r.headers.get('Content-Encoding')
+                    if encoding == 'zstd':
+                        decoder = zstandard.ZstdDecompressor().decompressobj()
+                    elif encoding == 'gzip':
+                        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    else:
+                        decoder = None
+
+                    with open(part_filename, 'ab' if r.status_code == 206 else 'wb') as f:
+                        for chunk in r.raw.stream(chunk_size, decode_content=False):
+                            f.write(decoder.decompress(chunk) if decoder else chunk)
+                        if decoder and encoding == 'gzip':
+                            f.write(decoder.flush())
+                break
+            except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+                if attempt == max_retries:
+                    raise
+                print(f'Download interrupted ({e}), resuming...')
+                time.sleep(min(2 ** attempt, 30))
+
+        if checksum:
+            sha256 = hashlib.sha256()
+            with open(part_filename, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    sha256.update(chunk)
+            if sha256.hexdigest() != checksum:
+                os.remove(part_filename)
+                if resumed:
+                    # the part left by an earlier download may be of another archive
+                    return self.download_tar(job_id, output_filename, compression, chunk_size, max_retries)
+                raise ValueError(f'Checksum mismatch of the downloaded archive of job {job_id}, please download it again')
+        os.replace(part_filename, output_filename)
 
     def test_OMI_compliance(self, image_id=None):
         '''
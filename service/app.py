@@ -1,35 +1,164 @@
 import io
 import os
+import re
 import json
 import uuid
+import hashlib
+import secrets
 import tempfile
 import zipfile
 import time
 import yaml
 import requests
+import zstandard
 import subprocess
 from urllib.parse import urlparse
 from pathlib import Path
-from shutil import rmtree, copytree, copyfile
+from shutil import rmtree, copy2
+from datetime import datetime, timezone
+from contextlib import contextmanager
 
 from loguru import logger
 from dotenv import load_dotenv
-from flask import Flask, request, send_from_directory, Response
+from flask import Flask, request, send_from_directory, Response, current_app, after_this_request
+from werkzeug.datastructures import FileStorage
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, NeedData, Epilogue, Field, File, Data
 
 from kubernetes import client, config, watch
 from kubernetes.client.rest import ApiException
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
 
+import gzip
+import queue
 import tarfile
 import base64
-import asyncio
+import shlex
+import struct
+import zlib
 import threading
+import fcntl
 from ast import literal_eval
+from concurrent.futures import ThreadPoolExecutor
 
-from retry import retry
-from libcloud.storage.types import Provider
+from libcloud.storage.types import Provider, ObjectDoesNotExistError
 from requests.exceptions import ConnectionError
 from libcloud.storage.providers import get_driver
 
+# manifest media types accepted when reading images through the registry API
+REGISTRY_MANIFEST_TYPES = ','.join([
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.oci.image.index.v1+json',
+])
+
+# GiB of build memory needed to create the conda environment of a large framework, other packages need 0.05 GiB
+BUILD_DEPENDENCY_MEMORY = {
+    'torch': 3, 'pytorch': 3, 'torchvision': 0.5, 'tensorflow': 3, 'tensorflow-gpu': 3, 'jax': 1, 'jaxlib': 2,
+    'mxnet': 2, 'mxnet-cu112': 3, 'cudatoolkit': 2, 'cudnn': 1, 'transformers': 1, 'onnxruntime': 0.5,
+    'onnxruntime-gpu': 1, 'opencv-python': 0.5, 'fastai': 1, 'xgboost': 0.5, 'lightgbm': 0.25,
+}
+
+# label of the build jobs and pods created by Chassis, watched by `reconcile_jobs` and `watch_build_pods`
+JOB_LABEL_KEY = 'chassis.modzy.com/build'
+JOB_LABEL_SELECTOR = f'{JOB_LABEL_KEY}=true'
+
+# labels of the idle builder pods of `WarmPool` (`idle`, then `assigned`), and of the job name selecting a builder
+BUILDER_POOL_LABEL_KEY = 'chassis.modzy.com/builder-pool'
+# mount point of the registry credentials in the builder pods
+BUILDER_CREDENTIALS_DIR = '/builder-credentials'
+BUILDER_LABEL_KEY = 'chassis.modzy.com/builder'
+
+# label of the jobs warming the kaniko cache (see `warm_kaniko_cache`), and the record of the images they last warmed
+CACHE_WARMER_LABEL_KEY = 'chassis.modzy.com/cache-warmer'
+KANIKO_CACHE_RECORD = '.chassis-warmed.json'
+# kaniko's default `--cache-ttl`: older cached base images are pulled again, so the janitor deletes them
+KANIKO_CACHE_TTL_HOURS = 336
+# hits and misses of the package cache printed to the build log by `install_env.sh` of the flavours, per install step
+PACKAGE_CACHE_PATTERN = re.compile(r'^chassis-package-cache (\{.*\})\s*$', re.MULTILINE)
+# base image of a flavour Dockerfile stage, e.g. `FROM continuumio/miniconda3:latest AS env`
+DOCKERFILE_FROM_PATTERN = re.compile(r'^FROM\s+(?:--platform=\S+\s+)?(\S+)', re.IGNORECASE | re.MULTILINE)
+
+# command of the builder pods: waits for the kaniko arguments of a build on the shared volume, and for its registry
+# credentials in the builder's own secret, which is mounted optional and only created when the build is handed over
+BUILDER_SCRIPT = '''
+dir=$BUILDER_DIR/$POD_NAME
+while [ ! -f $dir/run.sh ] || [ ! -f $BUILDER_CREDENTIALS_DIR/config.json ]; do sleep 1; done
+cp $BUILDER_CREDENTIALS_DIR/config.json /kaniko/.docker/config.json
+mv $dir/run.sh /kaniko/run.sh
+rm -rf $dir
+exec /busybox/sh /kaniko/run.sh
+'''
+
+# prefix of the job annotations holding the webhooks of the requests attached to an in-flight build
+WEBHOOK_ANNOTATION_PREFIX = 'chassis.modzy.com/webhook-'
+# prefix of the job annotations holding the job groups of the matrix builds whose variants attached to an in-flight build
+GROUP_ANNOTATION_PREFIX = 'chassis.modzy.com/group-'
+# timeout of the requests to webhooks, registries and the build logs, which `complete_job` sends one after the other on
+# the thread of `reconcile_jobs`, so that a slow one cannot hold up the completion of the other jobs
+REQUEST_TIMEOUT_SECONDS = 30
+# interval at which `poll_pushes` reads the new log lines of the running kaniko containers
+PUSH_POLL_SECONDS = 2
+
+# W3C trace context header continued by `Trace`, https://www.w3.org/TR/trace-context/
+TRACEPARENT_PATTERN = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+# kaniko log message starting a build step
+KANIKO_STEP_PATTERN = re.compile(r'^INFO\[\d+\] ((?:RUN|COPY|ADD) .*)$')
+
+# metrics served by `/metrics`. Build times are observed by `observe_build_metrics` once a job is completed
+BUILD_METRIC_LABELS = ['flavour', 'gpu', 'arm64']
+BUILD_TIME_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 900, 1200, 1800, 2700, 3600, 7200)
+UPLOAD_TIME_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+UPLOAD_BYTES = Histogram('chassis_upload_bytes', 'Size of the model archives uploaded to /build',
+                         buckets=(1e6, 1e7, 5e7, 1e8, 2.5e8, 5e8, 1e9, 2e9, 5e9, 1e10))
+UPLOAD_SECONDS = Histogram('chassis_upload_duration_seconds', 'Time to receive the uploads to /build',
+                           buckets=UPLOAD_TIME_BUCKETS)
+UNZIP_SECONDS = Histogram('chassis_unzip_duration_seconds', 'Time spent extracting the model archives while they are uploaded',
+                          buckets=UPLOAD_TIME_BUCKETS)
+CONTEXT_UPLOAD_SECONDS = Histogram('chassis_context_upload_duration_seconds',
+                                   'Time to upload the build contexts to the context bucket', buckets=UPLOAD_TIME_BUCKETS)
+QUEUE_SECONDS = Histogram('chassis_build_queue_duration_seconds', 'Time builds waited in the build queue',
+                          BUILD_METRIC_LABELS, buckets=BUILD_TIME_BUCKETS)
+SCHEDULE_SECONDS = Histogram('chassis_build_schedule_duration_seconds',
+                             'Time from the start of the build jobs to their pods being scheduled', BUILD_METRIC_LABELS,
+                             buckets=BUILD_TIME_BUCKETS)
+RUN_SECONDS = Histogram('chassis_build_run_duration_seconds', 'Run time of the kaniko containers', BUILD_METRIC_LABELS,
+                        buckets=BUILD_TIME_BUCKETS)
+PUSH_SECONDS = Histogram('chassis_build_push_duration_seconds', 'Time kaniko took to push the images', BUILD_METRIC_LABELS,
+                         buckets=BUILD_TIME_BUCKETS)
+BUILD_SECONDS = Histogram('chassis_build_duration_seconds', 'Time from the creation of the build jobs until they finished',
+                          BUILD_METRIC_LABELS, buckets=BUILD_TIME_BUCKETS)
+START_SECONDS = Histogram('chassis_build_start_duration_seconds', 'Time from the admission of the builds until kaniko started',
+                          BUILD_METRIC_LABELS, buckets=BUILD_TIME_BUCKETS)
+BUILD_FAILURES = Counter('chassis_build_failures_total', 'Failed builds by reason', ['reason'])
+IMAGE_BYTES = Histogram('chassis_image_bytes', 'Size of the built images, compressed as pushed', BUILD_METRIC_LABELS + ['slim'],
+                        buckets=(1e8, 2.5e8, 5e8, 1e9, 2e9, 3e9, 5e9, 7.5e9, 1e10, 2e10))
+QUEUED_BUILDS = Gauge('chassis_queued_builds', 'Builds waiting in the build queue')
+QUEUED_BUILDS.set_function(lambda: sum(1 for job in JOB_INDEX.jobs() if is_queued_build(job)))
+RUNNING_BUILDS = Gauge('chassis_running_builds', 'Admitted builds that have not finished yet')
+RUNNING_BUILDS.set_function(lambda: count_running_builds(JOB_INDEX.jobs()))
+JANITOR_DELETED = Counter('chassis_janitor_deleted_total', 'Build artifacts, jobs and secrets deleted by the janitor', ['kind'])
+JANITOR_RECLAIMED_BYTES = Counter('chassis_janitor_reclaimed_bytes_total',
+                                  'Bytes of build artifacts and cached base images deleted by the janitor')
+TEST_ENV_REQUESTS = Counter('chassis_test_env_requests_total', 'Conda environments needed by /test, by whether they were cached',
+                            ['cached'])
+QUEUED_TESTS = Gauge('chassis_queued_tests', '/test jobs waiting for a test worker')
+QUEUED_TESTS.set_function(lambda: TEST_JOBS.count('queued'))
+RUNNING_TESTS = Gauge('chassis_running_tests', '/test jobs being run by a test worker')
+RUNNING_TESTS.set_function(lambda: TEST_JOBS.count('running'))
+IDLE_BUILDERS = Gauge('chassis_idle_builders', 'Idle builder pods of the warm pool that builds can be handed to')
+ARTIFACT_BYTES = Gauge('chassis_artifact_bytes', 'Bytes of build artifacts on the shared volume when the janitor last ran')
+KANIKO_CACHE_BYTES = Gauge('chassis_kaniko_cache_bytes', 'Bytes of base images in the kaniko cache when the janitor last ran')
+PACKAGE_CACHE_BYTES = Gauge('chassis_package_cache_bytes',
+                            'Bytes of conda packages and pip downloads in the package cache when the janitor last ran')
+PACKAGE_CACHE_PACKAGES = Counter('chassis_package_cache_packages_total',
+                                 'Packages installed by builds, by package manager and whether they were in the package cache',
+                                 ['manager', 'cached'])
+
+# name of the build artifacts on the shared volume: image tars, model directories and metadata, and sample inputs of a request id
+ARTIFACT_PATTERN = re.compile(r'^(?:kaniko_image-|model-)?([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(?:\.tar(?:\.sha256)?|\.yaml|-.+)?$')
+
 
 ###########################################
 def create_dev_environment():
@@ -150,7 +279,7 @@ def create_dev_environment():
                                                     verbs=["get", "create", "list"]),
                                 client.V1PolicyRule(api_groups=["batch", "extensions"],
                                                     resources=["jobs", "pods"],
-                                                    verbs=["get", "create", "patch"])
+                                                    verbs=["get", "create", "patch", "list", "watch"])
                                 ]
             role_api.create_namespaced_role(ENVIRONMENT,
                                             client.V1Role(api_version="rbac.authorization.k8s.io/v1",
@@ -207,6 +336,74 @@ def choose_dockerfile(gpu,arm64):
     else:
         return "Dockerfile"
 
+def get_image_destination(image_name):
+    '''
+    This utility method returns the fully qualified registry destination kaniko pushes the image to
+
+    Args:
+        image_name (str): container image name
+
+    Returns:
+        str: registry destination of the image, including its tag
+    '''
+    return f'{REGISTRY_URI+"/" if REGISTRY_URI else ""}{REPOSITORY_PREFIX}{image_name}{"" if ":" in image_name else ":latest"}'
+
+def get_data_volume():
+    '''
+    This utility method returns the shared volume (PV mode only) and its mount, which leads to `MOUNT_PATH_DIR`.
+
+    Args:
+        None (None)
+
+    Returns:
+        Tuple(V1Volume, V1VolumeMount): volume holding the data and its mount point
+    '''
+    # volume claim
+    data_pv_claim = client.V1PersistentVolumeClaimVolumeSource(
+        claim_name="dir-claim-chassis"
+    ) if CHASSIS_DEV else client.V1PersistentVolumeClaimVolumeSource(
+        claim_name=DATA_VOLUME_CLAIM_NAME
+    )
+
+    # volume holding data
+    data_volume = client.V1Volume(
+        name="local-volume-code",
+        persistent_volume_claim=data_pv_claim
+    ) if CHASSIS_DEV else client.V1Volume(
+        name=DATA_VOLUME_NAME,
+        persistent_volume_claim=data_pv_claim
+    )
+
+    # this is a mount point. NOT the volume itself.
+    data_volume_mount = client.V1VolumeMount(
+        mount_path=MOUNT_PATH_DIR,
+        name=data_volume.name
+    )
+
+    return data_volume, data_volume_mount
+
+def get_kaniko_cache_volume():
+    '''
+    This utility method returns the volume of the kaniko cache, which holds the base images of the flavour Dockerfiles
+    in `images` (see `warm_kaniko_cache`) and the package cache of the builds in `packages` (see `get_package_cache_stats`),
+    and its mount, which leads to `KANIKO_CACHE_DIR` like in the service.
+
+    Args:
+        None (None)
+
+    Returns:
+        Tuple(V1Volume, V1VolumeMount): volume holding the cache and its mount point
+    '''
+    cache_volume = client.V1Volume(
+        name='kaniko-cache',
+        persistent_volume_claim=client.V1PersistentVolumeClaimVolumeSource(claim_name=KANIKO_CACHE_CLAIM_NAME)
+    )
+    cache_volume_mount = client.V1VolumeMount(
+        mount_path=KANIKO_CACHE_DIR,
+        name=cache_volume.name
+    )
+    return cache_volume, cache_volume_mount
+
 def create_job_object(
         image_name,
         module_name,
@@ -218,7 +415,13 @@ def create_job_object(
         gpu=False,
         arm64=False,
         context_uri=None,
-        metadata_path=None
+        metadata_path=None,
+        conda_env_dir=None,
+        env_image=None,
+        build_env=False,
+        resources=None,
+        context_name=None,
+        slim=False
 ):
     '''
     This utility method sets up all the required objects needed to create a model image and is run within the `run_kaniko` method.
@@ -234,6 +437,13 @@ def create_job_object(
         gpu (bool): If `True`, will build container image that runs on GPU 
         arm64 (bool): If `True`, will build container image that runs on ARM64 architecture
         context_uri (str): Location of build context in S3 (S3 mode only)
+        metadata_path (str): Location of model metadata within the build context
+        conda_env_dir (str): Content-addressed directory within the flavour holding the model's `conda.yaml`
+        env_image (str): Environment cache image the model image is built on (environment cache only)
+        build_env (bool): If `True`, the environment stage is built and pushed to `env_image` before the model image is built
+        resources (dict): cpu and memory of the kaniko containers returned by `get_build_resources`
+        context_name (str): random id naming the model within the build context, if it is shared with other jobs (matrix builds only)
+        slim (bool): If `True`, the model image is built on the `slim` runtime stage, which only holds the relocated environment (amd64 only)
 
     Returns:
         Job: Chassis job object
@@ -255,17 +465,14 @@ def create_job_object(
     else:
         b64_registry_credentials = REGISTRY_CREDENTIALS
 
-    # mount path leads to /data
-    # this is a mount point. NOT the volume itself.
-    # name aligns with a volume defined below.
+    if (env_image or LAYER_CACHE_REPO) and registry_auth and REGISTRY_CREDENTIALS:
+        # the environment and layer caches live in the registry configured during installation
+        auths = json.loads(base64.b64decode(REGISTRY_CREDENTIALS)).get('auths', {})
+        auths.update(json.loads(registry_credentials)['auths'])
+        b64_registry_credentials = base64.b64encode(json.dumps({'auths': auths}).encode("utf-8")).decode("utf-8")
+
     if PV_MODE:
-        data_volume_mount = client.V1VolumeMount(
-            mount_path=MOUNT_PATH_DIR,
-            name="local-volume-code"
-        ) if CHASSIS_DEV else client.V1VolumeMount(
-            mount_path=MOUNT_PATH_DIR,
-            name=DATA_VOLUME_NAME
-        )
+        data_volume, data_volume_mount = get_data_volume()
 
     # This volume will be used by kaniko container to get registry credentials.
     # mount path leads to /kaniko/.docker per kaniko reference documentation
@@ -278,7 +485,7 @@ def create_job_object(
 
     # create secret for registry credentials       
     registry_creds_secret_name = f'{random_name}-creds'
-    metadata = {'name': registry_creds_secret_name, 'namespace': ENVIRONMENT}
+    metadata = {'name': registry_creds_secret_name, 'namespace': ENVIRONMENT, 'labels': {JOB_LABEL_KEY: 'true'}}
     data = {'config.json': b64_registry_credentials}
     api_version = 'v1'
     kind = 'Secret'
@@ -294,22 +501,48 @@ def create_job_object(
     # This is the kaniko container used to build the final image.
     kaniko_args = [
         '' if publish else '--no-push',
-        f'--destination={REGISTRY_URI+"/" if REGISTRY_URI else ""}{REPOSITORY_PREFIX}{image_name}{"" if ":" in image_name else ":latest"}',
+        f'--destination={get_image_destination(image_name)}',
         '--snapshotMode=redo',
         '--use-new-run',
-        f'--build-arg=MODEL_DIR=model-{random_name}',
+        # only the stages of the chosen environment and runtime are built
+        '--skip-unused-stages=true',
+        f'--build-arg=MODEL_DIR=model-{context_name or random_name}',
         f'--build-arg=MODZY_METADATA_PATH={metadata_path if metadata_path is not None else "flavours/mlflow/interfaces/modzy/asset_bundle/0.1.0/model.yaml"}',
         f'--build-arg=MODEL_NAME={model_name}',
         f'--build-arg=MODEL_CLASS={module_name}',
         # Modzy is the default interface.
         '--build-arg=INTERFACE=modzy',
+        f'--build-arg=CONDA_ENV_DIR={conda_env_dir}',
     ]
 
+    if env_image:
+        # start from the cached environment stage instead of creating the conda environment again
+        kaniko_args.append(f'--build-arg=ENV_IMAGE={env_image}')
+
+    if slim:
+        kaniko_args.append('--build-arg=RUNTIME=slim')
+
+    if LAYER_CACHE_REPO:
+        # RUN layers, like the apt-get layer all builds share, are pulled from the cache instead of being run again
+        kaniko_args.extend(['--cache=true', f'--cache-repo={LAYER_CACHE_REPO}'])
+
+    if publish:
+        # kaniko writes the pushed digest to the termination message so the build index can record it
+        kaniko_args.append('--digest-file=/dev/termination-log')
+
     volumes = [kaniko_credentials_volume]
     kaniko_volume_mounts = [kaniko_credentials_volume_mount]
 
-    base_resources = {"memory": "8Gi", "cpu": "2"}
-    slim_reqs = {"memory": "2Gi", "cpu": "1"}
+    if KANIKO_CACHE_CLAIM_NAME:
+        # base images are read from the warmed cache instead of being pulled, and the environment stage installs conda
+        # and pip packages through the package cache, which kaniko leaves out of the image since it is a mounted volume
+        cache_volume, cache_volume_mount = get_kaniko_cache_volume()
+        volumes.append(cache_volume)
+        kaniko_volume_mounts.append(cache_volume_mount)
+        kaniko_args.extend([f'--cache-dir={KANIKO_CACHE_DIR}/images',
+                            f'--build-arg=PACKAGE_CACHE_DIR={KANIKO_CACHE_DIR}/packages'])
+
+    base_resources = resources or {"memory": "8Gi", "cpu": "2"}
     kaniko_reqs = client.V1ResourceRequirements(limits=base_resources, requests=base_resources)
 
     if PV_MODE:
@@ -320,31 +553,15 @@ def create_job_object(
 
         init_container_kaniko = client.V1Container(
             name='kaniko',
-            image='gcr.io/kaniko-project/executor:latest',
+            image=KANIKO_IMAGE,
             volume_mounts=kaniko_volume_mounts,
             resources=kaniko_reqs,
             args=kaniko_args
         )
 
-        # volume claim
-        data_pv_claim = client.V1PersistentVolumeClaimVolumeSource(
-            claim_name="dir-claim-chassis"
-        ) if CHASSIS_DEV else client.V1PersistentVolumeClaimVolumeSource(
-            claim_name=DATA_VOLUME_CLAIM_NAME
-        )
-
-        # volume holding data
-        data_volume = client.V1Volume(
-            name="local-volume-code",
-            persistent_volume_claim=data_pv_claim
-        ) if CHASSIS_DEV else client.V1Volume(
-            name=DATA_VOLUME_NAME,
-            persistent_volume_claim=data_pv_claim
-        )
-
         volumes.append(data_volume)
     else:
-        kaniko_args.append(f'--context={context_uri}')
+        kaniko_args.extend([f'--dockerfile=flavours/{module_name}/{choose_dockerfile(gpu,arm64)}',f'--context={context_uri}'])
         if MODE=="s3":
             kaniko_s3_volume_mount = client.V1VolumeMount(
                 mount_path='/root/.aws',
@@ -359,7 +576,7 @@ def create_job_object(
             kaniko_volume_mounts.append(kaniko_s3_volume_mount)
             init_container_kaniko = client.V1Container(
                 name='kaniko',
-                image='gcr.io/kaniko-project/executor:latest',
+                image=KANIKO_IMAGE,
                 volume_mounts=kaniko_volume_mounts,
                 env=[client.V1EnvVar(name='AWS_REGION', value=AWS_REGION)],
                 resources=kaniko_reqs,
@@ -379,7 +596,7 @@ def create_job_object(
             kaniko_volume_mounts.append(kaniko_gs_volume_mount)
             init_container_kaniko = client.V1Container(
                 name='kaniko',
-                image='gcr.io/kaniko-project/executor:latest',
+                image=KANIKO_IMAGE,
                 volume_mounts=kaniko_volume_mounts,
                 env=[client.V1EnvVar(name='GOOGLE_APPLICATION_CREDENTIALS', value='/secret/storage-key.json')],
                 resources=kaniko_reqs,
@@ -394,6 +611,19 @@ def create_job_object(
     init_container_list = []
     containers_list = [init_container_kaniko]
 
+    if build_env:
+        # build and push the environment stage first so that this and later builds with the same environment can start from it
+        env_args = [arg for arg in kaniko_args if arg.startswith(('--build-arg=', '--dockerfile=', '--context=', '--cache'))]
+        env_args.extend(['--target=env', f'--destination={env_image}', '--snapshotMode=redo', '--use-new-run'])
+        init_container_list.append(client.V1Container(
+            name='kaniko-env',
+            image=KANIKO_IMAGE,
+            volume_mounts=init_container_kaniko.volume_mounts,
+            env=init_container_kaniko.env,
+            resources=kaniko_reqs,
+            args=env_args
+        ))
+
     pod_spec = client.V1PodSpec(
         service_account_name=K_SERVICE_ACOUNT_NAME,
         restart_policy='Never',
@@ -404,7 +634,7 @@ def create_job_object(
 
     # setup and initiate model image build
     template = client.V1PodTemplateSpec(
-        metadata=client.V1ObjectMeta(name=job_name),
+        metadata=client.V1ObjectMeta(name=job_name, labels={JOB_LABEL_KEY: 'true'}),
         spec=pod_spec
     )
 
@@ -417,49 +647,805 @@ def create_job_object(
         kind='Job',
         metadata=client.V1ObjectMeta(
             name=job_name,
+            labels={JOB_LABEL_KEY: 'true'}
         ),
         spec=spec
     )
 
     return job
 
-def create_job(api_instance, job):
+def create_job(api_instance, job, suspend=False):
     '''
     This method kicks off the kaniko build job within `run_kaniko` method to create the new model image.
 
     Args:
         api_instance (kubernetes.client): Kubernetes client where kaniko build will execute
         job (job): valid job object generated by `create_job_object` method 
+        suspend (bool): If `True`, the job is created suspended and waits in the build queue until `admit_builds` resumes it
 
     Returns:
-        None
+        V1Job: created job object
     '''
+    body = job
+    if suspend:
+        # the Kubernetes client predates `spec.suspend`, so it is set on the serialized job
+        body = api_instance.api_client.sanitize_for_serialization(job)
+        body['spec']['suspend'] = True
+
     api_response = api_instance.create_namespaced_job(
-        body=job,
+        body=body,
         namespace=ENVIRONMENT)
-    logger.info(f'Pod created. Status={str(api_response.status)}')
+    logger.info(f'Pod {"queued" if suspend else "created"}. Status={str(api_response.status)}')
+    return api_response
 
-async def clean_up(random_name,webhook=None):
+class WarmPool:
     '''
-    This async utility method waits for the job to complete and then deletes the secret containing the user's registry credentials
-    
+    Pool of idle builder pods that CPU builds are handed to (PV mode only), so that they do not wait for their pod to be
+    scheduled, the kaniko image to be pulled and the shared volume to be attached. A builder runs a kaniko image with a
+    shell, by default the `-debug` variant of `KANIKO_IMAGE`, with `BUILDER_SCRIPT`, which waits for the kaniko arguments of
+    a build in its directory on the shared volume. The registry credentials never go to the shared volume: every builder
+    mounts a secret named after it, `<pod>-creds`, as an optional volume, and the secret is only created with the
+    credentials of the build it is handed. The kubelet fills the volume when it syncs the pod, which relabelling it triggers.
+
+    A build is handed to a builder by labelling the builder as a pod of the build job, and creating the job with a selector
+    matching only that label, so that the job controller adopts the builder instead of creating a pod. `run` replaces the
+    builders handed out in the background. The adoption can go wrong in these ways:
+
+    * the job controller creates a pod before it sees the label: that pod is an idle builder without a secret, waiting
+      in vain, and deleted with the job
+    * creating the secret, relabelling the builder or creating the job fails: the builder and its secret are deleted, and
+      the build gets a pod of its own if the job was not created
+    * the builder is deleted or evicted before it starts the build: the job fails like it would with a pod of its own, and
+      `replenish` deletes the secret and directory of the builder once the pod is gone
+
+    Attributes:
+        size (int): number of idle builders kept
+        image (str): kaniko image of the builders, which needs a shell
+        resources (dict): cpu and memory of the builders; builds needing more memory are not handed to them
+        directory (str): directory on the shared volume holding a directory per builder
+    '''
+    def __init__(self, size, image, resources, directory):
+        self.size = size
+        self.image = image
+        self.resources = resources
+        self.directory = directory
+        self._wake = threading.Event()
+        self._taken = set()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def pod_spec(self, name):
+        '''
+        Returns the pod spec of the builder named `name`.
+        '''
+        data_volume, data_volume_mount = get_data_volume()
+        credentials_volume = client.V1Volume(
+            name='builder-credentials',
+            secret=client.V1SecretVolumeSource(secret_name=f'{name}-creds', optional=True)
+        )
+        volumes = [data_volume, credentials_volume]
+        volume_mounts = [data_volume_mount, client.V1VolumeMount(mount_path=BUILDER_CREDENTIALS_DIR, name=credentials_volume.name)]
+        if KANIKO_CACHE_CLAIM_NAME:
+            cache_volume, cache_volume_mount = get_kaniko_cache_volume()
+            volumes.append(cache_volume)
+            volume_mounts.append(cache_volume_mount)
+        return client.V1PodSpec(
+            service_account_name=K_SERVICE_ACOUNT_NAME,
+            restart_policy='Never',
+            containers=[client.V1Container(
+                name='kaniko',
+                image=self.image,
+                command=['/busybox/sh', '-c', BUILDER_SCRIPT],
+                env=[
+                    client.V1EnvVar(name='POD_NAME', value_from=client.V1EnvVarSource(
+                        field_ref=client.V1ObjectFieldSelector(field_path='metadata.name'))),
+                    client.V1EnvVar(name='BUILDER_DIR', value=self.directory),
+                    client.V1EnvVar(name='BUILDER_CREDENTIALS_DIR', value=BUILDER_CREDENTIALS_DIR)
+                ],
+                volume_mounts=volume_mounts,
+                resources=client.V1ResourceRequirements(limits=self.resources, requests=self.resources)
+            )],
+            volumes=volumes
+        )
+
+    def take(self):
+        '''
+        Returns the name of an idle builder whose kaniko container is running, which is not handed out again, or None.
+        '''
+        pods = client.CoreV1Api().list_namespaced_pod(ENVIRONMENT, label_selector=f'{BUILDER_POOL_LABEL_KEY}=idle').items
+        with self._lock:
+            for pod in pods:
+                statuses = (pod.status.container_statuses or []) if pod.status else []
+                if pod.metadata.name not in self._taken and not pod.metadata.deletion_timestamp and \
+                        any(status.state.running for status in statuses):
+                    self._taken.add(pod.metadata.name)
+                    return pod.metadata.name
+        return None
+
+    def hand_off(self, api_instance, job):
+        '''
+        Hands the build of `job`, created by `create_job_object`, to an idle builder and creates the job.
+
+        Returns:
+            V1Job: created job object, or None if there is no idle builder for the build and the job was not created
+        '''
+        container = job.spec.template.spec.containers[0]
+        if get_memory_mi(container.resources.requests['memory']) > get_memory_mi(self.resources['memory']):
+            return None
+        pod_name = self.take()
+        if not pod_name:
+            return None
+        self._wake.set()
+
+        job_name = job.metadata.name
+        builder_dir = os.path.join(self.directory, pod_name)
+        try:
+            # the builder's secret is created before it is relabelled, whereupon the kubelet mounts it
+            secret_name = next(volume.secret.secret_name for volume in job.spec.template.spec.volumes if volume.secret)
+            registry_credentials = client.CoreV1Api().read_namespaced_secret(secret_name, ENVIRONMENT).data['config.json']
+            client.CoreV1Api().create_namespaced_secret(ENVIRONMENT, client.V1Secret(
+                api_version='v1', kind='Secret', data={'config.json': registry_credentials},
+                metadata={'name': f'{pod_name}-creds', 'namespace': ENVIRONMENT, 'labels': {BUILDER_POOL_LABEL_KEY: 'assigned'}}))
+
+            client.CoreV1Api().patch_namespaced_pod(pod_name, ENVIRONMENT, {'metadata': {'labels': {
+                BUILDER_POOL_LABEL_KEY: 'assigned', BUILDER_LABEL_KEY: job_name, JOB_LABEL_KEY: 'true', 'job-name': job_name}}})
+        except Exception as e:
+            logger.error(f'Exception when handing {job_name} to builder {pod_name}: {e}')
+            self.release(pod_name)
+            return None
+
+        # the build gets the memory of the builder
+        completion = json.loads(job.metadata.annotations['completion'])
+        if completion.get('resources'):
+            completion['resources']['memory'] = get_memory_mi(self.resources['memory']) * 1024 ** 2
+        job.metadata.annotations.update(completion=json.dumps(completion), builder=pod_name)
+        job.spec.manual_selector = True
+        job.spec.selector = client.V1LabelSelector(match_labels={BUILDER_LABEL_KEY: job_name})
+        job.spec.template = client.V1PodTemplateSpec(
+            metadata=client.V1ObjectMeta(labels={BUILDER_LABEL_KEY: job_name}),
+            spec=self.pod_spec(pod_name)
+        )
+        try:
+            created = create_job(api_instance, job)
+        except Exception:
+            # the relabelled builder would otherwise be left running, counted as a pod of a job that does not exist
+            self.release(pod_name)
+            raise
+
+        # the builder starts the build once its arguments are complete
+        try:
+            os.makedirs(builder_dir, exist_ok=True)
+            with open(os.path.join(builder_dir, 'run.sh.tmp'), 'w') as f:
+                f.write(f'exec /kaniko/executor {" ".join(shlex.quote(arg) for arg in container.args if arg)}\n')
+            os.replace(os.path.join(builder_dir, 'run.sh.tmp'), os.path.join(builder_dir, 'run.sh'))
+        except OSError:
+            api_instance.delete_namespaced_job(job_name, ENVIRONMENT, propagation_policy='Background')
+            self.release(pod_name)
+            raise
+        logger.info(f'Handed {job_name} to builder {pod_name}')
+        return created
+
+    def release(self, pod_name):
+        '''
+        Deletes the builder `pod_name`, its secret and its directory, ignoring the ones that are already gone.
+        '''
+        core_v1 = client.CoreV1Api()
+        for delete, name in ((core_v1.delete_namespaced_pod, pod_name), (core_v1.delete_namespaced_secret, f'{pod_name}-creds')):
+            try:
+                delete(name, ENVIRONMENT)
+            except ApiException as e:
+                if e.status != 404:
+                    logger.error(f'Exception when deleting {name} of builder {pod_name}: {e}')
+        rmtree(os.path.join(self.directory, pod_name), ignore_errors=True)
+
+    def replenish(self):
+        '''
+        Starts builders until `size` of them are idle, and deletes the ones that stopped or exceed `size`, and the
+        directories and secrets of builders that are gone.
+        '''
+        pods = client.CoreV1Api().list_namespaced_pod(ENVIRONMENT, label_selector=BUILDER_POOL_LABEL_KEY).items
+        idle = [pod for pod in pods if pod.metadata.labels[BUILDER_POOL_LABEL_KEY] == 'idle' and not pod.metadata.deletion_timestamp]
+        with self._lock:
+            self._taken &= {pod.metadata.name for pod in idle}
+            idle = [pod for pod in idle if pod.metadata.name not in self._taken]
+
+        stopped = [pod for pod in idle if pod.status and pod.status.phase in ('Succeeded', 'Failed')]
+        excess = sorted((pod for pod in idle if pod not in stopped), key=lambda pod: pod.metadata.creation_timestamp)[self.size:]
+        for pod in stopped + excess:
+            client.CoreV1Api().delete_namespaced_pod(pod.metadata.name, ENVIRONMENT)
+
+        for _ in range(self.size - (len(idle) - len(stopped) - len(excess))):
+            # the name is chosen here rather than generated, since the pod spec refers to the builder's secret by it
+            name = f'{K_JOB_NAME}-builder-{secrets.token_hex(4)}'
+            client.CoreV1Api().create_namespaced_pod(ENVIRONMENT, client.V1Pod(
+                metadata=client.V1ObjectMeta(name=name, labels={BUILDER_POOL_LABEL_KEY: 'idle'}),
+                spec=self.pod_spec(name)
+            ))
+        IDLE_BUILDERS.set(sum(1 for pod in idle if pod not in stopped + excess and pod.status and pod.status.phase == 'Running'))
+
+        names = {pod.metadata.name for pod in pods}
+        for name in os.listdir(self.directory):
+            if name not in names:
+                rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        for secret in client.CoreV1Api().list_namespaced_secret(ENVIRONMENT, label_selector=BUILDER_POOL_LABEL_KEY).items:
+            if secret.metadata.name[:-len('-creds')] not in names:
+                self.release(secret.metadata.name[:-len('-creds')])
+
+    def run(self):
+        '''
+        Keeps the pool replenished for the lifetime of the service, right after builders were handed out and otherwise every 30 seconds.
+        '''
+        while True:
+            try:
+                self.replenish()
+            except Exception as e:
+                logger.error(f'Exception when replenishing the builder pool: {e}')
+            self._wake.wait(30)
+            self._wake.clear()
+
+def get_memory_mi(quantity):
+    '''
+    This utility method converts a memory quantity in `Mi` or `Gi`, as used for the kaniko containers, to MiB.
+
     Args:
-        random_name (str): random id generated during build process that is used to ensure that all jobs are uniquely named and traceable
+        quantity (str): memory quantity, e.g. `2304Mi`
+
+    Returns:
+        int: memory in MiB
+    '''
+    return int(float(quantity[:-len('Mi')]) * (1024 if quantity.endswith('Gi') else 1))
+
+def get_job_data(job, logs=None):
+    '''
+    This utility method turns a Kaniko job object into the job data returned by the `/job/{job_id}` endpoint.
+
+    Args:
+        job (V1Job): Chassis job object read from the Kubernetes API
+        logs (str): log of the job if it failed and its log was already read, e.g. by `complete_job`
+
+    Returns:
+        Dict: Dictionary containing the result, status, timing breakdown and trace id of the job, and its logs if it failed
+    '''
+    annotations = job.metadata.annotations or {}
+    result = annotations.get('result')
+    result = json.loads(result) if result else None
+    status = job.status.to_dict()
+
+    # times of the request to `/build` recorded by its `Trace`, followed by those of the job
+    trace = json.loads(annotations.get('trace') or '{}')
+    timing = dict(trace.get('timing') or {}, **get_job_timings(job, JOB_INDEX.pod(job.metadata.name)))
+
+    job_data = {
+        'result': result,
+        'status': status,
+        'timing': timing,
+        'trace_id': trace.get('trace_id')
+    }
+    if status['failed']:
+        job_data['logs'] = logs if logs is not None else read_job_logs(job.metadata.name)
+
+    return job_data
+
+def complete_job(job):
+    '''
+    This utility method runs the completion actions of a finished job exactly once: it observes its build times in the
+    metrics and exports them as spans of the trace of its request, adds the size of its image and the statistics of the
+    package cache to its result,
+    records the pushed image in the build index, a freshly
+    built environment stage in the environment cache and the outcome in the resource history, completes its matrix build
+    if it was the last job of it, deletes the secret containing the user's registry credentials, and posts the final job status to the webhook and to those of the requests attached to the job. The actions were stored in the `completion`
+    annotation of the job by `run_kaniko`, and the job is annotated as `reconciled` afterwards so that they survive and
+    are not repeated across service restarts.
+
+    Args:
+        job (V1Job): finished Chassis job object
 
     Returns:
         None
     '''
-    v1 = client.CoreV1Api()
+    job_id = job.metadata.name
+    annotations = job.metadata.annotations or {}
+    completion = json.loads(annotations.get('completion') or '{}')
+    random_name = job_id.split(f'{K_JOB_NAME}-')[1]
+
+    status = get_job_data(job)
+    JOB_INDEX.set_logs(job_id, status.get('logs'))
+    pod = read_build_pod(job_id)
+    failure_reason = get_job_failure_reason(job, pod) if status['status']['failed'] else None
+    observe_build_metrics(get_job_timings(job, pod), completion.get('labels'), failure_reason)
+
+    # the build continues the trace of its request to `/build`
+    trace = json.loads(annotations.get('trace') or 'null')
+    headers = {}
+    if trace:
+        spans = get_job_spans(job, pod, trace['span_id'])
+        export_spans(trace['trace_id'], spans)
+        headers['traceparent'] = f'00-{trace["trace_id"]}-{spans[0]["span_id"]}-01'
+    if completion.get('resources'):
+        resources = completion['resources']
+        record_build_resources(resources['key'], resources['memory'], bool(status['status']['succeeded']),
+                               failure_reason == 'OOMKilled')
+
+    # the result is kept in the job annotations, which `/job/{job_id}` serves
+    result = dict(status['result'] or {})
+    if status['status']['succeeded']:
+        result['image_size'] = get_image_size(job_id, random_name, completion.get('destination'))
+        if result['image_size'] is not None:
+            labels = completion.get('labels') or {label: 'unknown' for label in BUILD_METRIC_LABELS}
+            IMAGE_BYTES.labels(**labels, slim=str(completion.get('slim', False)).lower()).observe(result['image_size'])
+    package_cache = get_package_cache_stats(pod) if KANIKO_CACHE_CLAIM_NAME else None
+    if package_cache:
+        result['package_cache'] = package_cache
+        for manager, counts in package_cache.items():
+            PACKAGE_CACHE_PACKAGES.labels(manager, 'true').inc(counts['hits'])
+            PACKAGE_CACHE_PACKAGES.labels(manager, 'false').inc(counts['misses'])
+    status['result'] = result or None
+
+    if status['status']['succeeded']:
+        if PV_MODE:
+            # compute the checksum served with the tar downloads now, so that the first download does not wait for it
+            threading.Thread(target=get_tar_checksum, args=(f'{DATA_DIR}/kaniko_image-{random_name}.tar',), daemon=True).start()
+        if completion.get('fingerprint'):
+            record_build(completion['fingerprint'], job_id, completion['destination'], status)
+        if completion.get('env_image'):
+            record_env_image(completion['env_image'])
+
+    # the job's own group and the groups of the matrix builds attached to it by `claim_build`
+    groups = [completion.get('group')] + [v for k, v in annotations.items() if k.startswith(GROUP_ANNOTATION_PREFIX)]
+    groups = list(dict.fromkeys(filter(None, groups)))
+    if groups:
+        # the credentials secret of the job is still there to publish the manifest lists with
+        group_registry_auth = get_job_registry_auth(random_name, completion['destination'])
+        for group_id in groups:
+            complete_job_group(group_id, group_registry_auth)
+
+    # and the copy of the credentials in the secret of the builder the job was handed to, if any
+    for secret_name in filter(None, [f'{random_name}-creds', annotations.get('builder') and f'{annotations["builder"]}-creds']):
+        try:
+            client.CoreV1Api().delete_namespaced_secret(namespace=ENVIRONMENT,name=secret_name)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+
+    # webhooks of the job and of the identical builds attached to it by `claim_build`
+    webhooks = [completion.get('webhook')] + [v for k, v in annotations.items() if k.startswith(WEBHOOK_ANNOTATION_PREFIX)]
+    for webhook in dict.fromkeys(filter(None, webhooks)):
+        try:
+            requests.post(webhook,json=status,headers=headers,timeout=REQUEST_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.error(f'Exception when posting status of {job_id} to webhook: {e}')
+
+    reconciled = {'reconciled': 'true', 'result': json.dumps(result)} if result else {'reconciled': 'true'}
+    client.BatchV1Api().patch_namespaced_job(job_id, ENVIRONMENT, {'metadata': {'annotations': reconciled}})
+    logger.info(f'Job {job_id} {"succeeded" if status["status"]["succeeded"] else "failed"}')
+
+def reconcile_job(job):
+    '''
+    This utility method runs the completion actions of a job seen by `reconcile_jobs` if it has finished and has not been reconciled yet.
+
+    Args:
+        job (V1Job): Chassis job object
+
+    Returns:
+        None
+    '''
+    finished = job.status and (job.status.succeeded or job.status.failed)
+    if not finished or (job.metadata.annotations or {}).get('reconciled'):
+        return
+
+    try:
+        complete_job(job)
+    except Exception as e:
+        logger.error(f'Exception when completing job {job.metadata.name}: {e}')
+
+class JobIndex:
+    '''
+    In-memory index of the Chassis build jobs and their pods, kept in sync with the cluster by the list+watch loops of
+    `reconcile_jobs` and `watch_build_pods` so that `/job/{job_id}` and `/job/{job_id}/events` are served without calling
+    the Kubernetes API.
+
+    The job data of an entry is computed once, on its first read, and kept until the job changes. The log of a failed
+    job, which its data includes, is kept across changes: `complete_job` hands it over when it completes the job, so that
+    reads do not call the Kubernetes API for it. Every change wakes up the callers of `wait_for_phase`.
+
+    Attributes:
+        synced (bool): whether the index reflects the last list of the jobs and the watch following it
+    '''
+    def __init__(self):
+        self.synced = False
+        self._jobs = {}
+        self._pods = {}
+        self._pushing = {}
+        self._logs = {}
+        self._queue = None
+        self._changed = threading.Condition()
+
+    def replace(self, jobs):
+        with self._changed:
+            self._jobs = {job.metadata.name: {'job': job, 'data': None, 'lock': threading.Lock()} for job in jobs}
+            self._queue = None
+            self.synced = True
+            self._changed.notify_all()
+
+    def update(self, job):
+        with self._changed:
+            entry = self._jobs.get(job.metadata.name)
+            if not entry or entry['job'].metadata.resource_version != job.metadata.resource_version:
+                self._jobs[job.metadata.name] = {'job': job, 'data': None, 'lock': threading.Lock()}
+                self._queue = None
+                self._changed.notify_all()
+
+    def delete(self, job_id):
+        with self._changed:
+            self._jobs.pop(job_id, None)
+            self._queue = None
+            self._pods.pop(job_id, None)
+            self._pushing.pop(job_id, None)
+            self._logs.pop(job_id, None)
+            self._changed.notify_all()
+
+    def replace_pods(self, pods):
+        with self._changed:
+            self._pods = {pod.metadata.labels['job-name']: pod for pod in pods}
+            self._changed.notify_all()
+
+    def update_pod(self, pod):
+        with self._changed:
+            self._pods[pod.metadata.labels['job-name']] = pod
+            self._changed.notify_all()
+
+    def delete_pod(self, pod):
+        with self._changed:
+            self._pods.pop(pod.metadata.labels['job-name'], None)
+            self._changed.notify_all()
+
+    def set_pushing(self, job_id):
+        with self._changed:
+            self._pushing.setdefault(job_id, time.time())
+            self._changed.notify_all()
+
+    def pushing_since(self, job_id):
+        '''
+        Returns when kaniko started pushing the image of job `job_id`, or None if it has not been seen pushing.
+        '''
+        pushing = self._pushing.get(job_id)
+        return datetime.fromtimestamp(pushing, timezone.utc) if pushing else None
+
+    def job(self, job_id):
+        '''
+        Returns the job object of job `job_id`, or None if it is not in the index.
+        '''
+        entry = self._jobs.get(job_id)
+        return entry['job'] if entry else None
+
+    def jobs(self):
+        '''
+        Returns the job objects in the index.
+        '''
+        with self._changed:
+            return [entry['job'] for entry in self._jobs.values()]
+
+    def queue_position(self, job_id):
+        '''
+        Returns the 1-based position of job `job_id` in the build queue (see `get_build_queue`), or None if it is not queued.
+        The queue is ordered once per change of the jobs rather than on every status read.
+        '''
+        queue = self._queue
+        if queue is None:
+            with self._changed:
+                queue = self._queue = {job.metadata.name: i + 1 for i, job in enumerate(get_build_queue(self.jobs()))}
+        return queue.get(job_id)
+
+    def pod(self, job_id):
+        '''
+        Returns the pod of job `job_id`, or None if it is not in the index.
+        '''
+        return self._pods.get(job_id)
+
+    def get(self, job_id):
+        '''
+        Returns the resource version and job data of job `job_id`, or None if it is not in the index.
+        '''
+        entry = self._jobs.get(job_id)
+        if not entry:
+            return None
+        # concurrent reads of an entry compute its data once, and a change replaces the entry rather than its data
+        with entry['lock']:
+            if entry['data'] is None:
+                entry['data'] = get_job_data(entry['job'], self._logs.get(job_id))
+                self.set_logs(job_id, entry['data'].get('logs'))
+        return entry['job'].metadata.resource_version, entry['data']
+
+    def set_logs(self, job_id, logs):
+        '''
+        Keeps the log of the failed job `job_id` for the job data of its later versions.
+        '''
+        with self._changed:
+            if logs is not None and job_id in self._jobs:
+                self._logs[job_id] = logs
+
+    def phase(self, job_id):
+        '''
+        Returns the phase of job `job_id` (see `get_job_phase`), or None if it is not in the index.
+        '''
+        entry = self._jobs.get(job_id)
+        if not entry:
+            return None
+        return get_job_phase(entry['job'], self._pods.get(job_id), job_id in self._pushing)
+
+    def wait_for_phase(self, job_id, phase, timeout):
+        '''
+        Blocks until the phase of job `job_id` differs from `phase` or `timeout` seconds have passed, and returns its phase.
+        '''
+        with self._changed:
+            self._changed.wait_for(lambda: self.phase(job_id) != phase, timeout)
+            return self.phase(job_id)
+
+def get_job_phase(job, pod, pushing):
+    '''
+    This utility method summarizes the state of a Kaniko job and its pod in one of the phases streamed by `/job/{job_id}/events`:
+    `queued` until the pod is scheduled to a node, `scheduled` while the kaniko image is pulled, `building` once a kaniko
+    container runs, `pushing` once kaniko logged that it pushes the image, and `succeeded` or `failed` when the job finished.
+
+    Args:
+        job (V1Job): Chassis job object
+        pod (V1Pod): pod of the job, or None if it has not been created yet
+        pushing (bool): whether kaniko started pushing the image
+
+    Returns:
+        str: phase of the job
+    '''
+    if job.status.succeeded:
+        return 'succeeded'
+    if job.status.failed:
+        return 'failed'
+
+    conditions = (pod.status.conditions or []) if pod and pod.status else []
+    if not any(condition.type == 'PodScheduled' and condition.status == 'True' for condition in conditions):
+        return 'queued'
+
+    statuses = (pod.status.init_container_statuses or []) + (pod.status.container_statuses or [])
+    if any(status.state.running or status.state.terminated for status in statuses):
+        return 'pushing' if pushing else 'building'
+
+    return 'scheduled'
+
+def list_and_watch(list_func, on_list, on_event, on_error=None):
+    '''
+    This utility method keeps a local view of the Chassis labelled objects returned by `list_func` in sync for the lifetime of the service.
+    It lists the objects and then watches them for changes, listing them again whenever the watch cannot be resumed.
+
+    Args:
+        list_func (function): namespaced list method of a Kubernetes API client, e.g. `BatchV1Api.list_namespaced_job`
+        on_list (function): called with the listed objects
+        on_event (function): called with the type and object of every watch event
+        on_error (function): called when the view is out of sync until the next list
+
+    Returns:
+        None
+    '''
+    resource_version = None
     while True:
-        status = get_job_status(f'{K_JOB_NAME}-{random_name}')
-        if status['status']['failed'] or status['status']['succeeded']:
-            v1.delete_namespaced_secret(namespace=ENVIRONMENT,name=f'{random_name}-creds')
+        try:
+            if resource_version is None:
+                objects = list_func(ENVIRONMENT, label_selector=JOB_LABEL_SELECTOR)
+                on_list(objects.items)
+                resource_version = objects.metadata.resource_version
+
+            w = watch.Watch()
+            for event in w.stream(list_func, ENVIRONMENT, label_selector=JOB_LABEL_SELECTOR,
+                                  resource_version=resource_version, timeout_seconds=300):
+                on_event(event['type'], event['object'])
+            resource_version = w.resource_version or resource_version
+        except Exception as e:
+            if not (isinstance(e, ApiException) and e.status == 410):
+                logger.error(f'Exception when watching {list_func.__name__}: {e}')
+                time.sleep(5)
+            if on_error:
+                on_error()
+            resource_version = None
+
+def reconcile_jobs():
+    '''
+    This method runs for the lifetime of the service in a single background thread and completes every Chassis job from one watch stream.
+    It completes the jobs that finished while nobody was watching when they are listed, and every other job when the watch
+    reports that it finished. Every change is also applied to `JOB_INDEX` and lets `admit_builds` admit queued builds.
 
-            if webhook:
-                requests.post(webhook,json=status)
+    Args:
+        None (None)
 
-            break
-        time.sleep(5)
+    Returns:
+        None
+    '''
+    def on_list(jobs):
+        JOB_INDEX.replace(jobs)
+        for job in jobs:
+            reconcile_job(job)
+        admit_builds()
+
+    def on_event(event_type, job):
+        if event_type == 'DELETED':
+            JOB_INDEX.delete(job.metadata.name)
+        elif event_type in ('ADDED', 'MODIFIED'):
+            JOB_INDEX.update(job)
+            reconcile_job(job)
+        admit_builds()
+
+    def on_error():
+        JOB_INDEX.synced = False
+
+    list_and_watch(client.BatchV1Api().list_namespaced_job, on_list, on_event, on_error)
+
+def watch_build_pods():
+    '''
+    This method runs for the lifetime of the service in a single background thread and applies every change of the build
+    pods to `JOB_INDEX`. Kaniko does not report pushing in the pod status, so the running kaniko containers are handed to
+    a single `poll_pushes` thread, which reads their logs until the push starts.
+
+    Args:
+        None (None)
+
+    Returns:
+        None
+    '''
+    running = {}
+    lock = threading.Lock()
+
+    def follow(pod):
+        statuses = (pod.status.container_statuses or []) if pod.status else []
+        state = next((status.state.running for status in statuses if status.name == 'kaniko' and status.state.running), None)
+        with lock:
+            if not state:
+                running.pop(pod.metadata.name, None)
+            elif pod.metadata.name not in running:
+                running[pod.metadata.name] = {'job_id': pod.metadata.labels['job-name'], 'pushing': False,
+                                              'since': state.started_at.timestamp() if state.started_at else time.time()}
+
+    def on_list(pods):
+        JOB_INDEX.replace_pods(pods)
+        with lock:
+            for pod_name in set(running) - {pod.metadata.name for pod in pods}:
+                running.pop(pod_name)
+        for pod in pods:
+            follow(pod)
+
+    def on_event(event_type, pod):
+        if event_type == 'DELETED':
+            JOB_INDEX.delete_pod(pod)
+            with lock:
+                running.pop(pod.metadata.name, None)
+        elif event_type in ('ADDED', 'MODIFIED'):
+            JOB_INDEX.update_pod(pod)
+            follow(pod)
+
+    threading.Thread(target=poll_pushes, args=(running, lock), daemon=True).start()
+    list_and_watch(client.CoreV1Api().list_namespaced_pod, on_list, on_event)
+
+def poll_pushes(running, lock):
+    '''
+    This method runs for the lifetime of the service in a single background thread. Every `PUSH_POLL_SECONDS`, it reads
+    the log lines the kaniko container of every running build wrote since the last time, and marks the job as pushing in
+    `JOB_INDEX` once kaniko starts pushing the image. The log reads are short requests bounded by `REQUEST_TIMEOUT_SECONDS`,
+    so no connection is held open per build.
+
+    Args:
+        running (Dict): `job_id`, `pushing` flag and last read time `since` of the running kaniko containers by pod name, kept by `watch_build_pods`
+        lock (threading.Lock): lock guarding `running`
+
+    Returns:
+        None
+    '''
+    while True:
+        time.sleep(PUSH_POLL_SECONDS)
+        with lock:
+            pods = [(pod_name, dict(entry)) for pod_name, entry in running.items() if not entry['pushing']]
+
+        for pod_name, entry in pods:
+            read_at = time.time()
+            try:
+                log = client.CoreV1Api().read_namespaced_pod_log(pod_name, ENVIRONMENT, container='kaniko',
+                                                                 since_seconds=int(read_at - entry['since']) + 1,
+                                                                 _request_timeout=REQUEST_TIMEOUT_SECONDS)
+            except Exception as e:
+                logger.error(f'Exception when reading the build log of {entry["job_id"]}: {e}')
+                continue
+
+            with lock:
+                if pod_name not in running:
+                    continue
+                running[pod_name]['since'] = read_at
+                if 'Pushing image to' in log:
+                    running[pod_name]['pushing'] = True
+                    JOB_INDEX.set_pushing(entry['job_id'])
+
+def is_queued_build(job):
+    '''
+    This utility method returns whether a Kaniko job waits in the build queue, i.e. was created suspended by `run_kaniko`
+    and has not been resumed by `admit_builds` yet.
+
+    Args:
+        job (V1Job): Chassis job object
+
+    Returns:
+        bool: whether the job is queued
+    '''
+    finished = job.status and (job.status.succeeded or job.status.failed)
+    return (job.metadata.annotations or {}).get('queued') == 'true' and not finished
+
+def count_running_builds(jobs):
+    '''
+    This utility method counts the Kaniko jobs that have been admitted and have not finished yet.
+
+    Args:
+        jobs (list): Chassis job objects
+
+    Returns:
+        int: number of running builds
+    '''
+    return sum(1 for job in jobs
+               if not (job.status and (job.status.succeeded or job.status.failed)) and not is_queued_build(job))
+
+def get_build_queue(jobs):
+    '''
+    This utility method orders the queued Kaniko jobs the way `admit_builds` admits them: higher priority first, then
+    the job of the caller with the fewest running and already admitted builds, then the oldest job. This way one caller's
+    burst of publishes does not hold back the builds of other callers with the same priority.
+
+    Args:
+        jobs (list): Chassis job objects
+
+    Returns:
+        list: queued job objects in admission order
+    '''
+    def caller(job):
+        return (job.metadata.annotations or {}).get('caller', '')
+
+    def priority(job):
+        return int((job.metadata.annotations or {}).get('priority') or 0)
+
+    running = {}
+    for job in jobs:
+        if not (job.status and (job.status.succeeded or job.status.failed)) and not is_queued_build(job):
+            running[caller(job)] = running.get(caller(job), 0) + 1
+
+    queued = [job for job in jobs if is_queued_build(job)]
+    order = []
+    while queued:
+        job = min(queued, key=lambda job: (-priority(job), running.get(caller(job), 0), job.metadata.creation_timestamp))
+        queued.remove(job)
+        order.append(job)
+        running[caller(job)] = running.get(caller(job), 0) + 1
+
+    return order
+
+def admit_builds():
+    '''
+    This utility method resumes queued Kaniko jobs in the order of `get_build_queue` while fewer than
+    `MAX_CONCURRENT_BUILDS` builds are running. It is run by `reconcile_jobs` whenever a job changes.
+
+    Args:
+        None (None)
+
+    Returns:
+        None
+    '''
+    batch_v1 = client.BatchV1Api()
+    with BUILD_QUEUE_LOCK:
+        jobs = JOB_INDEX.jobs()
+        queue = get_build_queue(jobs)
+        if MAX_CONCURRENT_BUILDS > 0:
+            queue = queue[:max(MAX_CONCURRENT_BUILDS - count_running_builds(jobs), 0)]
+
+        for job in queue:
+            try:
+                admitted = batch_v1.patch_namespaced_job(job.metadata.name, ENVIRONMENT, {
+                    'spec': {'suspend': False},
+                    'metadata': {'annotations': {'queued': 'false'}}
+                })
+                JOB_INDEX.update(admitted)
+                logger.info(f'Admitted queued job {job.metadata.name}')
+            except ApiException as e:
+                logger.error(f'Exception when admitting job {job.metadata.name}: {e}')
 
 def run_kaniko(
         image_name,
@@ -473,12 +1459,32 @@ def run_kaniko(
         arm64=False,
         context_uri=None,
         metadata_path=None,
-        webhook=None
+        webhook=None,
+        fingerprint=None,
+        conda_env_dir=None,
+        env_image=None,
+        build_env=False,
+        priority=0,
+        caller=None,
+        resources=None,
+        resource_key=None,
+        group_id=None,
+        context_name=None,
+        build_key=None,
+        trace=None,
+        slim=False
 ):
     '''
     This utility method creates and launches a job object that uses Kaniko to create the desired image during the `/build` process.
     
     It passes its arguments through to the `create_job_object` method and uses the output job to create chassis job. See `chassis_job_object` method for parameter details. 
+    The job is completed by the `reconcile_jobs` background thread: if a build `fingerprint` is given and the image is published,
+    the pushed digest is recorded in the build index once the job succeeds. Likewise, an environment stage built by the job is added to the environment cache.
+    If `MAX_CONCURRENT_BUILDS` builds are already running, the job is created suspended and queued with its `priority` and
+    `caller` until `admit_builds` admits it. Jobs of a matrix build belong to the job group `group_id`. The `build_key` of
+    `get_build_key` lets identical builds requested while the job runs attach to it. The job carries the context of the
+    request's `trace` until `complete_job` continues it. CPU builds that are not queued are handed to an idle builder of
+    `WARM_POOL` if there is one.
     '''
     if CHASSIS_DEV:
         # if you are doing local dev you need to point at the local kubernetes cluster with your config file
@@ -502,112 +1508,437 @@ def run_kaniko(
             gpu,
             arm64,
             context_uri,
-            metadata_path
+            metadata_path,
+            conda_env_dir,
+            env_image,
+            build_env,
+            resources,
+            context_name,
+            slim
         )
-        create_job(batch_v1, job)
-
-        loop = asyncio.new_event_loop()
-        threading.Thread(target=loop.run_forever).start()
-        asyncio.run_coroutine_threadsafe(clean_up(random_name,webhook),loop)
+        # completion actions run by `reconcile_jobs` once the job finishes
+        job.metadata.annotations = {'completion': json.dumps({
+            'webhook': webhook,
+            'fingerprint': fingerprint if publish else None,
+            'destination': get_image_destination(image_name) if publish else None,
+            'env_image': env_image if build_env else None,
+            'resources': {'key': resource_key, 'memory': int(resources['memory'][:-len('Mi')]) * 1024 ** 2} if resources else None,
+            'group': group_id,
+            'labels': {'flavour': module_name, 'gpu': str(bool(gpu)).lower(), 'arm64': str(bool(arm64)).lower()},
+            'slim': bool(slim)
+        }), 'priority': str(priority), 'caller': caller or '', 'build-key': build_key or '',
+            # artifacts on the shared volume the job reads, which the janitor keeps until it finishes
+            'context': context_name or random_name, 'conda-env-dir': conda_env_dir or ''}
+        if trace:
+            job.metadata.annotations['trace'] = json.dumps(trace.context())
+
+        with BUILD_QUEUE_LOCK:
+            # builds wait in the queue until the job index is in sync and knows how many are running
+            queued = MAX_CONCURRENT_BUILDS > 0 and (not JOB_INDEX.synced or
+                                                    count_running_builds(JOB_INDEX.jobs()) >= MAX_CONCURRENT_BUILDS)
+            job.metadata.annotations['queued'] = 'true' if queued else 'false'
+            # CPU builds that start right away skip scheduling their pod if there is an idle builder
+            handed_off = None
+            if WARM_POOL and not (queued or gpu or arm64 or build_env or group_id):
+                handed_off = WARM_POOL.hand_off(batch_v1, job)
+            JOB_INDEX.update(handed_off or create_job(batch_v1, job, suspend=queued))
 
     except Exception as err:
         logger.error(str(err))
+        BUILD_FAILURES.labels('job_creation').inc()
         return str(err)
 
     return False
 
-def unzip_model(model, module_name, random_name):
+class StreamingZipExtractor:
+    '''
+    Writable sink that extracts a zip archive while it is being received.
+
+    Entries are decoded from their local file headers as the bytes arrive and written straight into `dst`,
+    so neither the archive nor a whole entry is ever held in memory or copied to disk first.
+    Stored entries and deflated entries (with or without a trailing data descriptor) are supported,
+    which covers archives written by Python's `zipfile` and the Chassis SDK.
+
+    Attributes:
+        dst (str): directory the archive is extracted into
+        size (int): number of archive bytes received so far
+        filenames (list): names of the extracted entries
+        seconds (float): time spent extracting so far
+    '''
+    LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+    LOCAL_HEADER_SIGNATURE = 0x04034b50
+    CENTRAL_DIRECTORY_SIGNATURES = (0x02014b50, 0x06054b50, 0x06064b50)
+    DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+
+    def __init__(self, dst):
+        self.dst = dst
+        self.size = 0
+        self.filenames = []
+        self.seconds = 0
+        self._buffer = bytearray()
+        self._entry = None
+        self._done = False
+        os.makedirs(dst, exist_ok=True)
+
+    def write(self, data):
+        self.size += len(data)
+        if not self._done:
+            start = time.perf_counter()
+            self._buffer += data
+            while not self._done and self._advance():
+                pass
+            self.seconds += time.perf_counter() - start
+        return len(data)
+
+    def close(self):
+        # an archive that ends before its central directory was cut off, even right after an entry
+        if not self._done and (self._entry or self._buffer or self.filenames):
+            raise zipfile.BadZipFile('Truncated zip archive')
+        if not self.filenames:
+            raise zipfile.BadZipFile('File is not a zip file or is empty')
+
+    def _advance(self):
+        '''Processes as much of the buffer as possible, returns False once more data is needed.'''
+        if self._entry:
+            return self._feed_entry()
+
+        buffer = self._buffer
+        if len(buffer) < 4:
+            return False
+        signature = struct.unpack_from('<I', buffer)[0]
+        if signature in self.CENTRAL_DIRECTORY_SIGNATURES:
+            # every entry has been extracted, the central directory only repeats what the local headers said
+            self._done = True
+            self._buffer = bytearray()
+            return False
+        if signature != self.LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile('Bad magic number for file header')
+        if len(buffer) < self.LOCAL_HEADER.size:
+            return False
+
+        _, _, flags, method, _, _, crc, compressed_size, file_size, name_length, extra_length = self.LOCAL_HEADER.unpack_from(buffer)
+        header_size = self.LOCAL_HEADER.size + name_length + extra_length
+        if len(buffer) < header_size:
+            return False
+        name = bytes(buffer[self.LOCAL_HEADER.size:self.LOCAL_HEADER.size + name_length]).decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = bytes(buffer[self.LOCAL_HEADER.size + name_length:header_size])
+        del buffer[:header_size]
+
+        self._start_entry(name, flags, method, crc, compressed_size, file_size, extra)
+        return True
+
+    def _start_entry(self, name, flags, method, crc, compressed_size, file_size, extra):
+        if flags & 0x1:
+            raise zipfile.BadZipFile(f'{name} is encrypted')
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise zipfile.BadZipFile(f'{name} uses an unsupported compression method ({method})')
+
+        zip64 = False
+        if 0xFFFFFFFF in (compressed_size, file_size):
+            # sizes that do not fit in 32 bits are stored in the zip64 extra field, in this order
+            zip64 = True
+            offset = 0
+            while offset + 4 <= len(extra):
+                header_id, data_size = struct.unpack_from('<HH', extra, offset)
+                if header_id == 0x0001:
+                    values = iter(struct.unpack_from(f'<{data_size // 8}Q', extra, offset + 4))
+                    if file_size == 0xFFFFFFFF:
+                        file_size = next(values)
+                    if compressed_size == 0xFFFFFFFF:
+                        compressed_size = next(values)
+                    break
+                offset += 4 + data_size
+
+        has_descriptor = bool(flags & 0x8)
+        if has_descriptor and method == zipfile.ZIP_STORED:
+            raise zipfile.BadZipFile(f'{name} is stored with a data descriptor, which cannot be streamed')
+
+        # same sanitization as zipfile.ZipFile.extract
+        arcname = os.path.splitdrive(name.replace('/', os.path.sep))[1]
+        arcname = os.path.sep.join(part for part in arcname.split(os.path.sep) if part not in ('', os.path.curdir, os.path.pardir))
+        path = os.path.join(self.dst, arcname)
+
+        if name.endswith('/'):
+            os.makedirs(path, exist_ok=True)
+            output = None
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            output = open(path, 'wb')
+            self.filenames.append(arcname.replace(os.path.sep, '/'))
+
+        self._entry = {
+            'name': name,
+            'output': output,
+            'crc': 0,
+            'expected_crc': None if has_descriptor else crc,
+            'remaining': None if has_descriptor else compressed_size,
+            'zip64': zip64,
+            'decompressor': zlib.decompressobj(-zlib.MAX_WBITS) if method == zipfile.ZIP_DEFLATED else None
+        }
+
+    def _feed_entry(self):
+        entry = self._entry
+        buffer = self._buffer
+
+        if entry['remaining'] is not None:
+            chunk = bytes(buffer[:entry['remaining']])
+            del buffer[:len(chunk)]
+            entry['remaining'] -= len(chunk)
+            if entry['decompressor']:
+                self._inflate(chunk)
+            else:
+                self._write_output(chunk)
+            if entry['remaining']:
+                return False
+            self._finish_entry()
+            return True
+
+        # deflated entry followed by a data descriptor: the end of the deflate stream marks the end of the data
+        decompressor = entry['decompressor']
+        if not decompressor.eof:
+            chunk = bytes(buffer)
+            buffer.clear()
+            buffer += self._inflate(chunk)
+            if not decompressor.eof:
+                return False
+
+        if len(buffer) < 4:
+            return False
+        has_signature = struct.unpack_from('<I', buffer)[0] == self.DATA_DESCRIPTOR_SIGNATURE
+        descriptor_size = (4 if has_signature else 0) + 4 + (16 if entry['zip64'] else 8)
+        if len(buffer) < descriptor_size:
+            return False
+        entry['expected_crc'] = struct.unpack_from('<I', buffer, 4 if has_signature else 0)[0]
+        del buffer[:descriptor_size]
+        self._finish_entry()
+        return True
+
+    def _inflate(self, data):
+        '''Decompresses `data` in bounded pieces and returns whatever follows the end of the deflate stream.'''
+        decompressor = self._entry['decompressor']
+        while data and not decompressor.eof:
+            self._write_output(decompressor.decompress(data, 1024 * 1024))
+            data = decompressor.unconsumed_tail
+        return decompressor.unused_data if decompressor.eof else b''
+
+    def _write_output(self, data):
+        if data and self._entry['output']:
+            self._entry['output'].write(data)
+            self._entry['crc'] = zlib.crc32(data, self._entry['crc'])
+
+    def _finish_entry(self):
+        entry = self._entry
+        if entry['decompressor'] and not entry['decompressor'].eof:
+            self._write_output(entry['decompressor'].flush())
+        self._entry = None
+        if entry['output']:
+            entry['output'].close()
+            if entry['crc'] != entry['expected_crc']:
+                raise zipfile.BadZipFile(f"Bad CRC-32 for file {entry['name']}")
+
+def ingest_upload(model_dst):
     '''
-    This utility function unzips a tar archive of a container image. It is used in two places:
+    This utility method reads the multipart body of the current request as it arrives from the client. It is used in two places:
 
     * During `/build` process
     * During `/test` process
 
+    The `model` archive is extracted straight into `model_dst` while it is being received (see `StreamingZipExtractor`),
+    so the upload is never saved or copied before extraction. All other parts are small and are kept in spooled temporary files.
+    Raises `ValueError` if the body ends before its closing boundary, e.g. when the client disconnected.
+
     Args:
-        model (str): data returned from `request.files` component of REST call
-        module_name (str): reference module to locate location within service input is saved
-        random_name (str): random id generated during build process that is used to ensure that all jobs are uniquely named and traceable
+        model_dst (str): directory the model archive is extracted into
 
     Returns:
-        filepath: location of unzipped model container
+        Dict: received parts keyed by field name. `model` maps to the `StreamingZipExtractor` that extracted the archive, other parts to `FileStorage` objects
     '''
-    tmp_dir = tempfile.mkdtemp()
-    path_to_zip_file = f'{tmp_dir}/{model.filename}'
+    _, options = parse_options_header(request.headers.get('Content-Type', ''))
+    boundary = options.get('boundary')
+    if not boundary:
+        raise ValueError('Request body must be multipart/form-data')
 
-    zip_content_dst = f'{DATA_DIR}/flavours/{module_name}/model-{random_name}'
+    decoder = MultipartDecoder(boundary.encode())
+    parts = {}
+    part, sink = None, None
 
-    # if running on windows, zip dst has to be modified for local kubernetes processing
-    # if WINDOWS:
-    # zip_content_dst =
-
-    model.save(path_to_zip_file)
+    while True:
+        chunk = request.stream.read(1024 * 1024)
+        decoder.receive_data(chunk or None)
+
+        event = decoder.next_event()
+        while not isinstance(event, (NeedData, Epilogue)):
+            if isinstance(event, (Field, File)):
+                part = event
+                sink = StreamingZipExtractor(model_dst) if event.name == 'model' else tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+            elif isinstance(event, Data):
+                sink.write(event.data)
+                if not event.more_data:
+                    if part.name == 'model':
+                        sink.close()
+                        parts[part.name] = sink
+                    else:
+                        sink.seek(0)
+                        parts[part.name] = FileStorage(stream=sink, filename=getattr(part, 'filename', None) or part.name, name=part.name)
+            event = decoder.next_event()
+
+        if isinstance(event, Epilogue):
+            break
+        if not chunk:
+            raise ValueError('Truncated multipart body')
 
-    with zipfile.ZipFile(path_to_zip_file, 'r') as zip_ref:
-        zip_ref.extractall(zip_content_dst)
+    return parts
 
-    rmtree(tmp_dir)
+class TarStream:
+    '''
+    Iterator over a gzipped tar archive that is written in a background thread while it is being consumed.
 
-    return zip_content_dst
+    `add_members` is called with a `tarfile.TarFile` opened in stream mode and adds the archive members. The compressed
+    output is handed to the consumer in chunks of `chunk_size` bytes, and at most `max_chunks` chunks are buffered, so the
+    archive never exists on disk or in memory as a whole and compression overlaps with the upload.
 
-@retry(ConnectionError, tries=3, delay=2)
-def upload_context(model, module_name, random_name, metadata_data, dockerfile):
+    Attributes:
+        size (int): number of compressed bytes consumed so far
+    '''
+    def __init__(self, add_members, compresslevel=6, chunk_size=5 * 1024 * 1024, max_chunks=4):
+        self.size = 0
+        self._add_members = add_members
+        self._compresslevel = compresslevel
+        self._chunk_size = chunk_size
+        self._chunks = queue.Queue(maxsize=max_chunks)
+        self._pending = bytearray()
+        self._error = None
+        self._cancelled = False
+
+    def __iter__(self):
+        producer = threading.Thread(target=self._produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                chunk = self._chunks.get()
+                if chunk is None:
+                    break
+                self.size += len(chunk)
+                yield chunk
+        finally:
+            # stops the producer if the consumer gave up half way
+            self._cancelled = True
+            producer.join()
+
+        if self._error:
+            raise self._error
+
+    def write(self, data):
+        self._pending += data
+        if len(self._pending) >= self._chunk_size:
+            self._put(bytes(self._pending))
+            self._pending.clear()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _put(self, chunk):
+        while True:
+            try:
+                self._chunks.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                if self._cancelled:
+                    raise IOError('Consumer of the tar stream went away')
+
+    def _produce(self):
+        try:
+            # gzip level 0 keeps the gzip framing kaniko expects without spending time compressing incompressible weights
+            with gzip.GzipFile(fileobj=self, mode='wb', compresslevel=self._compresslevel, mtime=0) as gz:
+                with tarfile.open(fileobj=gz, mode='w|') as tar:
+                    self._add_members(tar)
+            if self._pending:
+                self._put(bytes(self._pending))
+        except Exception as e:
+            self._error = e
+        finally:
+            if not self._cancelled:
+                self._put(None)
+
+@CONTEXT_UPLOAD_SECONDS.time()
+def upload_context(model_dir, module_name, random_name, metadata_data, dockerfile, env_hash, env_files):
     '''
     This utility method uploads the files required by Kaniko in S3 mode
+
+    The build context archive is generated on the fly (see `TarStream`) and streamed to the context bucket through
+    libcloud's streaming upload, which uses a multipart upload where the provider supports it.
+    Its gzip level is set by `CONTEXT_COMPRESSION_LEVEL`; 0 turns compression off for already compressed model weights.
+    An upload that loses its connection is tried again up to twice, with the archive generated anew.
     
     Args:
-        model (str): data returned from `request.files` component of REST call
+        model_dir (str): directory the model archive was extracted into by `ingest_upload`
         module_name (str): reference module to locate location within service input is saved
         random_name (str): random id generated during build process that is used to ensure that all jobs are uniquely named and traceable
         metadata_data (str): data returned from `request.files` component of REST call
         dockerfile (str): name of dockerfile to use
+        env_hash (str): environment hash returned by `get_conda_env`
+        env_files (dict): dependency files returned by `get_conda_env`
 
     Returns:
         str: location of uploaded context tar archive in S3 
     '''
-    tmp_dir = tempfile.mkdtemp()
-    path_to_zip_file = f'{tmp_dir}/{model.filename}'
-    model.save(path_to_zip_file)
+    def add_members(tar):
+        # The flavour files and the extracted model are added where they are instead of being copied into a staging directory first
+        tar.add('./flavours', arcname='flavours')
+        tar.add(f'./flavours/{module_name}/{dockerfile}', arcname='Dockerfile')
+        tar.add(model_dir, arcname=f'flavours/{module_name}/model-{random_name}')
 
-    dst = f'{tmp_dir}/{"flavours"}'
-    copytree(f'./{"flavours"}', dst)
+        for filename, data in env_files.items():
+            add_tar_member(tar, f'flavours/{module_name}/envs/{env_hash}/{filename}', data)
 
-    copyfile(f'./flavours/{module_name}/{dockerfile}',f'{tmp_dir}/Dockerfile')
-
-    zip_content_dst = f'{tmp_dir}/flavours/{module_name}/model-{random_name}'
-    with zipfile.ZipFile(path_to_zip_file, 'r') as zip_ref:
-        zip_ref.extractall(zip_content_dst)
+        metadata_path = f'flavours/{module_name}/model-{random_name}.yaml'
+        if metadata_data:
+            add_tar_member(tar, metadata_path, metadata_data.read())
+            metadata_data.seek(0)
+        else:
+            # Use the default one if user has not sent its own metadata file.
+            # This way, mlflow/Dockerfile will not throw an error because it
+            # will copy a file that does exist.
+            tar.add(f'flavours/{module_name}/interfaces/modzy/asset_bundle/0.1.0/model.yaml', arcname=metadata_path)
 
-    metadata_path = f'{tmp_dir}/flavours/{module_name}/model-{random_name}.yaml'
-    if metadata_data:
-        metadata_data.save(metadata_path)
-        metadata_data.seek(0)
-    else:
-        # Use the default one if user has not sent its own metadata file.
-        # This way, mlflow/Dockerfile will not throw an error because it
-        # will copy a file that does exist.
-        copyfile(f'flavours/{module_name}/interfaces/modzy/asset_bundle/0.1.0/model.yaml',metadata_path)
+    object_name = f'chassis/context-{random_name}.tar.gz'
+    for attempt in range(3):
+        # the stream is consumed by the upload, so every attempt generates the archive again
+        context = TarStream(add_members, compresslevel=CONTEXT_COMPRESSION_LEVEL)
+        try:
+            storage_driver.upload_object_via_stream(iterator=iter(context),container=container,object_name=object_name)
+            break
+        except ConnectionError as e:
+            logger.warning(f'Connection lost when uploading the build context, attempt {attempt + 1} of 3: {e}')
+            if attempt == 2:
+                return False
+            time.sleep(2)
+        except Exception as e:
+            logger.error(str(e))
+            return False
 
-    tar_tmp_dir = tempfile.mkdtemp()
-    tar_path = f'{tar_tmp_dir}/{"model.tar.gz"}'
+    logger.debug(f'Uploaded {context.size} bytes of build context to {object_name}')
 
-    with tarfile.open(tar_path, "w:gz") as tar:
-        for filename in os.listdir(tmp_dir):
-            filepath = os.path.join(tmp_dir, filename)
-            tar.add(filepath, arcname=filename)
+    return f'{MODE}://{CONTEXT_BUCKET}/{object_name}'
 
-    object_name = f'chassis/context-{random_name}.tar.gz'
-    try:
-        obj = storage_driver.upload_object(file_path=tar_path,container=container,object_name=object_name)
-    except Exception as e:
-        logger.error(str(e))
-        rmtree(tmp_dir)
-        rmtree(tar_tmp_dir)
-        return False
+def add_tar_member(tar, arcname, data):
+    '''
+    This utility method adds a file held in memory to a tar archive.
 
-    rmtree(tmp_dir)
-    rmtree(tar_tmp_dir)
+    Args:
+        tar (tarfile.TarFile): archive opened for writing
+        arcname (str): name of the file within the archive
+        data (bytes): file contents
 
-    return f'{MODE}://{CONTEXT_BUCKET}/{object_name}'
+    Returns:
+        None
+    '''
+    info = tarfile.TarInfo(arcname)
+    info.size = len(data)
+    info.mode = 0o644
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
 
 def extract_metadata(metadata_data, module_name, random_name):
     '''
@@ -634,62 +1965,1458 @@ def extract_metadata(metadata_data, module_name, random_name):
 
     return metadata_path
 
-def get_job_status(job_id):
+def get_build_fingerprint(model_dir, metadata_data, module_name, model_name, dockerfile, slim=False):
     '''
-    This method is run by the `/job/{job_id}` endpoint.
-    Based on a GET request, it retrieves the status of the Kaniko job and the results if the job has completed.
+    This utility method computes the content hash of everything that determines the output of a `/build` job:
+    the files of the model archive (including `conda.yaml`), the chosen Dockerfile, the model metadata and the model name.
+
+    Only file names and contents are hashed, and the volatile `utc_time_created`/`model_uuid` fields that MLflow writes
+    into `MLmodel` are ignored, so that re-saving the same model produces the same fingerprint.
 
     Args:
-        job_id (str): valid Chassis job identifier, generated by `create_job` method
+        model_dir (str): directory the model archive was extracted into by `ingest_upload`
+        metadata_data (str): data returned from `request.files` component of REST call
+        module_name (str): reference module to locate location within service input is saved
+        model_name (str): name of model to package
+        dockerfile (str): name of dockerfile to use
+        slim (bool): whether the image is built on the slim runtime stage
 
     Returns:
-        Dict: Dictionary containing corresponding job data of job `job_id` 
+        str: hex digest identifying the build inputs
     '''
-    if CHASSIS_DEV:
-        # if you are doing local dev you need to point at the local kubernetes cluster with your config file
-        kubefile = os.getenv("CHASSIS_KUBECONFIG")
-        config.load_kube_config(kubefile)
-    else:
-        # if the service is running inside a cluster during production then the config can be inherited
-        config.load_incluster_config()
+    fingerprint = hashlib.sha256()
+    fingerprint.update(f'{CHASSIS_VERSION}\0{module_name}\0{model_name}\0'.encode())
+    if slim:
+        fingerprint.update(b'slim\0')
+
+    with open(f'./flavours/{module_name}/{dockerfile}', 'rb') as f:
+        fingerprint.update(f.read())
+
+    filenames = sorted(os.path.relpath(os.path.join(root, filename), model_dir).replace(os.path.sep, '/')
+                       for root, _, files in os.walk(model_dir) for filename in files)
+    for filename in filenames:
+        fingerprint.update(f'\0{filename}\0'.encode())
+        with open(os.path.join(model_dir, filename), 'rb') as f:
+            if os.path.basename(filename) == 'MLmodel':
+                mlmodel = yaml.safe_load(f) or {}
+                mlmodel.pop('utc_time_created', None)
+                mlmodel.pop('model_uuid', None)
+                fingerprint.update(json.dumps(mlmodel, sort_keys=True, default=str).encode())
+                continue
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                fingerprint.update(chunk)
 
-    batch_v1 = client.BatchV1Api()
+    if metadata_data:
+        fingerprint.update(b'\0metadata\0')
+        fingerprint.update(metadata_data.read())
+        metadata_data.seek(0)
 
-    try:
-        job = batch_v1.read_namespaced_job(job_id, ENVIRONMENT)
+    return fingerprint.hexdigest()
 
-        annotations = job.metadata.annotations or {}
-        result = annotations.get('result')
-        result = json.loads(result) if result else None
-        status = job.status.to_dict()
+def read_index_record(index, key):
+    '''
+    This utility method reads a record from one of the service indexes (e.g. the build index).
+    In PV mode the indexes live on the shared volume, otherwise they are kept next to the build contexts in the context bucket.
 
-        job_data = {
-            'result': result,
-            'status': status
-        }
-        if status['failed']:
-            job_data['logs'] = get_job_logs(job_id)
+    Args:
+        index (str): name of the index, e.g. `build-index`
+        key (str): record key within the index
 
-        return job_data
-    except ApiException as e:
-        logger.error(f'Exception when getting job status: {e}')
-        return e.body
+    Returns:
+        Dict: stored record, or None if there is no such record
+    '''
+    try:
+        if PV_MODE:
+            record_path = f'{DATA_DIR}/{index}/{key}.json'
+            if not os.path.exists(record_path):
+                return None
+            with open(record_path) as f:
+                return json.load(f)
+        else:
+            obj = storage_driver.get_object(CONTEXT_BUCKET, f'chassis/{index}/{key}.json')
+            return json.loads(b''.join(storage_driver.download_object_as_stream(obj)))
+    except ObjectDoesNotExistError:
+        return None
+    except Exception as e:
+        logger.error(f'Exception when reading {index}: {e}')
+        return None
 
-def download_tar(job_id):
+def write_index_record(index, key, record):
     '''
-    This method is run by the `/job/{job_id}/download-tar` endpoint. 
-    It downloads the container image from kaniko, built during the chassis job with the name `job_id`
+    This utility method stores a record in one of the service indexes. See `read_index_record` for where the indexes live.
 
     Args:
-        job_id (str): valid Chassis job identifier, generated by `create_job` method 
-    
+        index (str): name of the index, e.g. `build-index`
+        key (str): record key within the index
+        record (dict): record to store
+
     Returns:
-        Dict: response from `download_tar` endpoint
+        None
     '''
-    uid = job_id.split(f'{K_JOB_NAME}-')[1]
+    data = json.dumps(record).encode()
+    try:
+        if PV_MODE:
+            os.makedirs(f'{DATA_DIR}/{index}', exist_ok=True)
+            record_path = f'{DATA_DIR}/{index}/{key}.json'
+            with open(f'{record_path}.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(f'{record_path}.tmp', record_path)
+        else:
+            storage_driver.upload_object_via_stream(iterator=iter([data]), container=container,
+                                                    object_name=f'chassis/{index}/{key}.json')
+    except Exception as e:
+        logger.error(f'Exception when writing {index}: {e}')
+
+def delete_index_record(index, key):
+    '''
+    This utility method removes a record from one of the service indexes. See `read_index_record` for where the indexes live.
+
+    Args:
+        index (str): name of the index, e.g. `build-index`
+        key (str): record key within the index
+
+    Returns:
+        None
+    '''
+    try:
+        if PV_MODE:
+            record_path = f'{DATA_DIR}/{index}/{key}.json'
+            if os.path.exists(record_path):
+                os.remove(record_path)
+        else:
+            storage_driver.delete_object(storage_driver.get_object(CONTEXT_BUCKET, f'chassis/{index}/{key}.json'))
+    except ObjectDoesNotExistError:
+        pass
+    except Exception as e:
+        logger.error(f'Exception when deleting from {index}: {e}')
+
+def list_index_records(index):
+    '''
+    This utility method returns all records of one of the service indexes. See `read_index_record` for where the indexes live.
+
+    Args:
+        index (str): name of the index, e.g. `build-index`
+
+    Returns:
+        Dict: records of the index keyed by their record key
+    '''
+    if PV_MODE:
+        index_dir = f'{DATA_DIR}/{index}'
+        keys = [name[:-len('.json')] for name in os.listdir(index_dir) if name.endswith('.json')] if os.path.isdir(index_dir) else []
+    else:
+        prefix = f'chassis/{index}/'
+        keys = [obj.name[len(prefix):-len('.json')] for obj in storage_driver.list_container_objects(container, prefix=prefix)]
+
+    records = {key: read_index_record(index, key) for key in keys}
+    return {key: record for key, record in records.items() if record is not None}
+
+def get_pushed_digest(job_id):
+    '''
+    This utility method returns the digest of the image pushed by a finished kaniko job.
+    kaniko writes it to the termination message of its container (see the `--digest-file` argument in `create_job_object`).
+
+    Args:
+        job_id (str): valid Chassis job identifier, generated by `create_job` method
+
+    Returns:
+        str: image digest (e.g. `sha256:...`), or None if it could not be found
+    '''
+    try:
+        pods = client.CoreV1Api().list_namespaced_pod(ENVIRONMENT, label_selector=f'job-name={job_id}').items
+        for pod in pods:
+            for container_status in pod.status.container_statuses or []:
+                terminated = container_status.state.terminated
+                if terminated and terminated.message and terminated.message.strip().startswith('sha256:'):
+                    return terminated.message.strip()
+    except ApiException as e:
+        logger.error(f'Exception when getting pushed digest: {e}')
+    return None
+
+def record_build(fingerprint, job_id, destination, status):
+    '''
+    This utility method adds a successfully pushed image to the build index so identical `/build` requests can reuse it.
+
+    Args:
+        fingerprint (str): build fingerprint generated by `get_build_fingerprint`
+        job_id (str): valid Chassis job identifier, generated by `create_job` method
+        destination (str): registry destination the image was pushed to
+        status (dict): final job status returned by `get_job_status`
+
+    Returns:
+        None
+    '''
+    digest = get_pushed_digest(job_id)
+    if not digest:
+        logger.warning(f'No pushed digest found for {job_id}, not adding it to the build index')
+        return
+
+    write_index_record('build-index', fingerprint, {
+        'job_id': job_id,
+        'destination': destination,
+        'digest': digest,
+        'status': status,
+        'created': time.time()
+    })
+
+def parse_image_destination(destination):
+    '''
+    This utility method splits an image destination into its registry host, repository and tag.
+    Destinations without a registry host are Docker Hub images.
+
+    Args:
+        destination (str): registry destination as returned by `get_image_destination`
+
+    Returns:
+        tuple(str, str, str): registry host, repository and tag
+    '''
+    name, tag = destination.rsplit(':', 1)
+    host, _, repository = name.partition('/')
+    if not repository or not ('.' in host or ':' in host or host == 'localhost'):
+        host, repository = 'registry-1.docker.io', name
+        if '/' not in repository:
+            repository = f'library/{repository}'
+    return host, repository, tag
+
+def get_registry_basic_auth(registry_auth, host):
+    '''
+    This utility method returns the base64 encoded `user:password` pair used to talk to the registry API.
+    It is either the pair sent by the user or the matching entry of the credentials configured during installation.
+
+    Args:
+        registry_auth (str): Docker registry authorization credentials sent by the user
+        host (str): registry host
+
+    Returns:
+        str: base64 encoded `user:password`, or None if there are no credentials for this registry
+    '''
+    if registry_auth:
+        return registry_auth
+    if not REGISTRY_CREDENTIALS:
+        return None
+    return find_registry_auth(base64.b64decode(REGISTRY_CREDENTIALS), host)
+
+def find_registry_auth(docker_config, host):
+    '''
+    This utility method returns the base64 encoded `user:password` pair of a registry from a docker `config.json`.
+
+    Args:
+        docker_config (bytes): docker `config.json` holding an `auths` section
+        host (str): registry host
+
+    Returns:
+        str: base64 encoded `user:password`, or None if there are no credentials for this registry
+    '''
+    auths = json.loads(docker_config).get('auths', {})
+    for server, entry in auths.items():
+        server_host = urlparse(server).hostname or server
+        if server_host == host or (host == 'registry-1.docker.io' and 'docker.io' in server_host):
+            return entry.get('auth')
+    return None
+
+def get_job_registry_auth(random_name, destination):
+    '''
+    This utility method reads the registry credentials a job pushes `destination` with from its credentials secret.
+
+    Args:
+        random_name (str): random id of the job
+        destination (str): registry destination of the job, or None if it does not publish
+
+    Returns:
+        str: base64 encoded `user:password`, or None if there are no credentials for this registry
+    '''
+    if not destination:
+        return None
+    try:
+        secret = client.CoreV1Api().read_namespaced_secret(f'{random_name}-creds', ENVIRONMENT)
+    except ApiException as e:
+        logger.error(f'Exception when reading registry credentials: {e}')
+        return None
+    host, _, _ = parse_image_destination(destination)
+    return find_registry_auth(base64.b64decode(secret.data['config.json']), host)
+
+def registry_request(method, url, basic_auth, scope, **kwargs):
+    '''
+    This utility method sends a request to the Docker registry HTTP API, answering a bearer token challenge if the registry asks for one.
+
+    Args:
+        method (str): HTTP method
+        url (str): registry API url
+        basic_auth (str): base64 encoded `user:password`
+        scope (str): token scope to request, e.g. `repository:user/model:pull,push`
+
+    Returns:
+        requests.Response: registry response
+    '''
+    headers = kwargs.pop('headers', {})
+    kwargs.setdefault('timeout', REQUEST_TIMEOUT_SECONDS)
+    res = requests.request(method, url, headers=headers, **kwargs)
+    challenge = res.headers.get('WWW-Authenticate', '')
+    if res.status_code != 401:
+        return res
+
+    if challenge.startswith('Bearer'):
+        params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+        realm = params.pop('realm')
+        params['scope'] = scope
+        token_res = requests.get(realm, params=params, timeout=kwargs['timeout'],
+                                 headers={'Authorization': f'Basic {basic_auth}'} if basic_auth else {})
+        token_res.raise_for_status()
+        token = token_res.json().get('token') or token_res.json().get('access_token')
+        headers['Authorization'] = f'Bearer {token}'
+    elif basic_auth:
+        headers['Authorization'] = f'Basic {basic_auth}'
+    else:
+        return res
+
+    return requests.request(method, url, headers=headers, **kwargs)
+
+def retag_image(source, digest, destination, registry_auth):
+    '''
+    This utility method points a new tag at an already pushed image by copying its manifest through the registry API, so no layers are rebuilt or re-uploaded.
+    Only tags within the same repository are supported.
+
+    Args:
+        source (str): registry destination the image was originally pushed to
+        digest (str): digest of the pushed image
+        destination (str): registry destination the image should also be available at
+        registry_auth (str): Docker registry authorization credentials sent by the user
+
+    Returns:
+        bool: whether the image was retagged
+    '''
+    host, repository, _ = parse_image_destination(source)
+    dst_host, dst_repository, dst_tag = parse_image_destination(destination)
+    if (host, repository) != (dst_host, dst_repository):
+        return False
+
+    basic_auth = get_registry_basic_auth(registry_auth, host)
+    scope = f'repository:{repository}:pull,push'
+    base_url = f'https://{host}/v2/{repository}/manifests'
+
+    try:
+        manifest = registry_request('GET', f'{base_url}/{digest}', basic_auth, scope, headers={'Accept': REGISTRY_MANIFEST_TYPES})
+        manifest.raise_for_status()
+        res = registry_request('PUT', f'{base_url}/{dst_tag}', basic_auth, scope,
+                               headers={'Content-Type': manifest.headers['Content-Type']},
+                               data=manifest.content)
+        res.raise_for_status()
+    except Exception as e:
+        logger.error(f'Exception when retagging {source} as {destination}: {e}')
+        return False
+
+    return True
+
+def get_cached_build(fingerprint, destination, registry_auth):
+    '''
+    This utility method checks whether an image built from identical inputs has already been pushed and, if so,
+    makes it available at `destination` so that no kaniko job has to be created. The recorded manifest is always put to
+    the requested tag with the caller's credentials, even if the build was pushed there: the tag may have been moved
+    since, and the caller must be allowed to push to the repository.
+
+    Args:
+        fingerprint (str): build fingerprint generated by `get_build_fingerprint`
+        destination (str): registry destination requested by the user
+        registry_auth (str): Docker registry authorization credentials sent by the user
+
+    Returns:
+        Dict: build record of the previous build, or None if the image has to be built
+    '''
+    record = read_index_record('build-index', fingerprint)
+    if not record:
+        return None
+
+    if not retag_image(record['destination'], record['digest'], destination, registry_auth):
+        return None
+
+    logger.info(f'Build {fingerprint} already pushed by {record["job_id"]} as {record["digest"]}')
+    return record
+
+def get_build_key(fingerprint, destination, registry_auth):
+    '''
+    This utility method generates the key under which concurrent identical builds are deduplicated: the same build
+    context pushed to the same destination, or kept as a tar archive if `destination` is None, with the same registry
+    credentials, so that a request is never attached to a build that pushes with the credentials of another caller.
+
+    Args:
+        fingerprint (str): build fingerprint generated by `get_build_fingerprint`
+        destination (str): full image destination the build pushes to, or None
+        registry_auth (str): Docker registry authorization credentials sent by the user, or None for the ones configured during installation
+
+    Returns:
+        str: build key
+    '''
+    return hashlib.sha256(f'{fingerprint}\0{destination or ""}\0{registry_auth or ""}'.encode()).hexdigest()
+
+def find_in_flight_build(build_key):
+    '''
+    This utility method looks up a build job with key `build_key` in the job index that is queued, running or has
+    succeeded but not been completed yet.
+
+    Args:
+        build_key (str): build key generated by `get_build_key`
+
+    Returns:
+        str: id of the in-flight job, or None if there is none
+    '''
+    for job in JOB_INDEX.jobs():
+        annotations = job.metadata.annotations or {}
+        if annotations.get('build-key') != build_key or annotations.get('reconciled'):
+            continue
+        if not (job.status and job.status.failed):
+            return job.metadata.name
+    return None
+
+def claim_build(build_key, job_id):
+    '''
+    This utility method makes sure that only one kaniko job runs per distinct build at a time. If an identical build is in
+    flight, either in the job index or still being created by another request, its job id is returned. Otherwise the
+    build is claimed for job `job_id` until `release_build` is called once its job has been created or has failed to be.
+
+    Args:
+        build_key (str): build key generated by `get_build_key`
+        job_id (str): id of the job the caller is about to create
+
+    Returns:
+        str: id of the in-flight job to attach to, or None if the build was claimed for `job_id`
+    '''
+    with IN_FLIGHT_LOCK:
+        in_flight = IN_FLIGHT_BUILDS.get(build_key) or find_in_flight_build(build_key)
+        if not in_flight:
+            IN_FLIGHT_BUILDS[build_key] = job_id
+        return in_flight
+
+def release_build(build_key):
+    '''
+    This utility method releases a build claimed by `claim_build`. A job created for it is found in the job index from then on.
+
+    Args:
+        build_key (str): build key generated by `get_build_key`
+
+    Returns:
+        None
+    '''
+    with IN_FLIGHT_LOCK:
+        IN_FLIGHT_BUILDS.pop(build_key, None)
+
+def attach_webhook(job_id, webhook):
+    '''
+    This utility method adds the webhook of a request attached to the in-flight job `job_id` to the job, so that
+    `complete_job` posts the final job status to it as well.
+
+    Args:
+        job_id (str): id of the in-flight job
+        webhook (str): URL of the webhook
+
+    Returns:
+        None
+    '''
+    key = f'{WEBHOOK_ANNOTATION_PREFIX}{hashlib.sha256(webhook.encode()).hexdigest()[:16]}'
+    try:
+        client.BatchV1Api().patch_namespaced_job(job_id, ENVIRONMENT, {'metadata': {'annotations': {key: webhook}}})
+    except ApiException as e:
+        logger.error(f'Exception when attaching webhook to job {job_id}: {e}')
+
+def attach_group(job_id, group_id):
+    '''
+    This utility method adds the job group of a matrix build whose variant attached to the in-flight job `job_id` to the
+    job, so that `complete_job` completes that group as well. A job claimed by `claim_build` may still be being created,
+    so it is given a moment to show up in the job index.
+
+    Args:
+        job_id (str): id of the in-flight job
+        group_id (str): job group id returned by `build_matrix`
+
+    Returns:
+        None
+    '''
+    JOB_INDEX.wait_for_phase(job_id, None, 5)
+    key = f'{GROUP_ANNOTATION_PREFIX}{hashlib.sha256(group_id.encode()).hexdigest()[:16]}'
+    try:
+        client.BatchV1Api().patch_namespaced_job(job_id, ENVIRONMENT, {'metadata': {'annotations': {key: group_id}}})
+    except ApiException as e:
+        logger.error(f'Exception when attaching job group {group_id} to job {job_id}: {e}')
+
+def get_conda_env(model_dir):
+    '''
+    This utility method reads the dependency files of the model and hashes them, so models with the same
+    (already `fix_dependencies`-ed) `conda.yaml` share one environment.
+
+    Args:
+        model_dir (str): directory the model archive was extracted into by `ingest_upload`
+
+    Returns:
+        tuple(str, dict): hash of the environment and the contents of `conda.yaml` and `requirements.txt` keyed by file name
+    '''
+    env_files = {}
+    for filename in ('conda.yaml', 'requirements.txt'):
+        if os.path.exists(os.path.join(model_dir, filename)):
+            with open(os.path.join(model_dir, filename), 'rb') as f:
+                env_files[filename] = f.read()
+
+    env_hash = hashlib.sha256()
+    if 'conda.yaml' in env_files:
+        conda_env = yaml.safe_load(env_files['conda.yaml']) or {}
+        env_hash.update(json.dumps(conda_env, sort_keys=True, default=str).encode())
+    env_hash.update(b'\0')
+    env_hash.update(env_files.get('requirements.txt', b''))
+
+    return env_hash.hexdigest(), env_files
+
+def stage_conda_env(env_files, envs_dir):
+    '''
+    This utility method writes the dependency files of a model into the content-addressed directory the Dockerfile creates
+    the environment from. The directory is named after the hash of the files rather than of the environment, so that it
+    never changes once created, e.g. when the lock of the environment is added, while builds are reading it. It is
+    written to a temporary directory and renamed into place, so no build sees it half written.
+
+    Args:
+        env_files (dict): file contents returned by `get_conda_env`, with the lock files added by `add_conda_lock`
+        envs_dir (str): directory of the content-addressed directories of the flavour
+
+    Returns:
+        str: name of the directory within `envs_dir`
+    '''
+    files_hash = hashlib.sha256()
+    for filename, data in sorted(env_files.items()):
+        files_hash.update(f'{filename}\0{len(data)}\0'.encode())
+        files_hash.update(data)
+    name = files_hash.hexdigest()
+    env_dir = os.path.join(envs_dir, name)
+
+    if not os.path.isdir(env_dir):
+        os.makedirs(envs_dir, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix=f'{name}.tmp-', dir=envs_dir)
+        os.chmod(staging_dir, 0o755)
+        for filename, data in env_files.items():
+            with open(os.path.join(staging_dir, filename), 'wb') as f:
+                f.write(data)
+        try:
+            os.rename(staging_dir, env_dir)
+        except OSError:
+            # staged by a concurrent build in the meantime
+            rmtree(staging_dir, ignore_errors=True)
+    # the modification time tells `clean_conda_envs` when the directory was last used
+    os.utime(env_dir)
+    return name
+
+def export_conda_lock(prefix):
+    '''
+    This utility method exports the fully pinned lock of a conda environment: its conda packages as an explicit spec
+    file with the URL and checksum of every package, and the packages pip installed into it as pinned requirements.
+
+    Args:
+        prefix (str): prefix of the conda environment
+
+    Returns:
+        Dict: record of the lock, with the `conda` and `pip` lock files
+    '''
+    explicit = subprocess.run(f'conda list --explicit --md5 -p {prefix}', capture_output=True, shell=True,
+                              executable='/bin/bash', check=True).stdout.decode()
+    packages = json.loads(subprocess.run(f'conda list --json -p {prefix}', capture_output=True, shell=True,
+                                         executable='/bin/bash', check=True).stdout)
+    pip = ''.join(f'{package["name"]}=={package["version"]}\n' for package in packages if package.get('channel') == 'pypi')
+    return {'conda': explicit, 'pip': pip, 'created': datetime.now(timezone.utc).timestamp()}
+
+def install_conda_lock(lock, prefix):
+    '''
+    This utility method creates a conda environment from a lock exported by `export_conda_lock`, without solving.
+    Raises `subprocess.CalledProcessError` if it cannot be created.
+
+    Args:
+        lock (dict): record of the lock
+        prefix (str): prefix of the conda environment to create
+
+    Returns:
+        None
+    '''
+    with tempfile.TemporaryDirectory() as lock_dir:
+        for filename, data in (('conda.lock', lock['conda']), ('pip.lock', lock['pip'])):
+            with open(os.path.join(lock_dir, filename), 'w') as f:
+                f.write(data)
+        subprocess.run(f'nice -n 10 conda create -y -p {prefix} --file {lock_dir}/conda.lock', capture_output=True,
+                       shell=True, executable='/bin/bash', check=True)
+        # the pip requirements of locks resolved by `resolve_conda_lock` are not pinned, so their dependencies are installed too
+        if lock['pip']:
+            subprocess.run(f'nice -n 10 {prefix}/bin/pip install -r {lock_dir}/pip.lock', capture_output=True,
+                           shell=True, executable='/bin/bash', check=True)
+
+def resolve_conda_lock(env_hash, env_files):
+    '''
+    This utility method resolves the lock of the environment of a build which has none yet with a dry run of the conda
+    solver for `linux-64`, so the service never creates the environment. The conda packages are locked to the URLs and
+    checksums the solver would fetch, while the pip requirements of `conda.yaml` are kept as they are and resolved by pip
+    in the build. It runs in the background on `LOCK_RESOLVER`, so that later builds of the environment install from the lock.
+
+    Args:
+        env_hash (str): environment hash returned by `get_conda_env`
+        env_files (dict): dependency files returned by `get_conda_env`
+
+    Returns:
+        None
+    '''
+    try:
+        conda_env = yaml.safe_load(env_files['conda.yaml']) or {}
+        dependencies = conda_env.get('dependencies') or []
+        specs = [str(dependency) for dependency in dependencies if not isinstance(dependency, dict)]
+        pip = [requirement for dependency in dependencies if isinstance(dependency, dict)
+               for requirement in dependency.get('pip') or []]
+        if not specs:
+            return
+        channels = ''.join(f'-c {shlex.quote(channel)} ' for channel in conda_env.get('channels') or [])
+
+        # the package cache only ever holds the repodata, so the solver reports every package as one to fetch, with its
+        # URL and checksum, in the order the packages are linked in
+        with tempfile.TemporaryDirectory() as env_dir:
+            solve = subprocess.run(f'nice -n 10 conda create --dry-run --json -p {env_dir}/env {channels}'
+                                   f'{" ".join(shlex.quote(spec) for spec in specs)}', capture_output=True, shell=True,
+                                   executable='/bin/bash', check=True,
+                                   env=dict(os.environ, CONDA_SUBDIR='linux-64',
+                                            CONDA_PKGS_DIRS=os.path.join(HOME_DIR, '.chassis_lock_pkgs')))
+        actions = json.loads(solve.stdout)['actions']
+        fetch = {re.sub(r'\.(tar\.bz2|conda)$', '', package['fn']): package for package in actions['FETCH']}
+        urls = [f'{fetch[package["dist_name"]]["url"]}#{fetch[package["dist_name"]]["md5"]}\n' for package in actions['LINK']]
+        write_index_record('conda-locks', env_hash, {
+            'conda': '# platform: linux-64\n@EXPLICIT\n' + ''.join(urls),
+            'pip': ''.join(f'{requirement}\n' for requirement in pip),
+            'created': datetime.now(timezone.utc).timestamp()
+        })
+    except subprocess.CalledProcessError as e:
+        logger.warning(f'Could not resolve the lock of environment {env_hash}: {e.stderr.decode(errors="ignore")}')
+    except Exception as e:
+        logger.error(f'Exception when resolving the lock of environment {env_hash}: {e}')
+    finally:
+        with RESOLVING_LOCKS_LOCK:
+            RESOLVING_LOCKS.discard(env_hash)
+
+def add_conda_lock(env_hash, env_files):
+    '''
+    This utility method adds the lock of an environment (see `export_conda_lock`) to its dependency files as `conda.lock`
+    and `pip.lock`, which the environment stage of the Dockerfile installs from instead of solving `conda.yaml` again.
+    Environments without a lock yet are resolved in the background by `resolve_conda_lock`.
+
+    Locks exported by `/test` are taken on the platform of the service, so only `linux-64` locks are added, and only the
+    CPU Dockerfile installs from them: the solve of GPU environments depends on the CUDA driver of the build.
+
+    Args:
+        env_hash (str): environment hash returned by `get_conda_env`
+        env_files (dict): dependency files returned by `get_conda_env`
+
+    Returns:
+        dict: dependency files, with the lock files if there is a lock
+    '''
+    if not LOCK_BUILD_ENVS or 'conda.yaml' not in env_files:
+        return env_files
+
+    lock = read_index_record('conda-locks', env_hash)
+    if lock:
+        if '# platform: linux-64' not in lock['conda']:
+            return env_files
+        return dict(env_files, **{'conda.lock': lock['conda'].encode(), 'pip.lock': lock['pip'].encode()})
+
+    with RESOLVING_LOCKS_LOCK:
+        if env_hash in RESOLVING_LOCKS:
+            return env_files
+        RESOLVING_LOCKS.add(env_hash)
+    LOCK_RESOLVER.submit(resolve_conda_lock, env_hash, env_files)
+    return env_files
+
+def get_env_image(env_hash, module_name, dockerfile):
+    '''
+    This utility method returns the image in the environment cache repository that holds the environment stage for `env_hash`.
+    The tag also depends on the Dockerfile and the service version, since both change what the environment stage contains.
+
+    Args:
+        env_hash (str): environment hash returned by `get_conda_env`
+        module_name (str): reference module to locate location within service input is saved
+        dockerfile (str): name of dockerfile to use
+
+    Returns:
+        str: environment image reference
+    '''
+    tag = hashlib.sha256()
+    tag.update(f'{CHASSIS_VERSION}\0{env_hash}\0'.encode())
+    with open(f'./flavours/{module_name}/{dockerfile}', 'rb') as f:
+        tag.update(f.read())
+    return f'{ENV_CACHE_REPO}:env-{tag.hexdigest()}'
+
+def get_registry_manifest_digest(image, basic_auth):
+    '''
+    This utility method returns the manifest digest an image reference points to in its registry.
+
+    Args:
+        image (str): image reference including its tag
+        basic_auth (str): base64 encoded `user:password`
+
+    Returns:
+        str: manifest digest, or None if the image does not exist
+    '''
+    host, repository, tag = parse_image_destination(image)
+    res = registry_request('HEAD', f'https://{host}/v2/{repository}/manifests/{tag}', basic_auth,
+                           f'repository:{repository}:pull', headers={'Accept': REGISTRY_MANIFEST_TYPES})
+    if res.status_code != 200:
+        return None
+    return res.headers.get('Docker-Content-Digest')
+
+def get_image_size(job_id, random_name, destination):
+    '''
+    This utility method returns the size of the image built by a finished kaniko job: the size of its config and
+    compressed layers, which is what nodes pull, read from its manifest in the registry if it was pushed, or else the
+    size of its tar archive on the shared volume.
+
+    Args:
+        job_id (str): valid Chassis job identifier, generated by `create_job` method
+        random_name (str): random id of the job
+        destination (str): registry destination of the job, or None if it does not publish
+
+    Returns:
+        int: image size in bytes, or None if it is not known
+    '''
+    digest = get_pushed_digest(job_id) if destination else None
+    if digest:
+        host, repository, _ = parse_image_destination(destination)
+        basic_auth = get_registry_basic_auth(get_job_registry_auth(random_name, destination), host)
+        try:
+            res = registry_request('GET', f'https://{host}/v2/{repository}/manifests/{digest}', basic_auth,
+                                   f'repository:{repository}:pull', headers={'Accept': REGISTRY_MANIFEST_TYPES})
+            res.raise_for_status()
+            manifest = res.json()
+            return manifest['config']['size'] + sum(layer['size'] for layer in manifest['layers'])
+        except Exception as e:
+            logger.error(f'Exception when reading the manifest of {destination}@{digest}: {e}')
+
+    path_to_tar_file = f'{DATA_DIR}/kaniko_image-{random_name}.tar'
+    if PV_MODE and os.path.isfile(path_to_tar_file):
+        return os.path.getsize(path_to_tar_file)
+    return None
+
+def resolve_env_image(env_hash, module_name, dockerfile):
+    '''
+    This utility method looks up the environment stage for `env_hash` in the environment cache.
+
+    Args:
+        env_hash (str): environment hash returned by `get_conda_env`
+        module_name (str): reference module to locate location within service input is saved
+        dockerfile (str): name of dockerfile to use
+
+    Returns:
+        tuple(str, bool): environment image to build the model on (None if the cache is disabled) and whether it has to be built first
+    '''
+    if not ENV_CACHE_REPO:
+        return None, False
+
+    env_image = get_env_image(env_hash, module_name, dockerfile)
+    key = env_image.rsplit(':', 1)[1]
+    record = read_index_record('env-index', key)
+    if record:
+        host = parse_image_destination(env_image)[0]
+        try:
+            digest = get_registry_manifest_digest(env_image, get_registry_basic_auth(None, host))
+        except Exception as e:
+            logger.error(f'Exception when checking environment cache: {e}')
+            digest = None
+        if digest:
+            record['last_used'] = time.time()
+            record['hits'] = record.get('hits', 0) + 1
+            write_index_record('env-index', key, record)
+            logger.info(f'Environment cache hit for {env_hash}: {env_image}')
+            return env_image, False
+        delete_index_record('env-index', key)
+
+    logger.info(f'Environment cache miss for {env_hash}, building {env_image}')
+    return env_image, True
+
+def record_env_image(env_image):
+    '''
+    This utility method adds a freshly pushed environment stage to the environment cache and evicts stale entries.
+
+    Args:
+        env_image (str): environment image reference returned by `get_env_image`
+
+    Returns:
+        None
+    '''
+    now = time.time()
+    write_index_record('env-index', env_image.rsplit(':', 1)[1], {
+        'image': env_image,
+        'created': now,
+        'last_used': now,
+        'hits': 0
+    })
+    prune_env_cache()
+
+def prune_env_cache():
+    '''
+    This utility method enforces the eviction policy of the environment cache: entries not used for `ENV_CACHE_TTL_DAYS`
+    are removed, and beyond that the least recently used entries are removed until at most `ENV_CACHE_MAX_ENTRIES` remain.
+    Evicted images are deleted from the cache repository.
+
+    Args:
+        None (None)
+
+    Returns:
+        None
+    '''
+    records = sorted(list_index_records('env-index').items(), key=lambda item: item[1]['last_used'], reverse=True)
+    expired_before = time.time() - ENV_CACHE_TTL_DAYS * 24 * 60 * 60
+    evicted = [(key, record) for i, (key, record) in enumerate(records)
+               if i >= ENV_CACHE_MAX_ENTRIES or record['last_used'] < expired_before]
+
+    for key, record in evicted:
+        host, repository, _ = parse_image_destination(record['image'])
+        basic_auth = get_registry_basic_auth(None, host)
+        try:
+            digest = get_registry_manifest_digest(record['image'], basic_auth)
+            if digest:
+                res = registry_request('DELETE', f'https://{host}/v2/{repository}/manifests/{digest}', basic_auth,
+                                       f'repository:{repository}:delete,pull,push')
+                res.raise_for_status()
+        except Exception as e:
+            logger.error(f'Exception when evicting {record["image"]} from environment cache: {e}')
+            continue
+        delete_index_record('env-index', key)
+        logger.info(f'Evicted {record["image"]} from environment cache')
+
+def get_dependency_names(env_files):
+    '''
+    This utility method lists the names of the conda and pip packages the model depends on.
+
+    Args:
+        env_files (dict): dependency files returned by `get_conda_env`
+
+    Returns:
+        set: lower case package names
+    '''
+    specs = []
+    if 'conda.yaml' in env_files:
+        conda_env = yaml.safe_load(env_files['conda.yaml']) or {}
+        for dependency in conda_env.get('dependencies') or []:
+            if isinstance(dependency, dict):
+                specs.extend(dependency.get('pip') or [])
+            else:
+                specs.append(str(dependency))
+    if 'requirements.txt' in env_files:
+        specs.extend(env_files['requirements.txt'].decode(errors='ignore').splitlines())
+
+    names = set()
+    for spec in specs:
+        # e.g. "conda-forge::torch>=1.10", "numpy==1.21", "scikit-learn[all]"
+        name = re.split(r'[\s=<>!~;\[]', spec.split('::')[-1].strip(), maxsplit=1)[0].lower()
+        if name and not name.startswith(('#', '-')):
+            names.add(name)
+    return names
+
+def get_resource_key(env_hash, model_size):
+    '''
+    This utility method returns the key under which the resource usage of similar builds is recorded: builds with the
+    same dependencies and a model archive in the same power of two size class.
+
+    Args:
+        env_hash (str): environment hash returned by `get_conda_env`
+        model_size (int): size of the uploaded model archive in bytes
+
+    Returns:
+        str: resource history key
+    '''
+    return f'{env_hash}-{int(model_size).bit_length()}'
+
+def get_build_resources(model_size, env_files, gpu, build_env_stage, resource_key):
+    '''
+    This utility method sizes the resources of a kaniko build. Memory grows with the size of the uploaded model archive,
+    which kaniko copies and snapshots, and, when the job creates the conda environment, with the dependencies; large
+    frameworks cost more than `BUILD_DEPENDENCY_MEMORY`. Builds similar to one that was OOM killed get twice the memory
+    that was not enough; the history only records which memory was OOM killed, not how much a build used at its peak.
+    Builds that solve the conda environment get at least `BUILD_MIN_MEMORY_GB`, since a conda solve alone takes several
+    GiB, while builds starting from a cached environment stage get their estimate. No build gets more than `BUILD_MAX_MEMORY_GB`.
+
+    Args:
+        model_size (int): size of the uploaded model archive in bytes
+        env_files (dict): dependency files returned by `get_conda_env`
+        gpu (bool): whether the image is built on the larger GPU base image
+        build_env_stage (bool): whether the job creates the conda environment instead of starting from the environment cache
+        resource_key (str): resource history key returned by `get_resource_key`
+
+    Returns:
+        Dict: cpu and memory used as requests and limits of the kaniko containers
+    '''
+    gib = 1024 ** 3
+    memory = 1 * gib + 2 * model_size + (1 * gib if gpu else 0)
+    if build_env_stage:
+        memory += sum(BUILD_DEPENDENCY_MEMORY.get(name, 0.05) * gib for name in get_dependency_names(env_files))
+
+    history = read_index_record('resource-index', resource_key) or {}
+    if history.get('oom_memory'):
+        memory = max(memory, 2 * history['oom_memory'])
+
+    if build_env_stage:
+        memory = max(memory, BUILD_MIN_MEMORY_GB * gib)
+    memory = min(memory, BUILD_MAX_MEMORY_GB * gib)
+    # round up to 256Mi so that similar builds get identical requests and pack well
+    memory_mi = -(-int(memory) // (256 * 1024 ** 2)) * 256
+
+    return {'memory': f'{memory_mi}Mi', 'cpu': '1' if memory_mi <= 2048 else '2'}
+
+def read_build_pod(job_id):
+    '''
+    This utility method returns the pod of a Kaniko job, from `JOB_INDEX` or else by selecting the pods of the job by their `job-name` label.
+
+    Args:
+        job_id (str): valid Chassis job identifier, generated by `create_job` method
+
+    Returns:
+        V1Pod: pod of the job, or None if there is none
+    '''
+    pod = JOB_INDEX.pod(job_id)
+    if not pod:
+        pods = client.CoreV1Api().list_namespaced_pod(ENVIRONMENT, label_selector=f'job-name={job_id}').items
+        pod = pods[0] if pods else None
+    return pod
+
+def get_job_failure_reason(job, pod):
+    '''
+    This utility method returns why a Kaniko job failed: the reason a container of its pod terminated with, e.g. `OOMKilled`
+    or `Error`, or else the reason of the job's `Failed` condition, e.g. `DeadlineExceeded`.
+
+    Args:
+        job (V1Job): failed Chassis job object
+        pod (V1Pod): pod of the job, or None if there is none
+
+    Returns:
+        str: failure reason
+    '''
+    statuses = ((pod.status.init_container_statuses or []) + (pod.status.container_statuses or [])) if pod and pod.status else []
+    for status in statuses:
+        terminated = status.state.terminated
+        if terminated and terminated.exit_code:
+            return terminated.reason or 'Error'
+
+    for condition in job.status.conditions or []:
+        if condition.type == 'Failed' and condition.reason:
+            return condition.reason
+    return 'Unknown'
+
+def get_job_times(job, pod):
+    '''
+    This utility method collects when a Kaniko job was `created`, `started` once admitted from the build queue, its pod
+    `scheduled`, its kaniko container started (`kaniko_started`), `pushing` the image and `kaniko_finished`, and when
+    the job `finished`. Times that are not known (yet) are None. A job handed to an idle builder of `WarmPool` counts as
+    scheduled and its kaniko container as started when the job started, if its builder was scheduled and started before.
+
+    Args:
+        job (V1Job): Chassis job object
+        pod (V1Pod): pod of the job, or None if there is none
+
+    Returns:
+        Dict: timezone-aware datetimes
+    '''
+    times = {
+        'created': job.metadata.creation_timestamp,
+        # the job controller sets the start time when the job is resumed from the build queue
+        'started': job.status.start_time,
+        'scheduled': None,
+        'kaniko_started': None,
+        'pushing': JOB_INDEX.pushing_since(job.metadata.name),
+        'kaniko_finished': None,
+        'finished': job.status.completion_time or next((condition.last_transition_time for condition in job.status.conditions or []
+                                                        if condition.type in ('Complete', 'Failed') and condition.status == 'True'), None)
+    }
+
+    if pod and pod.status:
+        times['scheduled'] = next((condition.last_transition_time for condition in pod.status.conditions or []
+                                   if condition.type == 'PodScheduled' and condition.status == 'True'), None)
+        for status in pod.status.container_statuses or []:
+            if status.name == 'kaniko':
+                state = status.state.running or status.state.terminated
+                times['kaniko_started'] = state.started_at if state else None
+                times['kaniko_finished'] = status.state.terminated.finished_at if status.state.terminated else None
+
+    if (job.metadata.annotations or {}).get('builder'):
+        for key in ('scheduled', 'kaniko_started'):
+            times[key] = max(times[key], times['started'] or times['created']) if times[key] else None
+
+    return times
+
+def get_job_timings(job, pod):
+    '''
+    This utility method breaks the time a Kaniko job took down into the time it was `queued` in the build queue, `scheduling`
+    its pod, `running` the kaniko container and `pushing` the image, and the `total` time from its creation until it finished.
+    The `time_to_start` from its admission until kaniko started includes scheduling, pulling the kaniko image and mounting
+    the volumes, which builds handed to the warm pool skip.
+    Times that are not known (yet) are None.
+
+    Args:
+        job (V1Job): Chassis job object
+        pod (V1Pod): pod of the job, or None if there is none
+
+    Returns:
+        Dict: durations in seconds
+    '''
+    def seconds(start, end):
+        return (times[end] - times[start]).total_seconds() if times[start] and times[end] else None
+
+    times = get_job_times(job, pod)
+    return {
+        'queued': seconds('created', 'started'),
+        'scheduling': seconds('started', 'scheduled'),
+        'time_to_start': seconds('started', 'kaniko_started'),
+        'running': seconds('kaniko_started', 'kaniko_finished'),
+        'pushing': seconds('pushing', 'kaniko_finished'),
+        'total': seconds('created', 'finished')
+    }
+
+def observe_build_metrics(timings, labels, failure_reason):
+    '''
+    This utility method observes the times of a completed build in the metrics served by `/metrics`, labelled by the
+    flavour and the GPU and arm64 options of the build, and counts its failure reason if it failed.
+
+    Args:
+        timings (Dict): build times generated by `get_job_timings`
+        labels (Dict): `flavour`, `gpu` and `arm64` labels stored in the job by `run_kaniko`, or None for older jobs
+        failure_reason (str): reason generated by `get_job_failure_reason`, or None if the build succeeded
+
+    Returns:
+        None
+    '''
+    labels = labels or {label: 'unknown' for label in BUILD_METRIC_LABELS}
+    for histogram, key in ((QUEUE_SECONDS, 'queued'), (SCHEDULE_SECONDS, 'scheduling'), (START_SECONDS, 'time_to_start'),
+                           (RUN_SECONDS, 'running'), (PUSH_SECONDS, 'pushing'), (BUILD_SECONDS, 'total')):
+        if timings[key] is not None:
+            histogram.labels(**labels).observe(timings[key])
+    if failure_reason:
+        BUILD_FAILURES.labels(failure_reason).inc()
+
+def record_build_resources(resource_key, memory, succeeded, oom_killed):
+    '''
+    This utility method adds the outcome of a build to the resource history used by `get_build_resources`.
+
+    Args:
+        resource_key (str): resource history key returned by `get_resource_key`
+        memory (int): memory given to the build in bytes
+        succeeded (bool): whether the build succeeded
+        oom_killed (bool): whether the build was OOM killed
+
+    Returns:
+        None
+    '''
+    record = read_index_record('resource-index', resource_key) or {'builds': 0, 'oom_kills': 0}
+    record['builds'] += 1
+    if succeeded:
+        record['memory'] = memory
+    if oom_killed:
+        record['oom_kills'] += 1
+        record['oom_memory'] = max(record.get('oom_memory', 0), memory)
+        logger.warning(f'Build with {memory} bytes of memory was OOM killed, similar builds will get {2 * memory}')
+    record['updated'] = time.time()
+    write_index_record('resource-index', resource_key, record)
+
+def new_span(name, parent_id, start=None, end=None, attributes=None):
+    '''
+    This utility method creates a span of a trace, as exported by `export_spans`.
+
+    Args:
+        name (str): name of the span
+        parent_id (str): id of the parent span, or None for the root span of the trace
+        start (int): start time in nanoseconds since the epoch, defaults to now
+        end (int): end time in nanoseconds since the epoch, or None while the span is open
+        attributes (Dict): attributes of the span
+
+    Returns:
+        Dict: span
+    '''
+    return {'name': name, 'span_id': secrets.token_hex(8), 'parent_id': parent_id, 'start': start or time.time_ns(),
+            'end': end, 'attributes': attributes or {}}
+
+class Trace:
+    '''
+    Spans of one request to `/build`. The trace sent by the SDK in the W3C `traceparent` header is continued, otherwise
+    a new one is started. The spans are exported by `export_spans` once the request has been answered, and the jobs
+    created for the request carry the trace context and timing in their `trace` annotation, so that `complete_job`
+    continues the trace with the spans of the build and `/job/{job_id}` reports the timing.
+
+    Attributes:
+        trace_id (str): id of the trace
+        timing (Dict): durations in seconds of the finished spans by name, and of the archive extraction as `unzip`
+    '''
+    def __init__(self, traceparent=None):
+        match = TRACEPARENT_PATTERN.match(traceparent or '')
+        self.trace_id = match.group(1) if match else secrets.token_hex(16)
+        self.timing = {}
+        self._spans = [new_span('build_image', match.group(2) if match else None)]
+        self._open = list(self._spans)
+
+    @contextmanager
+    def span(self, name):
+        '''
+        Records the enclosed block as span `name`, child of the innermost open span.
+        '''
+        span = new_span(name, self._open[-1]['span_id'])
+        self._spans.append(span)
+        self._open.append(span)
+        try:
+            yield span
+        finally:
+            span['end'] = time.time_ns()
+            self._open.pop()
+            self.timing[name] = (span['end'] - span['start']) / 1e9
+
+    def context(self):
+        '''
+        Returns the trace context to carry in a job: the trace id, the id of the innermost open span and the timing so far.
+        '''
+        return {'trace_id': self.trace_id, 'span_id': self._open[-1]['span_id'], 'timing': dict(self.timing)}
+
+    def finish(self, response):
+        '''
+        Ends the span of the request and exports the spans. Registered with `after_this_request` by `build_image`.
+        '''
+        self._spans[0]['end'] = time.time_ns()
+        self._spans[0]['attributes']['http.status_code'] = response.status_code
+        export_spans(self.trace_id, self._spans)
+        return response
+
+def get_trace_payload(trace_id, spans):
+    '''
+    This utility method encodes spans of a trace in the OTLP/JSON format. The SDK exports the spans of a publish in the
+    same shape (see `Trace.payload` in `chassisml/_trace.py`), which `tests/test_trace_payload.py` checks.
+
+    Args:
+        trace_id (str): id of the trace
+        spans (list): spans created by `new_span`
+
+    Returns:
+        Dict: OTLP/JSON `ExportTraceServiceRequest`
+    '''
+    def attribute(key, value):
+        if isinstance(value, bool):
+            return {'key': key, 'value': {'boolValue': value}}
+        if isinstance(value, int):
+            return {'key': key, 'value': {'intValue': str(value)}}
+        return {'key': key, 'value': {'stringValue': str(value)}}
+
+    return {'resourceSpans': [{
+        'resource': {'attributes': [attribute('service.name', 'chassis-service'), attribute('service.version', CHASSIS_VERSION)]},
+        'scopeSpans': [{'scope': {'name': 'chassis'}, 'spans': [{
+            'traceId': trace_id,
+            'spanId': span['span_id'],
+            'parentSpanId': span['parent_id'] or '',
+            'name': span['name'],
+            'kind': 2 if span['name'] == 'build_image' else 1,
+            'startTimeUnixNano': str(span['start']),
+            'endTimeUnixNano': str(span['end'] or time.time_ns()),
+            'attributes': [attribute(key, value) for key, value in span['attributes'].items()]
+        } for span in spans]}]
+    }]}
+
+def export_spans(trace_id, spans):
+    '''
+    This utility method exports spans of a trace in the OTLP/JSON format (see `get_trace_payload`), appended as one line to `TRACE_FILE` and/or
+    posted to the OpenTelemetry collector at `TRACE_COLLECTOR_URL` (e.g. `http://otel-collector:4318/v1/traces`).
+    The export runs in the background and nothing is exported if neither is configured.
+
+    Args:
+        trace_id (str): id of the trace
+        spans (list): spans created by `new_span`
+
+    Returns:
+        None
+    '''
+    if not (TRACE_FILE or TRACE_COLLECTOR_URL):
+        return
+
+    payload = get_trace_payload(trace_id, spans)
+
+    def export():
+        try:
+            if TRACE_FILE:
+                with open(TRACE_FILE, 'a') as f:
+                    f.write(json.dumps(payload) + '\n')
+            if TRACE_COLLECTOR_URL:
+                requests.post(TRACE_COLLECTOR_URL, json=payload, timeout=10).raise_for_status()
+        except Exception as e:
+            logger.error(f'Exception when exporting trace {trace_id}: {e}')
+
+    threading.Thread(target=export, daemon=True).start()
+
+def get_kaniko_steps(pod):
+    '''
+    This utility method reads when the `RUN`, `COPY` and `ADD` steps of the Dockerfile started from the log of the kaniko
+    container, e.g. the `conda env create` of the environment stage. A step ends when the next one starts or the push starts.
+
+    Args:
+        pod (V1Pod): pod of a Kaniko job
+
+    Returns:
+        list: tuples of the step and its timezone-aware start datetime, the step is None for the start of the push
+    '''
+    try:
+        log = client.CoreV1Api().read_namespaced_pod_log(pod.metadata.name, ENVIRONMENT, container='kaniko', timestamps=True,
+                                                         _request_timeout=REQUEST_TIMEOUT_SECONDS)
+    except Exception as e:
+        logger.error(f'Exception when reading the build log of {pod.metadata.name}: {e}')
+        return []
+
+    steps = []
+    for line in log.splitlines():
+        # every line starts with the RFC 3339 timestamp, with nanoseconds, added by the API
+        timestamp, _, message = line.partition(' ')
+        match = KANIKO_STEP_PATTERN.match(message)
+        if match or 'Pushing image to' in message:
+            timestamp, _, fraction = timestamp.rstrip('Z').partition('.')
+            started = datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%S').replace(
+                microsecond=int(fraction[:6].ljust(6, '0')), tzinfo=timezone.utc)
+            steps.append((match.group(1)[:120] if match else None, started))
+    return steps
+
+def get_package_cache_stats(pod):
+    '''
+    This utility method sums the hits and misses of the package cache that `install_env.sh` of the flavour printed to the
+    build log of each kaniko container, e.g. of the environment stage built first, for every install step.
+
+    Args:
+        pod (V1Pod): pod of a Kaniko job, or None if there is none
+
+    Returns:
+        dict: hits and misses by package manager, e.g. `{'conda': {'hits': 52, 'misses': 3}}`, or None if the build
+        installed no packages, e.g. because it started from a cached environment stage
+    '''
+    if not pod:
+        return None
+
+    stats = {}
+    for container in (pod.spec.init_containers or []) + pod.spec.containers:
+        try:
+            log = client.CoreV1Api().read_namespaced_pod_log(pod.metadata.name, ENVIRONMENT, container=container.name,
+                                                             _request_timeout=REQUEST_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.error(f'Exception when reading the build log of {pod.metadata.name}: {e}')
+            continue
+        for match in PACKAGE_CACHE_PATTERN.finditer(log):
+            for manager, counts in json.loads(match.group(1)).items():
+                total = stats.setdefault(manager, {'hits': 0, 'misses': 0})
+                total['hits'] += counts['hits']
+                total['misses'] += counts['misses']
+    return stats or None
+
+def get_job_spans(job, pod, parent_id):
+    '''
+    This utility method turns the times of a finished Kaniko job into spans continuing the trace of its request: the job,
+    its time in the build queue, the scheduling of its pod, the kaniko run with the Dockerfile steps read by
+    `get_kaniko_steps` if the spans are exported, and the push.
+
+    Args:
+        job (V1Job): finished Chassis job object
+        pod (V1Pod): pod of the job, or None if there is none
+        parent_id (str): id of the span of the request the job was created in
+
+    Returns:
+        list: spans created by `new_span`, the span of the job first
+    '''
+    def ns(name):
+        return int(times[name].timestamp() * 1e9) if times[name] else None
+
+    times = get_job_times(job, pod)
+    job_span = new_span('build job', parent_id, ns('created'), ns('finished') or time.time_ns(),
+                        {'k8s.job.name': job.metadata.name, 'succeeded': bool(job.status.succeeded)})
+    spans = [job_span]
+    for name, start, end in (('queued', 'created', 'started'), ('scheduling', 'started', 'scheduled'),
+                             ('kaniko', 'kaniko_started', 'kaniko_finished'), ('push', 'pushing', 'kaniko_finished')):
+        if times[start] and times[end]:
+            spans.append(new_span(name, job_span['span_id'], ns(start), ns(end)))
+
+    kaniko_span = next((span for span in spans if span['name'] == 'kaniko'), None)
+    if kaniko_span and (TRACE_FILE or TRACE_COLLECTOR_URL):
+        steps = get_kaniko_steps(pod)
+        for (step, started), (_, ended) in zip(steps, steps[1:] + [(None, times['kaniko_finished'])]):
+            if step:
+                spans.append(new_span(step, kaniko_span['span_id'], int(started.timestamp() * 1e9), int(ended.timestamp() * 1e9)))
+            elif not times['pushing']:
+                # the push was not seen by this service instance, but kaniko logged it
+                spans.append(new_span('push', job_span['span_id'], int(started.timestamp() * 1e9), ns('kaniko_finished')))
+    return spans
+
+def get_job_status(job_id):
+    '''
+    This method is run by the `/job/{job_id}` endpoint.
+    Based on a GET request, it retrieves the status of the Kaniko job and the results if the job has completed.
+
+    The status is served from `JOB_INDEX` while it is in sync, and read from the Kubernetes API otherwise.
+    Responses carry the resource version of the job as their `ETag`, so clients polling with `If-None-Match` get an empty
+    `304 Not Modified` until the job changes. Jobs waiting in the build queue report their `queue_position`.
+    For the group id of a matrix build, the aggregated status of its jobs is returned (see `get_job_group_status`), and
+    for a `/test` job its status in `TEST_JOBS`.
+
+    Args:
+        job_id (str): valid Chassis job identifier, generated by `create_job` method
+
+    Returns:
+        Dict: Dictionary containing corresponding job data of job `job_id` 
+    '''
+    if job_id.startswith(f'{K_JOB_NAME}-group-'):
+        group_status = get_job_group_status(job_id)
+        return group_status if group_status else Response(f"Job group not found",404)
+    if job_id.startswith(f'{K_JOB_NAME}-test-'):
+        test_status = TEST_JOBS.get(job_id)
+        return test_status if test_status else Response(f"Job not found",404)
+
+    cached = JOB_INDEX.get(job_id) if JOB_INDEX.synced else None
+    if cached:
+        resource_version, job_data = cached
+    else:
+        if CHASSIS_DEV:
+            # if you are doing local dev you need to point at the local kubernetes cluster with your config file
+            kubefile = os.getenv("CHASSIS_KUBECONFIG")
+            config.load_kube_config(kubefile)
+        else:
+            # if the service is running inside a cluster during production then the config can be inherited
+            config.load_incluster_config()
+
+        batch_v1 = client.BatchV1Api()
+
+        try:
+            job = batch_v1.read_namespaced_job(job_id, ENVIRONMENT)
+        except ApiException as e:
+            logger.error(f'Exception when getting job status: {e}')
+            return e.body
+        resource_version, job_data = job.metadata.resource_version, get_job_data(job)
+
+    # the position changes without the job changing, so it is part of the ETag
+    queue_position = JOB_INDEX.queue_position(job_id)
+    job_data = dict(job_data, queue_position=queue_position)
+    etag = f'{resource_version}-{queue_position}' if queue_position else resource_version
+
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+
+    return job_data, 200, {'ETag': f'"{etag}"'}
+
+def get_job_events(job_id):
+    '''
+    This method is run by the `/job/{job_id}/events` endpoint.
+    Based on a GET request, it streams the phase transitions of the Kaniko job as server-sent events (see `get_job_phase`),
+    starting with its current phase and ending after `succeeded` or `failed`, or after the optional `timeout` query parameter in seconds.
+    The phases of a `/test` job are `queued`, `running`, `succeeded` and `failed`, those of a matrix build the combined
+    phases of its variants (see `JobGroupPhases`).
+
+    Args:
+        job_id (str): valid Chassis job identifier, generated by `create_job` method
+
+    Returns:
+        Response: `text/event-stream` response with one `phase` event per transition
+    '''
+    timeout = request.args.get('timeout', type=float)
+
+    if job_id.startswith(f'{K_JOB_NAME}-test-'):
+        jobs = TEST_JOBS
+    elif job_id.startswith(f'{K_JOB_NAME}-group-'):
+        jobs = JobGroupPhases()
+    else:
+        jobs = JOB_INDEX
+    if jobs is not TEST_JOBS and not JOB_INDEX.synced:
+        return Response(f"503 Service Unavailable: Job index is not in sync yet, please retry",503)
+
+    # a job that was just created can take a moment to show up in the index
+    phase = jobs.wait_for_phase(job_id, None, 5)
+    if phase is None:
+        return Response(f"Job not found",404)
+
+    def stream(phase):
+        endby = time.time() + timeout if (timeout is not None) else None
+        while True:
+            yield f'event: phase\ndata: {json.dumps({"job_id": job_id, "phase": phase})}\n\n'
+            if phase in ('succeeded', 'failed'):
+                return
+
+            previous = phase
+            while phase == previous:
+                remaining = endby - time.time() if (endby is not None) else 15
+                if remaining <= 0:
+                    return
+                phase = jobs.wait_for_phase(job_id, previous, min(remaining, 15))
+                if phase == previous:
+                    # keeps proxies from closing idle connections
+                    yield ': keepalive\n\n'
+            if phase is None:
+                return
+
+    return Response(stream(phase), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def get_tar_checksum(path):
+    '''
+    This utility method returns the SHA-256 checksum of an image tar archive. It is computed once and kept next to the
+    archive in `<path>.sha256`, so that every download of a multi-GB archive does not read it twice.
+
+    Args:
+        path (str): path of the image tar archive
+
+    Returns:
+        str: hex digest of the archive, or None if it does not exist
+    '''
+    if not os.path.isfile(path):
+        return None
+
+    checksum_path = f'{path}.sha256'
+    if os.path.isfile(checksum_path) and os.path.getmtime(checksum_path) >= os.path.getmtime(path):
+        with open(checksum_path) as f:
+            return f.read().strip()
+
+    checksum = get_file_sha256(path)
+    with open(checksum_path, 'w') as f:
+        f.write(checksum)
+    return checksum
+
+def compress_file(path, encoding):
+    '''
+    This utility method streams a file compressed with `encoding` (`zstd` or `gzip`) in chunks, for downloads requested
+    with a matching `Accept-Encoding`.
+
+    Args:
+        path (str): path of the file
+        encoding (str): `zstd` or `gzip`
+
+    Returns:
+        generator: compressed chunks
+    '''
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=TAR_COMPRESSION_LEVEL).compressobj()
+    else:
+        compressor = zlib.compressobj(TAR_COMPRESSION_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+    yield compressor.flush()
+
+def download_tar(job_id):
+    '''
+    This method is run by the `/job/{job_id}/download-tar` endpoint. 
+    It downloads the container image from kaniko, built during the chassis job with the name `job_id`
+
+    Downloads can be resumed: `Range` requests (also with `If-Range`) are answered with the requested part of the archive.
+    Whole-archive requests accepting `zstd` or `gzip` encoding are streamed compressed. Every response carries the
+    SHA-256 checksum of the (uncompressed) archive in the `X-Checksum-Sha256` header.
+
+    Args:
+        job_id (str): valid Chassis job identifier, generated by `create_job` method 
+    
+    Returns:
+        Dict: response from `download_tar` endpoint
+    '''
+    uid = job_id.split(f'{K_JOB_NAME}-')[1]
 
     if PV_MODE:
-        return send_from_directory(DATA_DIR, path=f'kaniko_image-{uid}.tar', as_attachment=False)
+        filename = f'kaniko_image-{uid}.tar'
+        checksum = get_tar_checksum(os.path.join(DATA_DIR, filename))
+        encoding = request.accept_encodings.best_match(['zstd', 'gzip'])
+        if checksum and encoding and 'Range' not in request.headers:
+            response = Response(compress_file(os.path.join(DATA_DIR, filename), encoding), mimetype='application/x-tar',
+                                headers={'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'})
+        else:
+            response = send_from_directory(DATA_DIR, path=filename, as_attachment=False, conditional=True)
+            response.headers['Accept-Ranges'] = 'bytes'
+        if checksum:
+            response.headers['X-Checksum-Sha256'] = checksum
+        return response
     else:
         return Response(f"400 Bad Request: Tar download not available in production mode, please use 'docker pull ...'",400)
 
@@ -704,12 +3431,42 @@ def build_image():
     Returns:
         Dict: information about whether or not the image build resulted in an error
     '''
-    
-    if not ('image_data' in request.files and 'model' in request.files):
+    # This is a future proofing variable in case we encounter a model that cannot be converted into mlflow.
+    # It will remain hardcoded for now.
+    module_name = 'mlflow'
+
+    # This name is a random id used to ensure that all jobs are uniquely named and traceable.
+    random_name = str(uuid.uuid4())
+
+    # The request continues the trace started by the SDK, and its jobs carry it on
+    trace = Trace(request.headers.get('traceparent'))
+    after_this_request(trace.finish)
+
+    # The model archive is extracted while it is uploaded: straight onto the shared volume in PV mode,
+    # otherwise into a staging directory the build context is created from
+    staging_dir = f'{DATA_DIR}/flavours/{module_name}/model-{random_name}' if PV_MODE else tempfile.mkdtemp()
+    model_dir = staging_dir if PV_MODE else f'{staging_dir}/model-{random_name}'
+    upload_start = time.perf_counter()
+    try:
+        with trace.span('upload'):
+            files = ingest_upload(model_dir)
+    except (ValueError, zipfile.BadZipFile) as e:
+        rmtree(staging_dir, ignore_errors=True)
+        BUILD_FAILURES.labels('invalid_upload').inc()
+        return f'Invalid upload: {e}', 400
+
+    if not ('image_data' in files and 'model' in files):
+        rmtree(staging_dir, ignore_errors=True)
+        BUILD_FAILURES.labels('invalid_upload').inc()
         return 'Both model and image_data are required', 500
 
+    UPLOAD_SECONDS.observe(time.perf_counter() - upload_start)
+    UPLOAD_BYTES.observe(files['model'].size)
+    UNZIP_SECONDS.observe(files['model'].seconds)
+    trace.timing['unzip'] = files['model'].seconds
+
     # retrieve image_data and populate variables accordingly
-    image_data = json.load(request.files.get('image_data'))
+    image_data = json.load(files.get('image_data'))
     model_name = image_data.get('model_name')
     image_name = image_data.get('name')
     gpu = image_data.get('gpu')
@@ -718,58 +3475,517 @@ def build_image():
     publish = True if publish else ''
     registry_auth = image_data.get('registry_auth')
     webhook = image_data.get('webhook')
+    priority = int(image_data.get('priority') or 0)
+    # the slim runtime stage is only available for amd64 images
+    slim = SLIM_IMAGES if image_data.get('slim') is None else bool(image_data.get('slim'))
+
+    # builds are queued fairly across callers, identified by their authorization header or else their address
+    caller = hashlib.sha256((request.headers.get('Authorization') or request.remote_addr or '').encode()).hexdigest()[:16]
+
+    # retrieve binary representation of the metadata
+    metadata_data = files.get('metadata_data')
+
+    # several CPU/GPU and amd64/arm64 variants can be built from one upload
+    variants = image_data.get('variants')
+    if variants:
+        return build_matrix(variants, image_name, model_name, module_name, random_name, model_dir, staging_dir,
+                            metadata_data, files['model'].size, publish, registry_auth, webhook, priority, caller, trace,
+                            slim)
+
+    dockerfile = choose_dockerfile(gpu,arm64)
+    slim = slim and not arm64
+
+    # Identical inputs always produce the same image, so reuse a previously pushed one if there is any
+    fingerprint = get_build_fingerprint(model_dir, metadata_data, module_name, model_name, dockerfile, slim)
+    if publish:
+        record = get_cached_build(fingerprint, get_image_destination(image_name), registry_auth)
+        if record:
+            rmtree(staging_dir, ignore_errors=True)
+            if webhook:
+                try:
+                    requests.post(webhook,json=record['status'],timeout=REQUEST_TIMEOUT_SECONDS)
+                except Exception as e:
+                    logger.error(f'Exception when posting status of {record["job_id"]} to webhook: {e}')
+            return {'error': False, 'job_id': record['job_id'], 'cached': True, 'digest': record['digest']}
+
+    # Identical builds requested at the same time, e.g. by several CI runners, share one kaniko job
+    job_id = f'{K_JOB_NAME}-{random_name}'
+    build_key = get_build_key(fingerprint, get_image_destination(image_name) if publish else None, registry_auth)
+    in_flight = claim_build(build_key, job_id)
+    if in_flight:
+        rmtree(staging_dir, ignore_errors=True)
+        if webhook:
+            attach_webhook(in_flight, webhook)
+        logger.info(f'Build {fingerprint} is in flight as {in_flight}')
+        return {'error': False, 'job_id': in_flight, 'deduplicated': True}
 
-    # retrieve binary representations for all three variables
-    model = request.files.get('model')
-    metadata_data = request.files.get('metadata_data')
+    try:
+        # Models with the same dependencies share one environment stage, installed from their lock when there is one
+        env_hash, env_files = get_conda_env(model_dir)
+        env_files = add_conda_lock(env_hash, env_files)
+        env_image, build_env = resolve_env_image(env_hash, module_name, dockerfile)
 
-    # This is a future proofing variable in case we encounter a model that cannot be converted into mlflow.
-    # It will remain hardcoded for now.
-    module_name = 'mlflow'
+        # Size the build from the model, its dependencies and how similar builds went
+        resource_key = get_resource_key(env_hash, files['model'].size)
+        resources = get_build_resources(files['model'].size, env_files, gpu, build_env or not env_image, resource_key)
 
-    # This name is a random id used to ensure that all jobs are uniquely named and traceable.
-    random_name = str(uuid.uuid4())
+        conda_env_dir = f'envs/{env_hash}'
+        if PV_MODE:
+            conda_env_dir = f'envs/{stage_conda_env(env_files, f"{DATA_DIR}/flavours/{module_name}/envs")}'
+            context_uri = None
+        else:
+            with trace.span('upload_context'):
+                context_uri = upload_context(model_dir, module_name, random_name, metadata_data, dockerfile, env_hash, env_files)
+            rmtree(staging_dir, ignore_errors=True)
+
+            if not context_uri:
+                BUILD_FAILURES.labels('context_upload').inc()
+                return Response(f"403 Forbidden: Cloud storage credentials could not push to context bucket.",403)
+
+        metadata_path = extract_metadata(metadata_data, module_name, random_name)
+
+        # this path is the local location that kaniko will store the image it creates
+        path_to_tar_file = f'{DATA_DIR if PV_MODE else "/tar"}/kaniko_image-{random_name}.tar'
+
+        logger.debug(f'Request data: {image_name}, {module_name}, {model_name}, {path_to_tar_file}')
+        with trace.span('run_kaniko'):
+            error = run_kaniko(
+                image_name,
+                module_name,
+                model_name,
+                path_to_tar_file,
+                random_name,
+                publish,
+                registry_auth,
+                gpu,
+                arm64,
+                context_uri,
+                metadata_path,
+                webhook,
+                fingerprint,
+                conda_env_dir,
+                env_image,
+                build_env,
+                priority,
+                caller,
+                resources,
+                resource_key,
+                build_key=build_key,
+                trace=trace,
+                slim=slim
+            )
+
+        if error:
+            return {'error': error, 'job_id': None}
+
+        return {'error': False, 'job_id': job_id}
+    finally:
+        release_build(build_key)
 
-    # Unzip model archive
+def get_variant_name(gpu, arm64):
+    '''
+    This utility method names a build variant of a matrix build, e.g. `gpu-amd64`.
+
+    Args:
+        gpu (bool): whether the variant runs on GPU
+        arm64 (bool): whether the variant runs on ARM64 architecture
+
+    Returns:
+        str: variant name, also used as tag suffix of the variant image
+    '''
+    return f'{"gpu" if gpu else "cpu"}-{"arm64" if arm64 else "amd64"}'
+
+def build_matrix(variants, image_name, model_name, module_name, random_name, model_dir, staging_dir, metadata_data,
+                 model_size, publish, registry_auth, webhook, priority, caller, trace, slim=False):
+    '''
+    This utility method runs the matrix build requested by `/build` with a `variants` list: the context is staged or
+    uploaded once and one kaniko job per CPU/GPU and amd64/arm64 variant builds from it in parallel. Each variant is
+    pushed to `<tag>-<variant>`, and once all of them are pushed `publish_manifest_lists` points `<tag>` (CPU variants)
+    and `<tag>-gpu` (GPU variants) at a manifest list of their architectures. The jobs form a job group whose status
+    is served by `/job/{job_id}` under the group id. A variant identical to a build in flight attaches to its job, like
+    a single build does, and the group is completed along with that job.
+
+    Args:
+        variants (list): dictionaries with the `gpu` and `arm64` flags of every variant
+        image_name (str): container image name
+        model_name (str): name of model to package
+        module_name (str): reference module to locate location within service input is saved
+        random_name (str): random id of the request, naming the group and its shared context
+        model_dir (str): directory the model archive was extracted into by `ingest_upload`
+        staging_dir (str): directory to remove once the context has been uploaded (S3 mode only)
+        metadata_data (FileStorage): model metadata sent by the user, if any
+        model_size (int): size of the uploaded model archive in bytes
+        publish (bool): determines if images will be published to Docker registry
+        registry_auth (str): Docker registry authorization credentials
+        webhook (str): Optional webhook to post the final group status to
+        priority (int): build queue priority of the variant jobs
+        caller (str): build queue caller of the variant jobs
+        trace (Trace): trace of the request, carried on by the variant jobs
+        slim (bool): whether the amd64 variants are built on the slim runtime stage
+
+    Returns:
+        Dict: information about whether or not the builds resulted in an error, with the group id as `job_id`
+    '''
+    group_id = f'{K_JOB_NAME}-group-{random_name}'
+    name, _, tag = image_name.rpartition(':') if ':' in image_name.rsplit('/', 1)[-1] else (image_name, '', 'latest')
+
+    group = {'jobs': {}, 'manifest_lists': {}, 'webhook': webhook, 'created': time.time()}
+    for variant in variants:
+        gpu, arm64 = bool(variant.get('gpu')), bool(variant.get('arm64'))
+        variant_name = get_variant_name(gpu, arm64)
+        group['jobs'][variant_name] = {
+            'gpu': gpu,
+            'arm64': arm64,
+            'image_name': f'{name}:{tag}-{variant_name}',
+            'job_id': f'{K_JOB_NAME}-{uuid.uuid4()}'
+        }
+        if publish:
+            manifest_list = get_image_destination(f'{name}:{tag}{"-gpu" if gpu else ""}')
+            group['manifest_lists'].setdefault(manifest_list, []).append(variant_name)
+
+    # Models with the same dependencies share one environment stage, and all variants share one context
+    env_hash, env_files = get_conda_env(model_dir)
+    env_files = add_conda_lock(env_hash, env_files)
+    conda_env_dir = f'envs/{env_hash}'
     if PV_MODE:
-        unzip_model(model, module_name, random_name)
+        conda_env_dir = f'envs/{stage_conda_env(env_files, f"{DATA_DIR}/flavours/{module_name}/envs")}'
         context_uri = None
     else:
-        dockerfile = choose_dockerfile(gpu,arm64)
-        context_uri = upload_context(model, module_name, random_name, metadata_data, dockerfile)
-
+        with trace.span('upload_context'):
+            context_uri = upload_context(model_dir, module_name, random_name, metadata_data, choose_dockerfile(False, False),
+                                         env_hash, env_files)
         if not context_uri:
+            rmtree(staging_dir, ignore_errors=True)
             return Response(f"403 Forbidden: Cloud storage credentials could not push to context bucket.",403)
 
-    metadata_path = extract_metadata(metadata_data, module_name, random_name)
+    metadata_path = extract_metadata(metadata_data, module_name, random_name)
+
+    for variant_name, entry in group['jobs'].items():
+        dockerfile = choose_dockerfile(entry['gpu'], entry['arm64'])
+        variant_slim = slim and not entry['arm64']
+        fingerprint = get_build_fingerprint(model_dir, metadata_data, module_name, model_name, dockerfile, variant_slim)
+        if publish:
+            record = get_cached_build(fingerprint, get_image_destination(entry['image_name']), registry_auth)
+            if record:
+                entry.update(job_id=record['job_id'], digest=record['digest'], cached=True)
+                continue
+
+        build_key = get_build_key(fingerprint, get_image_destination(entry['image_name']) if publish else None, registry_auth)
+        in_flight = claim_build(build_key, entry['job_id'])
+        if in_flight:
+            attach_group(in_flight, group_id)
+            logger.info(f'Build {fingerprint} is in flight as {in_flight}')
+            entry.update(job_id=in_flight, deduplicated=True)
+            continue
+
+        try:
+            env_image, build_env = resolve_env_image(env_hash, module_name, dockerfile)
+            resource_key = get_resource_key(env_hash, model_size)
+            resources = get_build_resources(model_size, env_files, entry['gpu'], build_env or not env_image, resource_key)
+            variant_random_name = entry['job_id'].split(f'{K_JOB_NAME}-')[1]
+
+            with trace.span('run_kaniko'):
+                error = run_kaniko(
+                    entry['image_name'],
+                    module_name,
+                    model_name,
+                    f'{DATA_DIR if PV_MODE else "/tar"}/kaniko_image-{variant_random_name}.tar',
+                    variant_random_name,
+                    publish,
+                    registry_auth,
+                    entry['gpu'],
+                    entry['arm64'],
+                    context_uri,
+                    metadata_path,
+                    None,
+                    fingerprint,
+                    conda_env_dir,
+                    env_image,
+                    build_env,
+                    priority,
+                    caller,
+                    resources,
+                    resource_key,
+                    group_id,
+                    random_name,
+                    build_key=build_key,
+                    trace=trace,
+                    slim=variant_slim
+                )
+        finally:
+            release_build(build_key)
+        if error:
+            entry['error'] = error
+
+    if not PV_MODE:
+        rmtree(staging_dir, ignore_errors=True)
+
+    write_index_record('job-groups', group_id, group)
+
+    # nothing left to wait for if every variant was built before, or attached to a build that finished meanwhile
+    complete_job_group(group_id, registry_auth)
+
+    return {'error': False, 'job_id': group_id,
+            'jobs': {variant_name: entry['job_id'] for variant_name, entry in group['jobs'].items()}}
+
+def publish_manifest_lists(group, registry_auth):
+    '''
+    This utility method pushes the manifest lists of a matrix build, each combining the architectures of its variants.
+
+    Args:
+        group (dict): job group record written by `build_matrix`
+        registry_auth (str): Docker registry authorization credentials
+
+    Returns:
+        dict: digest of every pushed manifest list keyed by its destination
+    '''
+    pushed = {}
+    for destination, variant_names in group['manifest_lists'].items():
+        host, repository, tag = parse_image_destination(destination)
+        basic_auth = get_registry_basic_auth(registry_auth, host)
+        scope = f'repository:{repository}:pull,push'
+        base_url = f'https://{host}/v2/{repository}/manifests'
+
+        manifests = []
+        for variant_name in variant_names:
+            entry = group['jobs'][variant_name]
+            digest = entry.get('digest') or get_pushed_digest(entry['job_id'])
+            manifest = registry_request('GET', f'{base_url}/{digest}', basic_auth, scope, headers={'Accept': REGISTRY_MANIFEST_TYPES})
+            manifest.raise_for_status()
+            manifests.append({
+                'mediaType': manifest.headers['Content-Type'],
+                'size': len(manifest.content),
+                'digest': digest,
+                'platform': {'architecture': 'arm64' if entry['arm64'] else 'amd64', 'os': 'linux'}
+            })
+
+        manifest_list = json.dumps({
+            'schemaVersion': 2,
+            'mediaType': 'application/vnd.docker.distribution.manifest.list.v2+json',
+            'manifests': manifests
+        }).encode()
+        res = registry_request('PUT', f'{base_url}/{tag}', basic_auth, scope,
+                               headers={'Content-Type': 'application/vnd.docker.distribution.manifest.list.v2+json'},
+                               data=manifest_list)
+        res.raise_for_status()
+        pushed[destination] = f'sha256:{hashlib.sha256(manifest_list).hexdigest()}'
+        logger.info(f'Pushed manifest list {destination} with {", ".join(variant_names)}')
+
+    return pushed
+
+def complete_job_group(group_id, registry_auth):
+    '''
+    This utility method completes a matrix build once none of its jobs is running anymore: if all variants succeeded,
+    their manifest lists are published, and the final group status is posted to the group's webhook.
+    It is run by `complete_job` for every job of the group and does nothing until the last one finishes.
+
+    Args:
+        group_id (str): job group id returned by `build_matrix`
+        registry_auth (str): Docker registry authorization credentials
+
+    Returns:
+        None
+    '''
+    group = read_index_record('job-groups', group_id)
+    if not group or group.get('completed'):
+        return
+
+    states = [get_group_job_state(entry) for entry in group['jobs'].values()]
+    if 'active' in states:
+        return
+
+    if group['manifest_lists'] and all(state == 'succeeded' for state in states):
+        try:
+            group['pushed'] = publish_manifest_lists(group, registry_auth)
+        except Exception as e:
+            logger.error(f'Exception when publishing manifest lists of {group_id}: {e}')
+            group['manifest_error'] = str(e)
+
+    group['completed'] = time.time()
+    write_index_record('job-groups', group_id, group)
+
+    if group.get('webhook'):
+        try:
+            requests.post(group['webhook'],json=get_job_group_status(group_id),timeout=REQUEST_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.error(f'Exception when posting status of {group_id} to webhook: {e}')
+
+def get_group_job_state(entry):
+    '''
+    This utility method returns whether a variant job of a matrix build is `active`, `succeeded` or `failed`.
+
+    Args:
+        entry (dict): variant entry of a job group record written by `build_matrix`
+
+    Returns:
+        str: state of the variant job
+    '''
+    if entry.get('cached'):
+        return 'succeeded'
+    if entry.get('error'):
+        return 'failed'
+
+    job = JOB_INDEX.job(entry['job_id'])
+    if not job:
+        try:
+            job = client.BatchV1Api().read_namespaced_job(entry['job_id'], ENVIRONMENT)
+        except ApiException as e:
+            logger.error(f'Exception when getting job status: {e}')
+            return 'failed'
+
+    if job.status.succeeded:
+        return 'succeeded'
+    return 'failed' if job.status.failed else 'active'
+
+def get_job_group_status(group_id):
+    '''
+    This utility method aggregates the status of the jobs of a matrix build in the shape of a job status: the group
+    succeeds once all variants succeeded and their manifest lists were published, and fails as soon as any of this fails.
+
+    Args:
+        group_id (str): job group id returned by `build_matrix`
+
+    Returns:
+        Dict: Dictionary containing the status of the group and, as result, the jobs of its variants and pushed manifest lists
+    '''
+    group = read_index_record('job-groups', group_id)
+    if not group:
+        return None
+
+    states = {variant_name: get_group_job_state(entry) for variant_name, entry in group['jobs'].items()}
+    failed = 'failed' in states.values() or bool(group.get('manifest_error'))
+    succeeded = not failed and bool(group.get('completed'))
+
+    status = {
+        'active': (len(states) - list(states.values()).count('succeeded')) if not (failed or succeeded) else None,
+        'succeeded': 1 if succeeded else None,
+        'failed': 1 if failed else None,
+        'conditions': [{'type': 'Failed' if failed else 'Complete', 'status': 'True'}] if (failed or succeeded) else None
+    }
+    result = {
+        'jobs': {variant_name: dict(job_id=entry['job_id'], state=states[variant_name], error=entry.get('error'))
+                 for variant_name, entry in group['jobs'].items()},
+        'manifest_lists': group.get('pushed', {}),
+        'error': group.get('manifest_error')
+    }
+    return {'result': result, 'status': status}
+
+class JobGroupPhases:
+    '''
+    Phases of the matrix builds streamed by `/job/{job_id}/events`. A group is in the earliest phase of its variant jobs,
+    counting variants that succeeded as `pushing` until the manifest lists are published, and `succeeded` or `failed`
+    like `get_job_group_status`. Groups are polled, since their manifest lists are published outside the job index.
+    '''
+    PHASES = ['queued', 'scheduled', 'building', 'pushing']
+
+    def phase(self, group_id):
+        '''
+        Returns the phase of job group `group_id`, or None if there is no such group.
+        '''
+        group_status = get_job_group_status(group_id)
+        if not group_status:
+            return None
+        if group_status['status']['failed']:
+            return 'failed'
+        if group_status['status']['succeeded']:
+            return 'succeeded'
+        phases = [JOB_INDEX.phase(job['job_id']) or 'queued' if job['state'] == 'active' else 'pushing'
+                  for job in group_status['result']['jobs'].values()]
+        return min(phases, key=lambda phase: self.PHASES.index(phase) if phase in self.PHASES else len(self.PHASES))
+
+    def wait_for_phase(self, group_id, phase, timeout):
+        '''
+        Blocks until the phase of job group `group_id` differs from `phase` or `timeout` seconds have passed, and returns its phase.
+        '''
+        endby = time.time() + timeout
+        while True:
+            current = self.phase(group_id)
+            if current != phase or time.time() >= endby:
+                return current
+            time.sleep(max(min(endby - time.time(), 1), 0))
+
+def get_file_sha256(path):
+    '''
+    This utility method returns the SHA-256 checksum of a file.
+
+    Args:
+        path (str): path of the file
 
-    # this path is the local location that kaniko will store the image it creates
-    path_to_tar_file = f'{DATA_DIR if PV_MODE else "/tar"}/kaniko_image-{random_name}.tar'
+    Returns:
+        str: hex digest of the file
+    '''
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
 
-    logger.debug(f'Request data: {image_name}, {module_name}, {model_name}, {path_to_tar_file}')
-    error = run_kaniko(
-        image_name,
-        module_name,
-        model_name,
-        path_to_tar_file,
-        random_name,
-        publish,
-        registry_auth,
-        gpu,
-        arm64,
-        context_uri,
-        metadata_path,
-        webhook
-    )
+def sync_directory(src, dst):
+    '''
+    This utility method incrementally syncs the files of directory `src` into `dst`, which may also hold files that are
+    not from `src`. The files synced last time are recorded with their checksum in the manifest `dst/.chassis-manifest.json`:
+    a file is only rewritten, atomically, when its checksum changed or its copy in `dst` was changed, and files that are
+    no longer in `src` are deleted. Files not in the manifest, like the model directories of running builds, are left alone.
 
-    if error:
-        return {'error': error, 'job_id': None}
+    Args:
+        src (str): source directory
+        dst (str): destination directory
 
-    return {'error': False, 'job_id': f'{K_JOB_NAME}-{random_name}'}
+    Returns:
+        Tuple(int, int): numbers of written and deleted files
+    '''
+    manifest_path = os.path.join(dst, '.chassis-manifest.json')
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    synced = {}
+    written = 0
+    for root, _, filenames in os.walk(src):
+        for filename in filenames:
+            relative_path = os.path.relpath(os.path.join(root, filename), src)
+            src_path, dst_path = os.path.join(src, relative_path), os.path.join(dst, relative_path)
+            checksum = get_file_sha256(src_path)
+
+            record = manifest.get(relative_path)
+            dst_stat = os.stat(dst_path) if os.path.isfile(dst_path) else None
+            unchanged = dst_stat and record and record['sha256'] == checksum and \
+                [record['size'], record['mtime_ns']] == [dst_stat.st_size, dst_stat.st_mtime_ns]
+            if not (unchanged or (dst_stat and not record and get_file_sha256(dst_path) == checksum)):
+                os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+                # builds reading the file see either the old or the new one
+                tmp_path = f'{dst_path}.sync-{uuid.uuid4()}'
+                copy2(src_path, tmp_path)
+                os.replace(tmp_path, dst_path)
+                dst_stat = os.stat(dst_path)
+                written += 1
+            synced[relative_path] = {'sha256': checksum, 'size': dst_stat.st_size, 'mtime_ns': dst_stat.st_mtime_ns}
+
+    deleted = 0
+    for relative_path in set(manifest) - set(synced):
+        dst_path = os.path.join(dst, relative_path)
+        if os.path.isfile(dst_path):
+            os.remove(dst_path)
+            deleted += 1
+        # drop the directories the deleted files leave empty
+        parent = os.path.dirname(dst_path)
+        while os.path.abspath(parent) != os.path.abspath(dst) and os.path.isdir(parent) and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+
+    tmp_path = f'{manifest_path}.sync-{uuid.uuid4()}'
+    with open(tmp_path, 'w') as f:
+        json.dump(synced, f)
+    os.replace(tmp_path, manifest_path)
+    return written, deleted
 
 def copy_required_files_for_kaniko():
     '''
-    Copies required files over to a shared volume with Kaniko so it can access them.
+    Copies required files over to a shared volume with Kaniko so it can access them. The flavour files are synced
+    incrementally (see `sync_directory`), so that the model directories and environments of builds that are still
+    running when the service restarts are kept.
 
     Args:
         None (None)
@@ -780,15 +3996,210 @@ def copy_required_files_for_kaniko():
     # if using a special debug docker file this is where it goes
     try:
         for dir_to_copy in 'flavours'.split():
-            dst = f'{DATA_DIR}/{dir_to_copy}'
-
-            if os.path.exists(dst):
-                rmtree(dst)
-
-            copytree(f'./{dir_to_copy}', dst)
+            written, deleted = sync_directory(f'./{dir_to_copy}', f'{DATA_DIR}/{dir_to_copy}')
+            logger.info(f'Synced {dir_to_copy}: {written} files written, {deleted} deleted')
     except OSError as e:
         print(f'Directory not copied. Error: {e}')
 
+class CondaEnvCache:
+    '''
+    Conda environments of the `/test` requests, keyed by the hash of the model's dependencies (see `get_conda_env`) and
+    kept between requests, so that testing a model whose dependencies did not change only runs the model. Environments
+    are installed from their lock when there is one, and the lock of every other environment is exported once it has
+    been created (see `export_conda_lock`), so that builds install from it too.
+
+    An environment is created once even if several requests need it at the same time. Whenever a request is done with
+    an environment, the least recently used environments that are not in use are removed while the cache takes more
+    than `budget` bytes.
+
+    Attributes:
+        directory (str): directory the environments are created in, one prefix per hash
+        budget (int): disk budget of the cache in bytes
+    '''
+    def __init__(self, directory, budget):
+        self.directory = directory
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._creating = {}
+        self._in_use = {}
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def acquire(self, env_hash, conda_yaml_path):
+        '''
+        Yields the prefix of environment `env_hash`, which is created from `conda_yaml_path` unless it is cached.
+        Raises `subprocess.CalledProcessError` if it cannot be created.
+        '''
+        prefix = os.path.join(self.directory, env_hash)
+        with self._lock:
+            creating = self._creating.setdefault(env_hash, threading.Lock())
+            self._in_use[env_hash] = self._in_use.get(env_hash, 0) + 1
+        try:
+            with creating:
+                # the record of an environment is written once it has been created completely
+                cached = os.path.exists(f'{prefix}.json')
+                TEST_ENV_REQUESTS.labels(str(cached).lower()).inc()
+                lock = read_index_record('conda-locks', env_hash)
+                if not cached:
+                    self._create(prefix, conda_yaml_path, lock)
+                    size = sum(os.path.getsize(os.path.join(root, filename)) for root, _, filenames in os.walk(prefix)
+                               for filename in filenames if not os.path.islink(os.path.join(root, filename)))
+                    with open(f'{prefix}.json', 'w') as f:
+                        json.dump({'size': size}, f)
+                    logger.info(f'Created test environment {env_hash} ({size / 1024 ** 3:.2f} GiB)')
+                if not lock:
+                    write_index_record('conda-locks', env_hash, export_conda_lock(prefix))
+            # the modification time of the record orders the environments by their last use
+            os.utime(f'{prefix}.json')
+            yield prefix
+        finally:
+            with self._lock:
+                self._in_use[env_hash] -= 1
+                if not self._in_use[env_hash]:
+                    del self._in_use[env_hash]
+                    del self._creating[env_hash]
+            self.evict()
+
+    def _create(self, prefix, conda_yaml_path, lock):
+        # the lock of the environment skips the solver, unless its packages cannot be installed anymore
+        if lock:
+            try:
+                install_conda_lock(lock, prefix)
+                return
+            except subprocess.CalledProcessError as e:
+                logger.warning(f'Could not install the lock of {prefix}, solving it again: {e.stderr.decode(errors="ignore")}')
+                rmtree(prefix, ignore_errors=True)
+        try:
+            subprocess.run(f'nice -n 10 conda env create -f {conda_yaml_path} -p {prefix}', capture_output=True,
+                           shell=True, executable='/bin/bash', check=True)
+        except subprocess.CalledProcessError:
+            rmtree(prefix, ignore_errors=True)
+            raise
+
+    def evict(self):
+        '''
+        Removes the least recently used environments that are not in use while the cache takes more than `budget` bytes.
+        '''
+        evicted = []
+        with self._lock:
+            entries = []
+            for filename in os.listdir(self.directory):
+                if filename.endswith('.json'):
+                    with open(os.path.join(self.directory, filename)) as f:
+                        size = json.load(f)['size']
+                    entries.append((os.path.getmtime(os.path.join(self.directory, filename)), filename[:-len('.json')], size))
+
+            total = sum(size for _, _, size in entries)
+            for _, env_hash, size in sorted(entries):
+                if total <= self.budget:
+                    break
+                if env_hash in self._in_use:
+                    continue
+                # the environment is moved away first, so that it can be created again while it is being removed
+                prefix = os.path.join(self.directory, env_hash)
+                os.remove(f'{prefix}.json')
+                os.rename(prefix, f'{prefix}.evicted-{uuid.uuid4()}')
+                evicted.append(env_hash)
+                total -= size
+
+        for filename in os.listdir(self.directory):
+            if '.evicted-' in filename:
+                rmtree(os.path.join(self.directory, filename), ignore_errors=True)
+        for env_hash in evicted:
+            logger.info(f'Evicted test environment {env_hash}')
+
+class TestJobs:
+    '''
+    The `/test` jobs of the service, run one at a time by each of `workers` threads. The environment creation and the
+    model run are subprocesses at a lower CPU priority than the service, so that tests neither block the request that
+    submitted them nor slow down uploads. Jobs are kept in memory until `clean` removes them.
+    '''
+    def __init__(self, workers):
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='test')
+        self._changed = threading.Condition()
+        self._jobs = {}
+
+    def __contains__(self, job_id):
+        with self._changed:
+            return job_id in self._jobs
+
+    def submit(self, job_id, fn, *args):
+        '''
+        Queues job `job_id`, which runs `fn(*args)` and succeeds unless the returned output has an error.
+        '''
+        with self._changed:
+            self._jobs[job_id] = {'phase': 'queued', 'created': datetime.now(timezone.utc), 'started': None,
+                                  'finished': None, 'result': None}
+            self._changed.notify_all()
+        self._executor.submit(self._run, job_id, fn, args)
+
+    def _run(self, job_id, fn, args):
+        self._update(job_id, phase='running', started=datetime.now(timezone.utc))
+        try:
+            result = fn(*args)
+        except Exception as e:
+            logger.exception(f'Exception when running test job {job_id}')
+            result = {'error': str(e)}
+        failed = any(key in result for key in ('env_error', 'model_error', 'error'))
+        self._update(job_id, phase='failed' if failed else 'succeeded', finished=datetime.now(timezone.utc), result=result)
+
+    def _update(self, job_id, **changes):
+        with self._changed:
+            self._jobs[job_id] = dict(self._jobs[job_id], **changes)
+            self._changed.notify_all()
+
+    def phase(self, job_id):
+        with self._changed:
+            return self._jobs[job_id]['phase'] if job_id in self._jobs else None
+
+    def count(self, phase):
+        with self._changed:
+            return sum(1 for job in self._jobs.values() if job['phase'] == phase)
+
+    def wait_for_phase(self, job_id, phase, timeout):
+        '''
+        Blocks until the phase of job `job_id` differs from `phase` or `timeout` seconds have passed, and returns its phase.
+        '''
+        with self._changed:
+            self._changed.wait_for(lambda: self.phase(job_id) != phase, timeout)
+            return self.phase(job_id)
+
+    def get(self, job_id):
+        '''
+        Returns the job data of job `job_id` in the shape of the job data of a build (see `get_job_data`), or None.
+        '''
+        with self._changed:
+            job = self._jobs.get(job_id)
+        if not job:
+            return None
+
+        def seconds(start, end):
+            return (job[end] - job[start]).total_seconds() if job[start] and job[end] else None
+
+        finished = job['phase'] in ('succeeded', 'failed')
+        status = {
+            'active': None if finished else 1,
+            'succeeded': 1 if job['phase'] == 'succeeded' else None,
+            'failed': 1 if job['phase'] == 'failed' else None,
+            'start_time': job['started'],
+            'completion_time': job['finished'],
+            'conditions': [{'type': 'Failed' if job['phase'] == 'failed' else 'Complete', 'status': 'True'}] if finished else None
+        }
+        timing = {'queued': seconds('created', 'started'), 'running': seconds('started', 'finished'),
+                  'total': seconds('created', 'finished')}
+        return {'result': job['result'], 'status': status, 'timing': timing}
+
+    def clean(self, ttl):
+        '''
+        Removes the jobs that finished more than `ttl` seconds ago and returns how many were removed.
+        '''
+        with self._changed:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['finished'] and (datetime.now(timezone.utc) - job['finished']).total_seconds() > ttl]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
 def extract_sample_input(sample_input_data, module_name, random_name):
     '''
     This utility method extracts sample input and returns a sample input data path.
@@ -809,76 +4220,143 @@ def extract_sample_input(sample_input_data, module_name, random_name):
 
     return sample_input_path
 
-def test_model():
+def run_model_test(unzipped_path, sample_input_path):
     '''
-    This method is run by the `/test` endpoint. It creates a new conda environment from the provided `conda.yaml` file and then tests the provided model in that conda environment with provided test input file.
+    This utility method runs a `/test` job on a test worker (see `TestJobs`): it tests the model in the conda environment
+    of its `conda.yaml` file, which is created unless `TEST_ENV_CACHE` already holds it, and then deletes the model and
+    the sample input.
 
     Args:
-        None (None): This method does not take any parameters
-    
+        unzipped_path (str): directory the model archive was extracted into by `ingest_upload`
+        sample_input_path (str): filepath to sample input data returned by `extract_sample_input`
+
     Returns:
-        Dict: model response to `/test` endpoint. Should contain either successful predictions or error message
+        Dict: model output, or the error of the environment creation or of the model
     '''
-    if not ('sample_input' in request.files and 'model' in request.files):
-        return 'Both sample input and model are required', 500
-
     output_dict = {}
 
-    # retrieve binary representations for both variables
-    model = request.files.get('model')
-    sample_input = request.files.get('sample_input')
+    try:
+        env_hash, _ = get_conda_env(unzipped_path)
+        yaml_path = os.path.join(unzipped_path, 'conda.yaml')
+        with TEST_ENV_CACHE.acquire(env_hash, yaml_path) as env_prefix:
+            try:
+                test_model_cmd = """
+                source activate {};
+                nice -n 10 python test_chassis_model.py {} {}
+                """.format(env_prefix,unzipped_path,sample_input_path)
+                test_ret = subprocess.run(test_model_cmd, capture_output=True, shell=True, executable='/bin/bash', check=True)
+                output_dict["model_output"] = test_ret.stdout.decode()
+            except subprocess.CalledProcessError as e:
+                output_dict["model_error"] = e.stderr.decode()
+    except subprocess.CalledProcessError as e:
+        print(e)
+        output_dict["env_error"] = e.stderr.decode()
+    finally:
+        rmtree(unzipped_path, ignore_errors=True)
+        if sample_input_path and os.path.exists(sample_input_path):
+            os.remove(sample_input_path)
+
+    return output_dict
+
+def test_model():
+    '''
+    This method is run by the `/test` endpoint. It receives the model and sample input and queues a test job, which tests
+    the model with the sample input on a test worker (see `run_model_test`). The status and result of the job are
+    served by `/job/{job_id}` and its phases (`queued`, `running`, `succeeded` or `failed`) by `/job/{job_id}/events`.
 
+    Args:
+        None (None): This method does not take any parameters
+    
+    Returns:
+        Dict: the `job_id` of the test job, or an error message
+    '''
     # This is a future proofing variable in case we encounter a model that cannot be converted into mlflow.
     # It will remain hardcoded for now.
     module_name = 'mlflow'
 
     # This name is a random id used to ensure that all jobs are uniquely named and traceable.
     random_name = str(uuid.uuid4())
+    job_id = f'{K_JOB_NAME}-test-{random_name}'
 
-    # Unzip model archive
-    unzipped_path = unzip_model(model, module_name, random_name)
+    # Unzip model archive while it is uploaded
+    unzipped_path = f'{DATA_DIR}/flavours/{module_name}/model-{random_name}'
+
+    # the model and sample input are deleted by the test job, or right away if it could not be queued
+    @after_this_request
+    def clean_up(response):
+        if job_id not in TEST_JOBS:
+            rmtree(unzipped_path, ignore_errors=True)
+            if sample_input_path and os.path.exists(sample_input_path):
+                os.remove(sample_input_path)
+        return response
+
+    sample_input_path = None
+    try:
+        files = ingest_upload(unzipped_path)
+    except (ValueError, zipfile.BadZipFile) as e:
+        return f'Invalid upload: {e}', 400
+
+    if not ('sample_input' in files and 'model' in files):
+        return 'Both sample input and model are required', 500
+
+    # retrieve binary representation of the sample input
+    sample_input = files.get('sample_input')
 
     # get sample input path
     sample_input_path = extract_sample_input(sample_input, module_name, random_name)
 
-    # create conda env, return error if fails
-    try:
-        tmp_env_name = str(time.time())
-        rm_env_cmd = "conda env remove --name {}".format(tmp_env_name)
-        yaml_path = os.path.join(unzipped_path,"conda.yaml")
-        create_env_cmd = "conda env create -f {} -n {}".format(yaml_path,tmp_env_name)
-        subprocess.run(create_env_cmd, capture_output=True, shell=True, executable='/bin/bash', check=True)
-    except subprocess.CalledProcessError as e:
-        print(e)
-        subprocess.run(rm_env_cmd, capture_output=True, shell=True, executable='/bin/bash')
-        output_dict["env_error"] = e.stderr.decode()
-        return output_dict
+    TEST_JOBS.submit(job_id, run_model_test, unzipped_path, sample_input_path)
+    return {'error': False, 'job_id': job_id}
 
-    # test model in env with sample input file, return error if fails
-    try:
-        test_model_cmd = """
-        source activate {};
-        python test_chassis_model.py {} {}
-        """.format(tmp_env_name,unzipped_path,sample_input_path)
-        test_ret = subprocess.run(test_model_cmd, capture_output=True, shell=True, executable='/bin/bash', check=True)
-        output_dict["model_output"] = test_ret.stdout.decode()
-    except subprocess.CalledProcessError as e:
-        subprocess.run(rm_env_cmd, capture_output=True, shell=True, executable='/bin/bash')
-        output_dict["model_error"] = e.stderr.decode()
-        return output_dict
+def get_job_pod(job_id):
+    '''
+    This utility method returns the name of the pod running the Kaniko job, from `JOB_INDEX` while it is in sync and
+    otherwise by selecting the pods of the job by their `job-name` label.
 
-    # if we make it here, test was successful, remove env and return output
-    subprocess.run(rm_env_cmd, capture_output=True, shell=True, executable='/bin/bash')
-    return output_dict
+    Args:
+        job_id (str): valid Chassis job identifier, generated by `create_job` method
+
+    Returns:
+        str: name of the pod running the job, or None if there is none
+    '''
+    pod = JOB_INDEX.pod(job_id) if JOB_INDEX.synced else None
+    if pod:
+        return pod.metadata.name
+
+    pods = client.CoreV1Api().list_namespaced_pod(ENVIRONMENT, label_selector=f'job-name={job_id}').items
+    return pods[0].metadata.name if pods else None
+
+def read_job_logs(job_id):
+    '''
+    This utility method reads the whole log of the kaniko container of a job, e.g. to include it in the status of a failed job.
+
+    Args:
+        job_id (str): valid Chassis job identifier, generated by `create_job` method
+
+    Returns:
+        str: log of the job, or None if it is not available
+    '''
+    try:
+        pod_name = get_job_pod(job_id)
+        if pod_name:
+            return client.CoreV1Api().read_namespaced_pod_log(name=pod_name, namespace=ENVIRONMENT, container='kaniko')
+    except ApiException as e:
+        logger.error(f'Exception when getting job logs: {e}')
+    return None
 
 def get_job_logs(job_id):
     '''
     This method is run by the `/job/{job_id}/logs` endpoint.
-    Based on a GET request, it retrieves the logs of the pod running the Kaniko job.
+    Based on a GET request, it streams the logs of the pod running the Kaniko job as a chunked plain text response.
+
+    The optional query parameters are `follow` to keep streaming until the build ends, `since` to only return the log of
+    the last given number of seconds, `tail` to only return the given number of last lines, and `container` to read the
+    `kaniko-env` container that builds a new environment stage instead of `kaniko`.
+
     Args:
         job_id (str): valid Chassis job identifier, generated by `create_job` method
     Returns:
-        Dict: Dictionary containing corresponding logs of job `job_id` 
+        Response: chunked response with the logs of job `job_id`
     '''
     if CHASSIS_DEV:
         # if you are doing local dev you need to point at the local kubernetes cluster with your config file
@@ -888,15 +4366,566 @@ def get_job_logs(job_id):
         # if the service is running inside a cluster during production then the config can be inherited
         config.load_incluster_config()
 
+    follow = request.args.get('follow', 'false').lower() in ('1', 'true', 'yes')
+    since = request.args.get('since', type=int)
+    tail = request.args.get('tail', type=int)
+    container = request.args.get('container', 'kaniko')
+
+    pod_name = get_job_pod(job_id)
+    if not pod_name:
+        logger.error(f'Exception when getting job logs: no pod found for {job_id}')
+        return Response(f"Job not found",400)
+
     try:
-        v1 = client.CoreV1Api()
-        pod_list = v1.list_namespaced_pod(ENVIRONMENT).items
-        pod_name = [pod.metadata.name for pod in pod_list if pod.metadata.name.startswith(job_id)][0]
-        logs = v1.read_namespaced_pod_log(name=pod_name, namespace=ENVIRONMENT)
-        return logs
-    except IndexError as e:
+        res = client.CoreV1Api().read_namespaced_pod_log(name=pod_name, namespace=ENVIRONMENT, container=container,
+                                                         follow=follow, since_seconds=since, tail_lines=tail,
+                                                         _preload_content=False)
+    except ApiException as e:
         logger.error(f'Exception when getting job logs: {e}')
-        return Response(f"Job not found",400)
+        return Response(e.body, e.status)
+
+    def stream():
+        try:
+            for chunk in res.stream():
+                yield chunk
+        finally:
+            res.release_conn()
+
+    return Response(stream(), mimetype='text/plain')
+
+def get_job_context_name(job):
+    '''
+    This utility method returns the request id whose model directory a Kaniko job builds from, which is the id of the
+    job itself, or of its matrix build whose variant jobs share one context. It is recorded in the `context` annotation
+    by `run_kaniko`; the build args are only read for jobs created before it was.
+
+    Args:
+        job (V1Job): Chassis job object
+
+    Returns:
+        str: request id of the job's model directory
+    '''
+    context = (job.metadata.annotations or {}).get('context')
+    if context:
+        return context
+    build_arg = get_job_build_arg(job, 'MODEL_DIR')
+    if build_arg and build_arg.startswith('model-'):
+        return build_arg[len('model-'):]
+    return job.metadata.name.split(f'{K_JOB_NAME}-')[1]
+
+def get_job_build_arg(job, name):
+    '''
+    This utility method returns the value of the kaniko build arg `name` of a job, searching its containers and init containers.
+
+    Args:
+        job (V1Job): Chassis job object
+        name (str): name of the build arg
+
+    Returns:
+        str: value of the build arg, or None if the job does not set it
+    '''
+    pod_spec = job.spec.template.spec
+    for container in (pod_spec.containers or []) + (pod_spec.init_containers or []):
+        for arg in container.args or []:
+            if arg.startswith(f'--build-arg={name}='):
+                return arg[len(f'--build-arg={name}='):]
+    return None
+
+def list_artifacts():
+    '''
+    This utility method lists the build artifacts left on the shared volume by `/build` and `/test` requests, i.e. image
+    tars with their checksums, model directories with their metadata and sample inputs, grouped by request id.
+
+    Args:
+        None (None)
+
+    Returns:
+        Dict: `paths`, total `size` in bytes and last modification time `mtime` of the artifacts of every request id
+    '''
+    artifacts = {}
+    for directory in (DATA_DIR, f'{DATA_DIR}/flavours/mlflow'):
+        for entry in os.scandir(directory):
+            match = ARTIFACT_PATTERN.match(entry.name)
+            if not match:
+                continue
+            artifact = artifacts.setdefault(match.group(1), {'paths': [], 'size': 0, 'mtime': 0})
+            artifact['paths'].append(entry.path)
+            artifact['mtime'] = max(artifact['mtime'], entry.stat().st_mtime)
+            if entry.is_dir(follow_symlinks=False):
+                artifact['size'] += sum(os.path.getsize(os.path.join(root, filename))
+                                        for root, _, filenames in os.walk(entry.path) for filename in filenames)
+            else:
+                artifact['size'] += entry.stat().st_size
+    return artifacts
+
+def clean_artifacts():
+    '''
+    This utility method deletes the build artifacts on the shared volume that were last modified more than
+    `ARTIFACT_TTL_HOURS` ago and, while the artifacts take more than `ARTIFACT_MAX_GB`, the oldest others. Artifacts of
+    builds that have not finished yet are kept.
+
+    Args:
+        None (None)
+
+    Returns:
+        Tuple: number of request ids whose artifacts were deleted, and bytes reclaimed
+    '''
+    artifacts = list_artifacts()
+    protected = {get_job_context_name(job) for job in JOB_INDEX.jobs()
+                 if not (job.status and (job.status.succeeded or job.status.failed))}
+    with IN_FLIGHT_LOCK:
+        protected.update(job_id.split(f'{K_JOB_NAME}-')[1] for job_id in IN_FLIGHT_BUILDS.values())
+
+    total = sum(artifact['size'] for artifact in artifacts.values())
+    expired_before = time.time() - ARTIFACT_TTL_HOURS * 60 * 60
+    deleted, reclaimed = 0, 0
+    for uid, artifact in sorted(artifacts.items(), key=lambda item: item[1]['mtime']):
+        over_budget = ARTIFACT_MAX_GB and total - reclaimed > ARTIFACT_MAX_GB * 1024 ** 3
+        if uid in protected or not (artifact['mtime'] < expired_before or over_budget):
+            continue
+        for path in artifact['paths']:
+            if os.path.isdir(path):
+                rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+        deleted += 1
+        reclaimed += artifact['size']
+
+    ARTIFACT_BYTES.set(total - reclaimed)
+    return deleted, reclaimed
+
+def clean_conda_envs():
+    '''
+    This utility method deletes the content-addressed environment directories on the shared volume (see
+    `stage_conda_env`), and the temporary ones left behind, that were last staged more than `ARTIFACT_TTL_HOURS` ago.
+    The directories of jobs that have not finished yet, recorded in their `conda-env-dir` annotation, are kept.
+
+    Args:
+        None (None)
+
+    Returns:
+        Tuple: number of deleted environment directories, and bytes reclaimed
+    '''
+    protected = {(job.metadata.annotations or {}).get('conda-env-dir') or get_job_build_arg(job, 'CONDA_ENV_DIR')
+                 for job in JOB_INDEX.jobs() if not (job.status and (job.status.succeeded or job.status.failed))}
+
+    expired_before = time.time() - ARTIFACT_TTL_HOURS * 60 * 60
+    deleted, reclaimed = 0, 0
+    for env_dir in Path(DATA_DIR).glob('flavours/*/envs/*'):
+        if f'envs/{env_dir.name}' in protected or env_dir.stat().st_mtime >= expired_before:
+            continue
+        reclaimed += sum(path.stat().st_size for path in env_dir.rglob('*') if path.is_file())
+        rmtree(env_dir, ignore_errors=True)
+        deleted += 1
+    return deleted, reclaimed
+
+def clean_jobs():
+    '''
+    This utility method deletes the completed Kaniko jobs, and their pods, and the `/test` jobs that finished more than
+    `JOB_TTL_HOURS` ago. The build index record of a deleted job goes with it, since a cache hit returns the id of the
+    job that pushed the image.
+
+    Args:
+        None (None)
+
+    Returns:
+        int: number of deleted jobs
+    '''
+    expired_before = datetime.now(timezone.utc).timestamp() - JOB_TTL_HOURS * 60 * 60
+    deleted = 0
+    for job in JOB_INDEX.jobs():
+        finished = get_job_times(job, None)['finished']
+        if not (finished and finished.timestamp() < expired_before and (job.metadata.annotations or {}).get('reconciled')):
+            continue
+        try:
+            client.BatchV1Api().delete_namespaced_job(job.metadata.name, ENVIRONMENT, propagation_policy='Background')
+            deleted += 1
+        except ApiException as e:
+            if e.status != 404:
+                logger.error(f'Exception when deleting job {job.metadata.name}: {e}')
+                continue
+        fingerprint = json.loads(job.metadata.annotations.get('completion') or '{}').get('fingerprint')
+        record = read_index_record('build-index', fingerprint) if fingerprint else None
+        if record and record['job_id'] == job.metadata.name:
+            delete_index_record('build-index', fingerprint)
+    return deleted + TEST_JOBS.clean(JOB_TTL_HOURS * 60 * 60)
+
+def clean_index_records():
+    '''
+    This utility method deletes the index records that refer to jobs which no longer exist: build index records of jobs
+    deleted other than by `clean_jobs`, and the job groups of matrix builds created more than `JOB_TTL_HOURS` ago whose
+    jobs are all gone.
+
+    Args:
+        None (None)
+
+    Returns:
+        int: number of deleted records
+    '''
+    job_ids = {job.metadata.name for job in JOB_INDEX.jobs()}
+    deleted = 0
+    for fingerprint, record in list_index_records('build-index').items():
+        if record['job_id'] not in job_ids:
+            delete_index_record('build-index', fingerprint)
+            deleted += 1
+
+    expired_before = time.time() - JOB_TTL_HOURS * 60 * 60
+    for group_id, group in list_index_records('job-groups').items():
+        if group['created'] < expired_before and not job_ids & {entry['job_id'] for entry in group['jobs'].values()}:
+            delete_index_record('job-groups', group_id)
+            deleted += 1
+    return deleted
+
+def clean_secrets():
+    '''
+    This utility method deletes the registry credentials secrets of jobs that do not exist or have been completed, e.g.
+    when the job could not be created. Secrets younger than an hour are kept, since their job may be about to be created.
+
+    Args:
+        None (None)
+
+    Returns:
+        int: number of deleted secrets
+    '''
+    active = {job.metadata.name for job in JOB_INDEX.jobs() if not (job.metadata.annotations or {}).get('reconciled')}
+    expired_before = datetime.now(timezone.utc).timestamp() - 60 * 60
+    deleted = 0
+    for secret in client.CoreV1Api().list_namespaced_secret(ENVIRONMENT, label_selector=JOB_LABEL_SELECTOR).items:
+        job_id = f'{K_JOB_NAME}-{secret.metadata.name[:-len("-creds")]}'
+        if job_id in active or secret.metadata.creation_timestamp.timestamp() >= expired_before:
+            continue
+        try:
+            client.CoreV1Api().delete_namespaced_secret(secret.metadata.name, ENVIRONMENT)
+            deleted += 1
+        except ApiException as e:
+            if e.status != 404:
+                logger.error(f'Exception when deleting secret {secret.metadata.name}: {e}')
+    return deleted
+
+def get_base_images(flavours_dir):
+    '''
+    This utility method returns the base images of the flavour Dockerfiles the kaniko cache is warmed with. The arm64
+    Dockerfiles are skipped since the warmer pulls images for the platform of its node, and so are stages starting from
+    a build argument, like the cached environment stage.
+
+    Args:
+        flavours_dir (str): directory holding a directory per flavour
+
+    Returns:
+        list: sorted base images
+    '''
+    images = set()
+    for dockerfile in Path(flavours_dir).glob('*/Dockerfile*'):
+        if '.arm' in dockerfile.name:
+            continue
+        images.update(image for image in DOCKERFILE_FROM_PATTERN.findall(dockerfile.read_text())
+                      if '$' not in image and image.lower() != 'scratch')
+    return sorted(images)
+
+def warm_kaniko_cache():
+    '''
+    This method warms the kaniko cache with the base images of the flavour Dockerfiles (see `get_base_images`) by
+    starting a job running the kaniko warmer, unless the cache was warmed with the same images less than
+    `KANIKO_CACHE_REWARM_HOURS` ago, so that moving tags like `latest` are picked up, or a warmer is still running. It
+    runs when the service starts, which also covers flavour updates, and with every run of the janitor.
+
+    Args:
+        None (None)
+
+    Returns:
+        bool: whether a warmer job was started
+    '''
+    images = get_base_images('./flavours')
+    record_path = os.path.join(KANIKO_CACHE_DIR, KANIKO_CACHE_RECORD)
+    try:
+        with open(record_path) as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        record = {}
+    if record.get('images') == images and time.time() - record.get('warmed', 0) < KANIKO_CACHE_REWARM_HOURS * 60 * 60:
+        return False
+
+    warmers = client.BatchV1Api().list_namespaced_job(ENVIRONMENT, label_selector=f'{CACHE_WARMER_LABEL_KEY}=true').items
+    if any(job.status.active for job in warmers):
+        return False
+
+    cache_volume, cache_volume_mount = get_kaniko_cache_volume()
+    job_name = f'{K_JOB_NAME}-cache-warmer-{uuid.uuid4().hex[:8]}'
+    job = client.V1Job(
+        api_version='batch/v1',
+        kind='Job',
+        metadata=client.V1ObjectMeta(name=job_name, labels={CACHE_WARMER_LABEL_KEY: 'true'}),
+        spec=client.V1JobSpec(
+            backoff_limit=2,
+            ttl_seconds_after_finished=60 * 60,
+            template=client.V1PodTemplateSpec(
+                metadata=client.V1ObjectMeta(labels={CACHE_WARMER_LABEL_KEY: 'true'}),
+                spec=client.V1PodSpec(
+                    service_account_name=K_SERVICE_ACOUNT_NAME,
+                    restart_policy='Never',
+                    containers=[client.V1Container(
+                        name='warmer',
+                        image=KANIKO_WARMER_IMAGE,
+                        args=[f'--cache-dir={KANIKO_CACHE_DIR}/images'] + [f'--image={image}' for image in images],
+                        volume_mounts=[cache_volume_mount]
+                    )],
+                    volumes=[cache_volume]
+                )
+            )
+        )
+    )
+    client.BatchV1Api().create_namespaced_job(ENVIRONMENT, job)
+
+    tmp_path = f'{record_path}.{uuid.uuid4()}'
+    with open(tmp_path, 'w') as f:
+        json.dump({'images': images, 'warmed': time.time()}, f)
+    os.replace(tmp_path, record_path)
+    logger.info(f'Warming the kaniko cache with {", ".join(images)} in job {job_name}')
+    return True
+
+def clean_kaniko_cache():
+    '''
+    This utility method deletes the base images in the kaniko cache that expired (see `KANIKO_CACHE_TTL_HOURS`), e.g.
+    earlier digests of a `latest` tag, and the least recently used others while the cache takes more than
+    `KANIKO_CACHE_MAX_GB`. The kaniko cache holds each image as a file named by its digest and its manifest.
+
+    Args:
+        None (None)
+
+    Returns:
+        Tuple(int, int): number of deleted images and bytes reclaimed
+    '''
+    entries = {}
+    os.makedirs(f'{KANIKO_CACHE_DIR}/images', exist_ok=True)
+    with os.scandir(f'{KANIKO_CACHE_DIR}/images') as it:
+        for entry in it:
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            stat = entry.stat()
+            sizes = entries.setdefault(entry.name[:-len('.json')] if entry.name.endswith('.json') else entry.name,
+                                       {'paths': [], 'size': 0, 'used': 0})
+            sizes['paths'].append(entry.path)
+            sizes['size'] += stat.st_size
+            sizes['used'] = max(sizes['used'], stat.st_atime, stat.st_mtime)
+
+    expired_before = time.time() - KANIKO_CACHE_TTL_HOURS * 60 * 60
+    total = sum(cached['size'] for cached in entries.values())
+    deleted, reclaimed = 0, 0
+    for cached in sorted(entries.values(), key=lambda cached: cached['used']):
+        if cached['used'] >= expired_before and (not KANIKO_CACHE_MAX_GB or total - reclaimed <= KANIKO_CACHE_MAX_GB * 1024 ** 3):
+            break
+        for path in cached['paths']:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        deleted += 1
+        reclaimed += cached['size']
+
+    KANIKO_CACHE_BYTES.set(total - reclaimed)
+    return deleted, reclaimed
+
+def clean_package_cache():
+    '''
+    This utility method deletes the least recently used conda packages and pip downloads in the package cache of the
+    builds while it takes more than `PACKAGE_CACHE_MAX_GB`. A conda package is its archive and the directory it was
+    extracted to, and a pip download a file of the pip cache. Both package managers download again what is missing.
+
+    Builds hold a shared lock on `packages/.lock` while they install packages (see `install_env.sh` of the flavour), and
+    the cache is only trimmed under the exclusive lock: while a build installs packages, trimming waits for the next run
+    of the janitor, and builds starting to install wait until trimming is done.
+
+    Args:
+        None (None)
+
+    Returns:
+        Tuple(int, int): number of deleted packages and bytes reclaimed
+    '''
+    os.makedirs(f'{KANIKO_CACHE_DIR}/packages', exist_ok=True)
+    with open(f'{KANIKO_CACHE_DIR}/packages/.lock', 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info('Package cache in use by builds, trimming it on the next run')
+            return 0, 0
+        return trim_package_cache()
+
+def trim_package_cache():
+    '''
+    This utility method deletes the least recently used packages for `clean_package_cache`, which holds the lock of the cache.
+
+    Args:
+        None (None)
+
+    Returns:
+        Tuple(int, int): number of deleted packages and bytes reclaimed
+    '''
+    def add(key, path, size, used):
+        cached = entries.setdefault(key, {'paths': [], 'size': 0, 'used': 0})
+        cached['paths'].append(path)
+        cached['size'] += size
+        cached['used'] = max(cached['used'], used)
+
+    entries = {}
+    conda_dir, pip_dir = f'{KANIKO_CACHE_DIR}/packages/conda', f'{KANIKO_CACHE_DIR}/packages/pip'
+    if os.path.isdir(conda_dir):
+        with os.scandir(conda_dir) as it:
+            for entry in it:
+                # the index cache and bookkeeping files of conda are kept
+                if entry.name.startswith('.') or entry.name in ('cache', 'urls', 'urls.txt'):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                if entry.is_dir(follow_symlinks=False):
+                    # walking the directory updates its access time, so only its modification time counts
+                    size = sum(os.path.getsize(os.path.join(root, filename)) for root, _, filenames in os.walk(entry.path)
+                               for filename in filenames if not os.path.islink(os.path.join(root, filename)))
+                    add(('conda', entry.name), entry.path, size, stat.st_mtime)
+                else:
+                    add(('conda', re.sub(r'\.(conda|tar\.bz2)$', '', entry.name)), entry.path, stat.st_size,
+                        max(stat.st_atime, stat.st_mtime))
+    for root, _, filenames in os.walk(pip_dir):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            stat = os.stat(path, follow_symlinks=False)
+            add(('pip', path), path, stat.st_size, max(stat.st_atime, stat.st_mtime))
+
+    total = sum(cached['size'] for cached in entries.values())
+    deleted, reclaimed = 0, 0
+    for cached in sorted(entries.values(), key=lambda cached: cached['used']):
+        if not PACKAGE_CACHE_MAX_GB or total - reclaimed <= PACKAGE_CACHE_MAX_GB * 1024 ** 3:
+            break
+        for path in cached['paths']:
+            if os.path.isdir(path) and not os.path.islink(path):
+                rmtree(path, ignore_errors=True)
+            else:
+                Path(path).unlink(missing_ok=True)
+        deleted += 1
+        reclaimed += cached['size']
+
+    PACKAGE_CACHE_BYTES.set(total - reclaimed)
+    return deleted, reclaimed
+
+def run_janitor():
+    '''
+    This method runs for the lifetime of the service in a single background thread and every `JANITOR_INTERVAL_MINUTES`
+    deletes expired build artifacts and environment directories on the shared volume (see `clean_artifacts` and
+    `clean_conda_envs`), finished jobs (see `clean_jobs`), index records of jobs that are gone (see
+    `clean_index_records`), stale credentials secrets (see `clean_secrets`) and base images beyond the kaniko cache's limits (see
+    `clean_kaniko_cache`) and packages beyond the package cache's limit (see `clean_package_cache`), and warms the kaniko
+    cache again when due. What it reclaimed is logged and counted in the metrics served by `/metrics`.
+
+    Args:
+        None (None)
+
+    Returns:
+        None
+    '''
+    while True:
+        time.sleep(JANITOR_INTERVAL_MINUTES * 60)
+        if not JOB_INDEX.synced:
+            continue
+        try:
+            artifacts, reclaimed = clean_artifacts() if PV_MODE else (0, 0)
+            envs, envs_reclaimed = clean_conda_envs() if PV_MODE else (0, 0)
+            jobs = clean_jobs()
+            records = clean_index_records()
+            secrets_deleted = clean_secrets()
+            images, cache_reclaimed = clean_kaniko_cache() if KANIKO_CACHE_CLAIM_NAME else (0, 0)
+            packages, packages_reclaimed = clean_package_cache() if KANIKO_CACHE_CLAIM_NAME else (0, 0)
+            if KANIKO_CACHE_CLAIM_NAME:
+                warm_kaniko_cache()
+        except Exception as e:
+            logger.error(f'Exception when collecting garbage: {e}')
+            continue
+
+        JANITOR_DELETED.labels('artifacts').inc(artifacts)
+        JANITOR_DELETED.labels('conda_envs').inc(envs)
+        JANITOR_DELETED.labels('jobs').inc(jobs)
+        JANITOR_DELETED.labels('index_records').inc(records)
+        JANITOR_DELETED.labels('secrets').inc(secrets_deleted)
+        JANITOR_DELETED.labels('kaniko_cache').inc(images)
+        JANITOR_DELETED.labels('package_cache').inc(packages)
+        JANITOR_RECLAIMED_BYTES.inc(reclaimed + envs_reclaimed + cache_reclaimed + packages_reclaimed)
+        logger.info(f'Janitor deleted the artifacts of {artifacts} requests ({reclaimed / 1024 ** 3:.2f} GiB), '
+                    f'{envs} environment directories ({envs_reclaimed / 1024 ** 3:.2f} GiB), {jobs} jobs, '
+                    f'{records} index records, {secrets_deleted} secrets, {images} cached base images '
+                    f'({cache_reclaimed / 1024 ** 3:.2f} GiB) and {packages} cached packages '
+                    f'({packages_reclaimed / 1024 ** 3:.2f} GiB)')
+
+def limit_concurrency(slots, handler):
+    '''
+    This utility method runs a request handler only if one of the `slots` is free and answers `503 Service Unavailable`
+    right away otherwise, so that long uploads and streams never take all server threads from short requests such as
+    status reads. The slot is held until the response, including a streamed one, has been sent.
+
+    Args:
+        slots (threading.BoundedSemaphore): slots of this kind of request
+        handler (function): request handler to run
+
+    Returns:
+        Response: response of the handler
+    '''
+    if not slots.acquire(blocking=False):
+        return Response(f"503 Service Unavailable: Too many concurrent requests of this kind, please retry",503,
+                        headers={'Retry-After': '5'})
+    try:
+        response = current_app.make_response(handler())
+    except Exception:
+        slots.release()
+        raise
+    response.call_on_close(slots.release)
+    return response
+
+def start_background_threads():
+    '''
+    This method starts the threads that run for the lifetime of the service: one completes all build jobs and keeps the
+    job index in sync, another one tracks their pods, the janitor collects garbage and, if enabled, another one keeps the
+    warm pool of builders replenished and a last one warms the kaniko cache.
+
+    Args:
+        None (None)
+
+    Returns:
+        None
+    '''
+    threading.Thread(target=reconcile_jobs, daemon=True).start()
+    threading.Thread(target=watch_build_pods, daemon=True).start()
+    threading.Thread(target=run_janitor, daemon=True).start()
+    if WARM_POOL:
+        threading.Thread(target=WARM_POOL.run, daemon=True).start()
+    if KANIKO_CACHE_CLAIM_NAME:
+        threading.Thread(target=warm_kaniko_cache, daemon=True).start()
+
+def serve(flask_app, port):
+    '''
+    This method serves the service with gunicorn's threaded worker. There is exactly one worker process because the job
+    index, the build queue and the background threads live in memory; it handles up to `SERVER_THREADS` requests at once.
+    Everything done before calling this method, like copying the flavour files and reading secrets, runs once in the
+    gunicorn master, and the background threads are started in the worker after it was forked.
+
+    Args:
+        flask_app (Flask): service application returned by `create_app`
+        port (int): port to listen on
+
+    Returns:
+        None
+    '''
+    from gunicorn.app.base import BaseApplication
+
+    class ChassisServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'0.0.0.0:{port}')
+            self.cfg.set('workers', 1)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', SERVER_THREADS)
+            # multi-GB uploads and builds streaming logs or events must not be killed by the worker timeout
+            self.cfg.set('timeout', 0)
+            self.cfg.set('post_worker_init', lambda worker: start_background_threads())
+
+        def load(self):
+            return flask_app
+
+    ChassisServer().run()
 
 def create_app():
     flask_app = Flask(__name__)
@@ -913,25 +4942,33 @@ def create_app():
     def version():
         return CHASSIS_VERSION
 
+    @flask_app.route('/metrics')
+    def metrics():
+        return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
     @flask_app.route('/build', methods=['POST'])
     def build_image_api():
-        return build_image()
+        return limit_concurrency(UPLOAD_SLOTS, build_image)
 
     @flask_app.route('/job/<job_id>', methods=['GET'])
     def get_job_status_api(job_id):
         return get_job_status(job_id)
 
+    @flask_app.route('/job/<job_id>/events', methods=['GET'])
+    def get_job_events_api(job_id):
+        return limit_concurrency(STREAM_SLOTS, lambda: get_job_events(job_id))
+
     @flask_app.route('/job/<job_id>/download-tar')
     def download_job_tar_api(job_id):
-        return download_tar(job_id)
+        return limit_concurrency(STREAM_SLOTS, lambda: download_tar(job_id))
 
     @flask_app.route('/test', methods=['POST'])
     def test_model_api():
-        return test_model()
+        return limit_concurrency(UPLOAD_SLOTS, test_model)
 
     @flask_app.route('/job/<job_id>/logs', methods=['GET'])
     def get_job_logs_api(job_id):
-        return get_job_logs(job_id)
+        return limit_concurrency(STREAM_SLOTS, lambda: get_job_logs(job_id))
 
     return flask_app
 
@@ -994,6 +5031,80 @@ if __name__ == '__main__':
     MODE = os.getenv('MODE')
     PV_MODE = True if (MODE == "pv" or not MODE) else False
 
+    # Optional repository caching the conda environment stage of the flavour Dockerfiles, keyed by the model's conda.yaml
+    ENV_CACHE_REPO = os.getenv('ENV_CACHE_REPOSITORY')
+    ENV_CACHE_TTL_DAYS = float(os.getenv('ENV_CACHE_TTL_DAYS', 14))
+    ENV_CACHE_MAX_ENTRIES = int(os.getenv('ENV_CACHE_MAX_ENTRIES', 50))
+
+    # gzip level of the build context uploaded in 's3'/'gs' mode, 0 turns compression off
+    CONTEXT_COMPRESSION_LEVEL = int(os.getenv('CONTEXT_COMPRESSION_LEVEL', 6))
+
+    # zstd/gzip level of image tar downloads requested compressed
+    TAR_COMPRESSION_LEVEL = int(os.getenv('TAR_COMPRESSION_LEVEL', 1))
+
+    # Maximum number of kaniko jobs running at once, further builds are queued. 0 (default) turns the queue off
+    MAX_CONCURRENT_BUILDS = int(os.getenv('MAX_CONCURRENT_BUILDS', 0))
+    BUILD_QUEUE_LOCK = threading.Lock()
+
+    # Builds claimed by `claim_build` whose jobs are being created, by build key
+    IN_FLIGHT_BUILDS = {}
+    IN_FLIGHT_LOCK = threading.Lock()
+
+    # Pinned kaniko executor image of the builds, the builders of the warm pool run its `-debug` variant
+    KANIKO_IMAGE = os.getenv('KANIKO_IMAGE', 'gcr.io/kaniko-project/executor:v1.9.1')
+
+    # Optional pool of idle builder pods that CPU builds are handed to (PV mode only). 0 turns the pool off
+    WARM_POOL_SIZE = int(os.getenv('WARM_POOL_SIZE', 0))
+    WARM_POOL = WarmPool(WARM_POOL_SIZE, os.getenv('WARM_POOL_IMAGE', f'{KANIKO_IMAGE}-debug'),
+                         {'memory': f'{int(float(os.getenv("WARM_POOL_MEMORY_GB", 8)) * 1024)}Mi',
+                          'cpu': os.getenv('WARM_POOL_CPU', '2')},
+                         f'{MOUNT_PATH_DIR}/builder-pool') if (WARM_POOL_SIZE and PV_MODE) else None
+
+    # Optional persistent cache of the base images of the builds, mounted in every kaniko pod and warmed by
+    # `warm_kaniko_cache`. 0 turns the size limit off
+    KANIKO_CACHE_CLAIM_NAME = os.getenv('KANIKO_CACHE_CLAIM_NAME')
+    KANIKO_CACHE_DIR = os.getenv('KANIKO_CACHE_DIR', '/kaniko-cache')
+    KANIKO_CACHE_MAX_GB = float(os.getenv('KANIKO_CACHE_MAX_GB', 0))
+    KANIKO_CACHE_REWARM_HOURS = float(os.getenv('KANIKO_CACHE_REWARM_HOURS', 24))
+    KANIKO_WARMER_IMAGE = os.getenv('KANIKO_WARMER_IMAGE', KANIKO_IMAGE.replace('/executor:', '/warmer:'))
+
+    # Disk budget of the conda packages and pip downloads cached on the same volume. 0 turns the limit off
+    PACKAGE_CACHE_MAX_GB = float(os.getenv('PACKAGE_CACHE_MAX_GB', 0))
+
+    # Whether images are built on the slim runtime stage of the flavour unless `/build` requests otherwise
+    SLIM_IMAGES = os.getenv('SLIM_IMAGES', 'false').lower() == 'true'
+
+    # Optional repository in the registry caching the RUN layers of the builds, e.g. the apt-get layer they all share
+    LAYER_CACHE_REPO = os.getenv('LAYER_CACHE_REPOSITORY')
+
+    # Memory bounds of the kaniko builds sized by `get_build_resources`
+    BUILD_MIN_MEMORY_GB = float(os.getenv('BUILD_MIN_MEMORY_GB', 4))
+    BUILD_MAX_MEMORY_GB = float(os.getenv('BUILD_MAX_MEMORY_GB', 16))
+
+    # Retention of build artifacts on the shared volume and of finished jobs, enforced by `run_janitor`.
+    # 0 turns the size limit off
+    JANITOR_INTERVAL_MINUTES = float(os.getenv('JANITOR_INTERVAL_MINUTES', 30))
+    ARTIFACT_TTL_HOURS = float(os.getenv('ARTIFACT_TTL_HOURS', 72))
+    ARTIFACT_MAX_GB = float(os.getenv('ARTIFACT_MAX_GB', 0))
+    JOB_TTL_HOURS = float(os.getenv('JOB_TTL_HOURS', 72))
+
+    # Whether builds install their environment from its lock, which is resolved in the background when there is none
+    LOCK_BUILD_ENVS = os.getenv('LOCK_BUILD_ENVS', 'false').lower() == 'true'
+    LOCK_RESOLVER = ThreadPoolExecutor(1, thread_name_prefix='lock')
+    RESOLVING_LOCKS = set()
+    RESOLVING_LOCKS_LOCK = threading.Lock()
+
+    # Conda environments of `/test` kept between requests, outside of the build context in DATA_DIR
+    TEST_ENV_CACHE = CondaEnvCache(os.getenv('TEST_ENV_DIR', os.path.join(HOME_DIR, '.chassis_test_envs')),
+                                   float(os.getenv('TEST_ENV_CACHE_GB', 20)) * 1024 ** 3)
+
+    # `/test` jobs run at once, further ones are queued
+    TEST_JOBS = TestJobs(int(os.getenv('TEST_WORKERS', 2)))
+
+    # Optional destinations of the build traces exported by `export_spans`: an OTLP/HTTP traces endpoint and/or a file
+    TRACE_COLLECTOR_URL = os.getenv('TRACE_COLLECTOR_URL')
+    TRACE_FILE = os.getenv('TRACE_FILE')
+
     if not PV_MODE:
         if not CONTEXT_BUCKET:
             raise ValueError("Context bucket must be specified if not using 'pv' mode.")
@@ -1027,11 +5138,23 @@ if __name__ == '__main__':
 
     port = int(os.environ.get('PORT', 5000))
 
+    # Requests handled at once, of which at most MAX_CONCURRENT_UPLOADS are /build or /test uploads and at most
+    # MAX_CONCURRENT_STREAMS stream logs, events or image tars, so that the rest always serve status reads
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', 64))
+    UPLOAD_SLOTS = threading.BoundedSemaphore(int(os.getenv('MAX_CONCURRENT_UPLOADS', 8)))
+    STREAM_SLOTS = threading.BoundedSemaphore(int(os.getenv('MAX_CONCURRENT_STREAMS', 32)))
+
     if PV_MODE:
         copy_required_files_for_kaniko()
 
     if CHASSIS_DEV:
         create_dev_environment()
 
+    JOB_INDEX = JobIndex()
+
     app = create_app()
-    app.run(debug=False, host='0.0.0.0', port=port)
+    if CHASSIS_DEV:
+        start_background_threads()
+        app.run(debug=False, host='0.0.0.0', port=port, threaded=True)
+    else:
+        serve(app, port)
@@ -0,0 +1,68 @@
+#!/bin/bash
+
+# Installs the model's conda environment (`install_env.sh conda`) or pip requirements into it
+# (`install_env.sh pip requirements.txt`), or relocates it to /venv for the slim runtime stage (`install_env.sh pack`).
+# When the service mounted its package cache at $PACKAGE_CACHE_DIR, conda
+# packages and pip downloads are read from and added to it, and the packages found there are reported on a
+# `chassis-package-cache` line the service reads from the build log.
+
+set -eo pipefail
+
+# The service only trims the cache while no build holds its lock, which is held until the script exits. Builds that
+# cannot hold it install without the cache rather than read packages that may be trimmed meanwhile
+if [ -n "$PACKAGE_CACHE_DIR" ] && [ -d "$PACKAGE_CACHE_DIR" ] && command -v flock >/dev/null \
+        && exec 9>>$PACKAGE_CACHE_DIR/.lock && flock -s 9; then
+    export CONDA_PKGS_DIRS=$PACKAGE_CACHE_DIR/conda PIP_CACHE_DIR=$PACKAGE_CACHE_DIR/pip
+    mkdir -p $CONDA_PKGS_DIRS $PIP_CACHE_DIR
+    cached=true
+else
+    exec 9>&-
+    # conda keeps its packages in the build's own pkgs directory then
+    unset CONDA_PKGS_DIRS PIP_CACHE_DIR
+    export PIP_NO_CACHE_DIR=1
+fi
+
+log=$(mktemp)
+
+# pip prints every download it reads from its cache as "Using cached", and every other one as "Downloading"
+pip_stats() {
+    echo "{\"hits\": $(grep -cE '^\s*Using cached ' $log || true), \"misses\": $(grep -cE '^\s*Downloading [^ ]+\.(whl|tar\.gz|zip)' $log || true)}"
+}
+
+case $1 in
+    conda)
+        before=$(ls ${CONDA_PKGS_DIRS:-/dev/null} 2>/dev/null | sort || true)
+        if [ -f ./env/conda.lock ]; then
+            # Install the pinned lock without solving; pip.lock is only pinned for locks exported from /test environments
+            conda create --name $CONDA_ENV --file ./env/conda.lock 2>&1 | tee $log
+            if [ -s ./env/pip.lock ]; then
+                source activate $CONDA_ENV
+                pip install -r ./env/pip.lock 2>&1 | tee -a $log
+            fi
+        else
+            conda env create --name $CONDA_ENV --file ./env/conda.yaml 2>&1 | tee $log
+        fi
+        if [ "$cached" = true ]; then
+            packages=$(conda list --name $CONDA_ENV --explicit | grep -E '^(https?|file)://' | sed 's/#.*//; s#.*/##' | sort)
+            total=$(echo -n "$packages" | grep -c . || true)
+            hits=$(comm -12 <(echo "$packages") <(echo "$before") | grep -c . || true)
+            echo "chassis-package-cache {\"conda\": {\"hits\": $hits, \"misses\": $((total - hits))}, \"pip\": $(pip_stats)}"
+        fi
+        ;;
+    pip)
+        source activate $CONDA_ENV
+        pip install -r $2 2>&1 | tee $log
+        if [ "$cached" = true ]; then
+            echo "chassis-package-cache {\"pip\": $(pip_stats)}"
+        fi
+        ;;
+    pack)
+        pip install conda-pack 2>&1 | tee $log
+        # pip may have replaced files of conda packages, which conda-pack reports as missing
+        conda-pack --name $CONDA_ENV --output /tmp/env.tar --ignore-missing-files
+        mkdir /venv && tar -xf /tmp/env.tar -C /venv && rm /tmp/env.tar
+        /venv/bin/conda-unpack
+        ;;
+esac
+
+rm -f $log
@@ -295,6 +295,12 @@ if __name__ == "__main__":
             TEST_RESULTS.append(out)
             out = test_block_until_complete(client, logger, job)
             TEST_RESULTS.append(out)
+            out = test_block_until_complete_events(client, logger, job)
+            TEST_RESULTS.append(out)
+            out = test_publish_deduplicated(client, logger, model, docker_creds)
+            TEST_RESULTS.append(out)
+            out = test_publish_slim(client, logger, model, docker_creds)
+            TEST_RESULTS.append(out)
             # publish with manual env config
             out, job = test_publish_manual_env_config(client, logger, model, docker_creds)
             TEST_RESULTS.append(out)
@@ -325,6 +331,8 @@ if __name__ == "__main__":
             TEST_RESULTS.append(out)
             out = test_env_test_manual_env_config(client, logger, model)
             TEST_RESULTS.append(out)
+            out = test_env_test_no_wait(client, logger, model)
+            TEST_RESULTS.append(out)
             out = test_save(client, logger, model, UTILS_PATH)               
             TEST_RESULTS.append(out)
             out = test_save_manual_env_config(client, logger, model, UTILS_PATH)               
@@ -2,6 +2,7 @@ import os
 import mlflow
 import time
 import shutil
+import threading
 import docker
 import sys
 sys.path.append('./chassisml_sdk/')
@@ -196,6 +197,37 @@ def test_env_test_manual_env_config(client, logger, model, test_name="test_env_t
         output = 0    
 
     return output 
+
+def test_env_test_no_wait(client, logger, model, test_name="test_env_test_no_wait"):
+    '''
+    Tests starting a test job without waiting for it and retrieving its result from the job status
+    '''
+    print("\n")
+    logger.info("------- Test Env with Chassis Model object without waiting for the test job -------")
+    logger.info("Creating {} model".format(model["model_name"]))
+    chassis_model = client.create_model(process_fn=model["process_fn"])
+    try:
+        res = chassis_model.test_env(model["test_file"], wait_for_completion=False)
+        logger.info(res)
+        final_status = client.block_until_complete(res["job_id"], timeout=1800, stream_events=True)
+        local_test = final_status["result"]
+        logger.info(local_test)
+        result = local_test
+        if list(local_test.keys())[0] in ["model_error", "env_error"]:
+            logger.info(" ******** FAILED - test:{}, model:{}".format(test_name, model["model_name"]))
+            logger.error(local_test[list(local_test.keys())[0]])
+        else:
+            logger.info(" ******** PASSED - test:{}, model:{}".format(test_name, model["model_name"]))
+    except Exception as e:
+        result = {"error": e}
+        logger.error("Error with {} model: {}".format(model["model_name"], e))
+
+    # determine number of errors produced
+    output = 1
+    if list(result.keys())[0] in ["error", "model_error", "env_error"]:
+        output = 0
+
+    return output
     
 
 # save model locally tests
@@ -500,6 +532,73 @@ def test_publish(client, logger, model, credentials, test_name="test_publish"):
 
     return output, result  
 
+def test_publish_deduplicated(client, logger, model, credentials, test_name="test_publish_deduplicated"):
+    print("\n")
+    logger.info("------- Publish Deduplicated Model Test -------")
+    logger.info("Publishing {} model twice at the same time".format(model["model_name"]))
+    chassis_model = client.create_model(process_fn=model["process_fn"])
+    responses = []
+    def publish():
+        responses.append(chassis_model.publish(
+            model_name=model["model_name"],
+            model_version=model["model_version"],
+            registry_user=credentials["user"],
+            registry_pass=credentials["pass"]
+        ))
+    try:
+        threads = [threading.Thread(target=publish) for _ in range(2)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+        logger.info(responses)
+        # the second build either attaches to the first or reuses its pushed image
+        if len(responses) == 2 and not any(response["error"] for response in responses) and \
+                (responses[0]["job_id"] == responses[1]["job_id"] or any(response.get("cached") for response in responses)):
+            logger.info(" ******** PASSED - test:{}, model:{}".format(test_name, model["model_name"]))
+            result = 1
+        else:
+            logger.info(" ******** FAILED - test:{}, model:{}".format(test_name, model["model_name"]))
+            logger.error(responses)
+            result = 0
+    except Exception as e:
+        logger.error("Error with {} model: {}".format(model["model_name"], e))
+        result = 0
+
+    return result
+
+def test_publish_slim(client, logger, model, credentials, test_name="test_publish_slim"):
+    print("\n")
+    logger.info("------- Publish Slim Model Test -------")
+    logger.info("Creating {} model".format(model["model_name"]))
+    chassis_model = client.create_model(process_fn=model["process_fn"])
+    try:
+        response = chassis_model.publish(
+            model_name=model["model_name"],
+            model_version="{}-slim".format(model["model_version"]),
+            registry_user=credentials["user"],
+            registry_pass=credentials["pass"],
+            slim=True
+        )
+        logger.info(response)
+        status = client.block_until_complete(response["job_id"])
+        # the result is added once the service completed the job
+        for _ in range(30):
+            status = client.get_job_status(response["job_id"])
+            if (status.get("result") or {}).get("image_size"):
+                break
+            time.sleep(1)
+        if status["status"]["failed"] is None and (status.get("result") or {}).get("image_size"):
+            logger.info(" ******** PASSED - test:{}, model:{}, image size:{}".format(test_name, model["model_name"], status["result"]["image_size"]))
+            result = 1
+        else:
+            logger.info(" ******** FAILED - test:{}, model:{}".format(test_name, model["model_name"]))
+            logger.error(status)
+            result = 0
+    except Exception as e:
+        logger.error("Error with {} model: {}".format(model["model_name"], e))
+        result = 0
+
+    return result
+
 def test_publish_manual_env_config(client, logger, model, credentials, test_name="test_publish_manual_env_config"):
     print("\n")
     logger.info("------- Publish Model Test Manual Env Config -------")
@@ -681,6 +780,27 @@ def test_block_until_complete(client, logger, job, test_name="test_block_until_c
 
     return result    
     
+def test_block_until_complete_events(client, logger, job, test_name="test_block_until_complete_events"):
+    print("\n")
+    try:
+        logger.info("------- Block Until Complete (Event Stream) Test -------")
+        logger.info("Waiting on events of job {} for model {}".format(job["job_id"], job["model"]))
+        phases = [event["phase"] for event in client.get_job_events(job["job_id"])]
+        status = client.block_until_complete(job["job_id"], stream_events=True)
+        if phases[-1] == "succeeded" and status["status"]["failed"] is None and status["status"]["conditions"][0]["type"] == "Complete":
+            logger.info(" ******** PASSED - test:{}, model:{}".format(test_name, job["model"]))
+            result = 1
+        else:
+            logger.info(" ******** FAILED - test:{}, model:{}".format(test_name, job["model"]))
+            logger.error(phases)
+            logger.error(status)
+            result = 0
+    except Exception as e:
+        logger.error("Error with {} model: {}".format(job["model"], e))
+        result = 0
+
+    return result
+
 def test_download_tar(client, logger, job, out_path, test_name="test_download_tar"):
     print("\n")
     logger.info("------- Download Tar File Test -------")  
@@ -0,0 +1,122 @@
+import io
+import os
+import sys
+import zipfile
+import importlib.util
+
+import flask
+import pytest
+
+def load(name, *path):
+    # modules are loaded once per session, since the service registers its metrics when it is loaded
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(os.path.dirname(__file__), '..', *path))
+        sys.modules[name] = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(sys.modules[name])
+    return sys.modules[name]
+
+# the service is a script rather than a package, so it is loaded from its file
+app = load('chassis_service', 'service', 'app.py')
+
+FILES = {
+    'MLmodel': b'flavors:\n  python_function: {}\n',
+    'data/model.pkl': os.urandom(200 * 1024),
+    'conda.yaml': b'dependencies:\n- python=3.9\n' * 1000,
+}
+
+class Unseekable(io.RawIOBase):
+    '''Output that cannot seek back, so that zipfile follows every entry with a data descriptor.'''
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+def make_zip(compression=zipfile.ZIP_DEFLATED, files=FILES, force_zip64=False, seekable=True):
+    output = io.BytesIO() if seekable else Unseekable()
+    with zipfile.ZipFile(output, 'w', compression=compression) as zf:
+        for name, data in files.items():
+            with zf.open(name, 'w', force_zip64=force_zip64) as f:
+                f.write(data)
+    return (output if seekable else output.buffer).getvalue()
+
+def extract(data, dst, chunk_size=7):
+    extractor = app.StreamingZipExtractor(str(dst))
+    for offset in range(0, len(data), chunk_size):
+        extractor.write(data[offset:offset + chunk_size])
+    extractor.close()
+    return extractor
+
+def read_tree(dst):
+    return {os.path.relpath(os.path.join(root, filename), dst).replace(os.path.sep, '/'): open(os.path.join(root, filename), 'rb').read()
+            for root, _, filenames in os.walk(dst) for filename in filenames}
+
+@pytest.mark.parametrize('compression', [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_extracts_stored_and_deflated_entries(tmp_path, compression):
+    data = make_zip(compression)
+    extractor = extract(data, tmp_path)
+    assert read_tree(tmp_path) == FILES
+    assert sorted(extractor.filenames) == sorted(FILES)
+    assert extractor.size == len(data)
+
+def test_extracts_entries_with_data_descriptors(tmp_path):
+    data = make_zip(seekable=False)
+    assert all(info.flag_bits & 0x8 for info in zipfile.ZipFile(io.BytesIO(data)).infolist())
+    extract(data, tmp_path)
+    assert read_tree(tmp_path) == FILES
+
+@pytest.mark.parametrize('seekable', [True, False])
+def test_extracts_zip64_entries(tmp_path, seekable):
+    data = make_zip(force_zip64=True, seekable=seekable)
+    extract(data, tmp_path, chunk_size=64 * 1024)
+    assert read_tree(tmp_path) == FILES
+
+def test_keeps_entries_inside_the_destination(tmp_path):
+    data = make_zip(files={'../../evil.txt': b'evil', '/etc/passwd': b'root', 'model/../ok.txt': b'ok'})
+    extract(data, tmp_path / 'model')
+    assert read_tree(tmp_path) == {'model/evil.txt': b'evil', 'model/etc/passwd': b'root', 'model/model/ok.txt': b'ok'}
+
+def test_rejects_a_corrupted_entry(tmp_path):
+    data = bytearray(make_zip(zipfile.ZIP_STORED))
+    data[data.index(FILES['data/model.pkl'][:64]) + 10] ^= 0xFF
+    with pytest.raises(zipfile.BadZipFile, match='Bad CRC-32'):
+        extract(bytes(data), tmp_path)
+
+@pytest.mark.parametrize('seekable', [True, False])
+def test_rejects_an_archive_truncated_within_an_entry(tmp_path, seekable):
+    data = make_zip(seekable=seekable)
+    with pytest.raises(zipfile.BadZipFile, match='Truncated'):
+        extract(data[:len(data) // 2], tmp_path)
+
+def test_rejects_an_archive_truncated_before_its_central_directory(tmp_path):
+    data = make_zip()
+    central_directory = zipfile.ZipFile(io.BytesIO(data)).start_dir
+    with pytest.raises(zipfile.BadZipFile, match='Truncated'):
+        extract(data[:central_directory], tmp_path)
+
+def test_rejects_what_is_not_a_zip_archive(tmp_path):
+    with pytest.raises(zipfile.BadZipFile):
+        extract(b'not a zip archive', tmp_path)
+    with pytest.raises(zipfile.BadZipFile, match='empty'):
+        extract(b'', tmp_path)
+
+def multipart_body(boundary, data):
+    return (f'--{boundary}\r\nContent-Disposition: form-data; name="model"; filename="model.zip"\r\n'
+            f'Content-Type: application/zip\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+
+def test_ingests_a_complete_upload(tmp_path):
+    body = multipart_body('chassis', make_zip())
+    with flask.Flask(__name__).test_request_context(method='POST', data=body, content_type='multipart/form-data; boundary=chassis'):
+        parts = app.ingest_upload(str(tmp_path))
+    assert sorted(parts['model'].filenames) == sorted(FILES)
+    assert read_tree(tmp_path) == FILES
+
+def test_rejects_an_upload_truncated_before_its_closing_boundary(tmp_path):
+    body = multipart_body('chassis', make_zip())
+    with flask.Flask(__name__).test_request_context(method='POST', data=body[:-len('--chassis--\r\n')],
+                                                    content_type='multipart/form-data; boundary=chassis'):
+        with pytest.raises(ValueError):
+            app.ingest_upload(str(tmp_path))
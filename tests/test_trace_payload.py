@@ -0,0 +1,52 @@
+import os
+import sys
+import importlib.util
+
+import pytest
+
+def load(name, *path):
+    # modules are loaded once per session, since the service registers its metrics when it is loaded
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(os.path.dirname(__file__), '..', *path))
+        sys.modules[name] = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(sys.modules[name])
+    return sys.modules[name]
+
+# the service is a script rather than a package, and the SDK package imports mlflow and the gRPC client when it is
+# imported, so both are loaded from their files
+app = load('chassis_service', 'service', 'app.py')
+app.CHASSIS_VERSION = 'test'
+Trace = load('chassisml_trace', 'chassisml_sdk', 'chassisml', '_trace.py').Trace
+
+def shape(value):
+    '''Keys and value types of an OTLP/JSON payload, with lists reduced to the shape of their first item.'''
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [shape(value[0])] if value else []
+    return type(value).__name__
+
+def sdk_payload():
+    trace = Trace('publish', 'test')
+    with trace.span('upload'):
+        traceparent = trace.traceparent()
+    trace.finish()
+    return trace.payload(), traceparent
+
+def test_sdk_and_service_export_the_same_shape():
+    payload, _ = sdk_payload()
+    span = app.new_span('build_image', None, end=app.time.time_ns())
+    assert shape(payload) == shape(app.get_trace_payload(payload['resourceSpans'][0]['scopeSpans'][0]['spans'][0]['traceId'], [span]))
+
+def test_service_continues_the_sdk_trace():
+    payload, traceparent = sdk_payload()
+    spans = payload['resourceSpans'][0]['scopeSpans'][0]['spans']
+    trace = app.Trace(traceparent)
+    assert trace.trace_id == spans[0]['traceId']
+    assert trace.context()['span_id'] != spans[1]['spanId']
+    assert trace._spans[0]['parent_id'] == spans[1]['spanId']
+
+def test_a_failed_export_only_warns(tmp_path):
+    trace = Trace('publish', 'test')
+    with pytest.warns(UserWarning, match=trace.trace_id):
+        trace.finish(trace_file=str(tmp_path / 'missing' / 'trace.jsonl'))